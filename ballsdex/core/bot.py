@@ -1,11 +1,9 @@
 from __future__ import annotations
 
 import asyncio
-import inspect
 import logging
 import math
 import time
-import types
 from datetime import datetime
 from typing import TYPE_CHECKING, cast
 
@@ -13,19 +11,18 @@ import aiohttp
 import discord
 import discord.gateway
 from aiohttp import ClientTimeout
-from cachetools import TTLCache
 from discord import app_commands
 from discord.app_commands.translator import TranslationContextTypes, locale_str
 from discord.enums import Locale
 from discord.ext import commands
-from prometheus_client import Histogram
 from rich import box, print
 from rich.console import Console
 from rich.table import Table
 
+from ballsdex.core.cache_listener import CacheListener
 from ballsdex.core.commands import Core
 from ballsdex.core.dev import Dev
-from ballsdex.core.metrics import PrometheusServer
+from ballsdex.core.metrics import PrometheusServer, http_trace_config, instrument_http
 from ballsdex.core.models import (
     Ball,
     BlacklistedGuild,
@@ -38,13 +35,16 @@ from ballsdex.core.models import (
     regimes,
     specials,
 )
+from ballsdex.core.utils.catalog_index import CATALOG_INDEXES
+from ballsdex.core.utils.locks import ball_locks
+from ballsdex.core.utils.queries import instrument_queries, track_interaction
+from ballsdex.core.utils.users import UserResolver
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
     from discord.ext.commands.bot import PrefixType
 
 log = logging.getLogger("ballsdex.core.bot")
-http_counter = Histogram("discord_http_requests", "HTTP requests", ["key", "code"])
 
 PACKAGES = ["config", "players", "countryballs", "info", "admin", "trade", "balls", "owner"]
 
@@ -62,51 +62,21 @@ class Translator(app_commands.Translator):
         )
 
 
-# observing the duration and status code of HTTP requests through aiohttp TraceConfig
-async def on_request_start(
-    session: aiohttp.ClientSession,
-    trace_ctx: types.SimpleNamespace,
-    params: aiohttp.TraceRequestStartParams,
-):
-    # register t1 before sending request
-    trace_ctx.start = session.loop.time()
-
-
-async def on_request_end(
-    session: aiohttp.ClientSession,
-    trace_ctx: types.SimpleNamespace,
-    params: aiohttp.TraceRequestEndParams,
-):
-    time = session.loop.time() - trace_ctx.start
-
-    # to categorize HTTP calls per path, we need to access the corresponding discord.http.Route
-    # object, which is not available in the context of an aiohttp TraceConfig, therefore it's
-    # obtained by accessing the locals() from the calling function HTTPConfig.request
-    # "params.url.path" is not usable as it contains raw IDs and tokens, breaking categories
-    frame = inspect.currentframe()
-    _locals = frame.f_back.f_back.f_back.f_back.f_back.f_locals  # type: ignore
-    if route := _locals.get("route"):
-        route_key = route.key
-    else:
-        # calling function is HTTPConfig.static_login which has no Route object
-        route_key = f"{params.response.method} {params.url.path}"
-
-    http_counter.labels(route_key, params.response.status).observe(time)
-
-
 class CommandTree(app_commands.CommandTree):
     async def interaction_check(self, interaction: discord.Interaction[BallsDexBot], /) -> bool:
         # checking if the moment we receive this interaction isn't too late already
         # there is a 3 seconds limit for initial response, taking a little margin into account
         # https://discord.com/developers/docs/interactions/receiving-and-responding#responding-to-an-interaction
         delta = datetime.now(tz=interaction.created_at.tzinfo) - interaction.created_at
+        bot = interaction.client
         if delta.total_seconds() >= 2.8:
             log.warning(
                 f"Skipping interaction {interaction.id}, running {delta.total_seconds()}s late."
             )
+            if bot.prometheus_server:
+                bot.prometheus_server.deadline_missed(interaction, "skipped")
             return False
 
-        bot = interaction.client
         if not bot.is_ready():
             if interaction.type != discord.InteractionType.autocomplete:
                 await interaction.response.send_message(
@@ -115,7 +85,16 @@ class CommandTree(app_commands.CommandTree):
                     ephemeral=True,
                 )
             return False  # wait for all shards to be connected
-        return await bot.blacklist_check(interaction)
+        if not await bot.blacklist_check(interaction):
+            return False
+        if interaction.command:
+            if interaction.type == discord.InteractionType.autocomplete:
+                track_interaction(interaction, "autocomplete")
+            else:
+                track_interaction(interaction, interaction.command.qualified_name)
+            if bot.prometheus_server:
+                bot.prometheus_server.track_dispatch(interaction, delta.total_seconds())
+        return True
 
 
 class BallsDexBot(commands.AutoShardedBot):
@@ -134,15 +113,16 @@ class BallsDexBot(commands.AutoShardedBot):
         )
 
         if settings.prometheus_enabled:
-            trace = aiohttp.TraceConfig()
-            trace.on_request_start.append(on_request_start)
-            trace.on_request_end.append(on_request_end)
-            options["http_trace"] = trace
+            options["http_trace"] = http_trace_config()
 
         super().__init__(command_prefix, intents=intents, tree_cls=CommandTree, **options)
+        if settings.prometheus_enabled:
+            instrument_http(self.http)
+        instrument_queries()
 
         self.dev = dev
         self.prometheus_server: PrometheusServer | None = None
+        self.cache_listener: CacheListener | None = None
 
         self.tree.error(self.on_application_command_error)
         self.add_check(owner_check)  # Only owners are able to use text commands
@@ -152,13 +132,18 @@ class BallsDexBot(commands.AutoShardedBot):
         self.blacklist_guild: set[int] = set()
         self.catch_log: set[int] = set()
         self.command_log: set[int] = set()
-        self.locked_balls = TTLCache(maxsize=99999, ttl=60 * 30)
+        self.locked_balls = ball_locks
+        self.user_resolver = UserResolver(self)
 
         self.owner_ids: set
 
     async def start_prometheus_server(self):
         self.prometheus_server = PrometheusServer(
-            self, settings.prometheus_host, settings.prometheus_port
+            self,
+            settings.prometheus_host,
+            settings.prometheus_port,
+            lag_interval=settings.prometheus_lag_interval,
+            slow_callback=settings.prometheus_slow_callback,
         )
         await self.prometheus_server.run()
 
@@ -186,45 +171,112 @@ class BallsDexBot(commands.AutoShardedBot):
                     bot_command, cast(list[app_commands.AppCommandGroup], synced_command.options)
                 )
 
-    async def load_cache(self):
+    async def _load_model_cache(
+        self, model: type[Ball | Regime | Economy | Special], cache: dict, incremental: bool
+    ) -> int:
+        """
+        Refresh one of the model caches and return the number of fetched rows.
+
+        In incremental mode, only the rows whose ``updated_at`` is newer than the most recent
+        one already cached are fetched, along with the list of IDs to detect deletions.
+        The dict is only mutated once all queries are done, so readers never see a partially
+        filled cache.
+        """
+        if not incremental or not cache:
+            objects = await model.all()
+            cache.clear()
+            cache.update((x.pk, x) for x in objects)
+            CATALOG_INDEXES[model].invalidate()
+            return len(objects)
+
+        since = max(x.updated_at for x in cache.values())
+        ids, objects = await asyncio.gather(
+            model.all().values_list("id", flat=True), model.filter(updated_at__gte=since)
+        )
+        deleted = cache.keys() - set(ids)
+        for pk in deleted:
+            del cache[pk]
+        cache.update((x.pk, x) for x in objects)
+        if objects or deleted:
+            CATALOG_INDEXES[model].invalidate()
+        return len(objects)
+
+    async def load_cache(self, *, incremental: bool = False):
+        """
+        Load the database models used everywhere in memory.
+
+        Parameters
+        ----------
+        incremental: bool
+            Only fetch the rows of balls, regimes, economies and specials that changed since the
+            last load instead of reloading everything. Blacklists are always fully reloaded.
+        """
+
+        async def timed(coro) -> tuple[int, float]:
+            start = time.perf_counter()
+            fetched = await coro
+            return fetched, time.perf_counter() - start
+
+        async def load_blacklist() -> int:
+            self.blacklist = set(await BlacklistedID.all().values_list("discord_id", flat=True))
+            return len(self.blacklist)
+
+        async def load_blacklist_guild() -> int:
+            self.blacklist_guild = set(
+                await BlacklistedGuild.all().values_list("discord_id", flat=True)
+            )
+            return len(self.blacklist_guild)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            timed(self._load_model_cache(Ball, balls, incremental)),
+            timed(self._load_model_cache(Regime, regimes, incremental)),
+            timed(self._load_model_cache(Economy, economies, incremental)),
+            timed(self._load_model_cache(Special, specials, incremental)),
+            timed(load_blacklist()),
+            timed(load_blacklist_guild()),
+        )
+        total_time = time.perf_counter() - start
+
         table = Table(box=box.SIMPLE)
         table.add_column("Model", style="cyan")
         table.add_column("Count", justify="right", style="green")
+        table.add_column("Fetched", justify="right")
+        table.add_column("Time", justify="right", style="yellow")
+        names = (
+            settings.collectible_name.title() + "s",
+            "Regimes",
+            "Economies",
+            "Special events",
+            "Blacklisted users",
+            "Blacklisted guilds",
+        )
+        counts = (
+            len(balls),
+            len(regimes),
+            len(economies),
+            len(specials),
+            len(self.blacklist),
+            len(self.blacklist_guild),
+        )
+        for name, count, (fetched, elapsed) in zip(names, counts, results):
+            table.add_row(name, str(count), str(fetched), f"{round(elapsed * 1000)}ms")
+        phases = ", ".join(f"{name} {round(x[1] * 1000)}ms" for name, x in zip(names, results))
 
-        balls.clear()
-        for ball in await Ball.all():
-            balls[ball.pk] = ball
-        table.add_row(settings.collectible_name.title() + "s", str(len(balls)))
-
-        regimes.clear()
-        for regime in await Regime.all():
-            regimes[regime.pk] = regime
-        table.add_row("Regimes", str(len(regimes)))
-
-        economies.clear()
-        for economy in await Economy.all():
-            economies[economy.pk] = economy
-        table.add_row("Economies", str(len(economies)))
-
-        specials.clear()
-        for special in await Special.all():
-            specials[special.pk] = special
-        table.add_row("Special events", str(len(specials)))
-
-        self.blacklist = set()
-        for blacklisted_id in await BlacklistedID.all().only("discord_id"):
-            self.blacklist.add(blacklisted_id.discord_id)
-        table.add_row("Blacklisted users", str(len(self.blacklist)))
-
-        self.blacklist_guild = set()
-        for blacklisted_id in await BlacklistedGuild.all().only("discord_id"):
-            self.blacklist_guild.add(blacklisted_id.discord_id)
-        table.add_row("Blacklisted guilds", str(len(self.blacklist_guild)))
-
-        log.info("Cache loaded, summary displayed below")
+        log.info(
+            f"{'Incremental c' if incremental else 'C'}ache loaded in "
+            f"{round(total_time * 1000)}ms ({phases}), summary displayed below"
+        )
         console = Console()
         console.print(table)
 
+    async def close(self):
+        if self.cache_listener:
+            await self.cache_listener.stop()
+        if self.prometheus_server:
+            await self.prometheus_server.stop()
+        await super().close()
+
     async def gateway_healthy(self) -> bool:
         """Check whether or not the gateway proxy is ready and healthy."""
         if settings.gateway_url is None:
@@ -285,6 +337,10 @@ class BallsDexBot(commands.AutoShardedBot):
         await self.load_cache()
         if self.blacklist:
             log.info(f"{len(self.blacklist)} blacklisted users.")
+        if await self.locked_balls.load():
+            log.info(
+                f"{len(self.locked_balls)} {settings.plural_collectible_name} locked in trades."
+            )
 
         log.info("Loading packages...")
         await self.add_cog(Core(self))
@@ -304,6 +360,10 @@ class BallsDexBot(commands.AutoShardedBot):
         else:
             log.info("No package loaded.")
 
+        # started after the packages as it also updates the spawn cache
+        self.cache_listener = CacheListener(self)
+        self.cache_listener.start()
+
         synced_commands = await self.tree.sync()
         if synced_commands:
             log.info(f"Synced {len(synced_commands)} commands.")
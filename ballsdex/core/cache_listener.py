@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import TYPE_CHECKING, Any, cast
+
+import asyncpg
+from tortoise import Tortoise
+
+from ballsdex.core.models import (
+    Ball,
+    Economy,
+    GuildConfig,
+    Regime,
+    Special,
+    balls,
+    economies,
+    regimes,
+    specials,
+)
+from ballsdex.core.utils.catalog_index import CATALOG_INDEXES
+
+if TYPE_CHECKING:
+    from tortoise.backends.asyncpg import AsyncpgDBClient
+
+    from ballsdex.core.bot import BallsDexBot
+    from ballsdex.packages.countryballs.cog import CountryBallsSpawner
+
+log = logging.getLogger("ballsdex.core.cache_listener")
+
+CHANNEL = "ballsdex_cache"
+RECONNECT_DELAY = (1, 60)
+HEALTH_CHECK_INTERVAL = 60
+
+# tables notified by the "ballsdex_notify_change" trigger, mapped to the cache they update
+MODEL_CACHES: dict[str, tuple[type[Ball | Regime | Economy | Special], dict[int, Any]]] = {
+    "ball": (Ball, balls),
+    "regime": (Regime, regimes),
+    "economy": (Economy, economies),
+    "special": (Special, specials),
+}
+
+
+class CacheListener:
+    """
+    Keeps the in-memory caches in sync with the database, including the edits done by other
+    processes like the admin panel.
+
+    Database triggers (see migration 34) send a notification on the `ballsdex_cache` channel for
+    each row inserted, updated or deleted in the cached tables. The payload is a JSON object with
+    `table`, `op` and `id` keys, and `old`/`new` keys holding the Discord ID for the tables
+    cached by Discord ID (guild configs and blacklists).
+
+    A dedicated connection is used as a pooled one would be released. Notifications are handled
+    one by one in order. Notifications sent while the connection was lost cannot be recovered,
+    so a full reload of the caches is done after each reconnection.
+
+    You can test this against a local database by running a query like
+    `UPDATE ball SET rarity = 2 WHERE id = 1` in `psql` while the bot is running.
+    """
+
+    def __init__(self, bot: "BallsDexBot"):
+        self.bot = bot
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self.connection: asyncpg.Connection | None = None
+        self.task: asyncio.Task | None = None
+        self.worker: asyncio.Task | None = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        self.worker = asyncio.create_task(self.process_queue())
+
+    async def stop(self):
+        for task in (self.task, self.worker):
+            if task:
+                task.cancel()
+        if self.connection and not self.connection.is_closed():
+            await self.connection.close()
+        self.connection = None
+
+    async def connect(self) -> asyncpg.Connection:
+        client = cast("AsyncpgDBClient", Tortoise.get_connection("default"))
+        return await asyncpg.connect(
+            host=client.host,
+            port=client.port,
+            user=client.user,
+            password=client.password,
+            database=client.database,
+            server_settings=client.server_settings,
+        )
+
+    async def run(self):
+        first_connection = True
+        delay = RECONNECT_DELAY[0]
+        while True:
+            closed = asyncio.Event()
+            try:
+                self.connection = await self.connect()
+                self.connection.add_termination_listener(lambda _: closed.set())
+                await self.connection.add_listener(CHANNEL, self.on_notification)
+            except (OSError, asyncpg.PostgresError):
+                log.warning(
+                    f"Cannot listen to cache notifications, retrying in {delay}s.", exc_info=True
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_DELAY[1])
+                continue
+
+            delay = RECONNECT_DELAY[0]
+            log.info(f'Listening to cache notifications on channel "{CHANNEL}".')
+            if not first_connection:
+                # notifications sent while disconnected are lost
+                await self.full_reload()
+            first_connection = False
+
+            await self.wait_closed(self.connection, closed)
+            log.warning("Lost the cache notifications connection, reconnecting.")
+
+    async def wait_closed(self, connection: asyncpg.Connection, closed: asyncio.Event):
+        # a silently dropped TCP connection is only detected when sending something
+        while not closed.is_set():
+            try:
+                await asyncio.wait_for(closed.wait(), timeout=HEALTH_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                try:
+                    await asyncio.wait_for(connection.execute("SELECT 1"), timeout=10)
+                except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+                    connection.terminate()
+                    return
+
+    async def full_reload(self):
+        try:
+            await self.bot.load_cache()
+            if cog := self.get_spawner():
+                await cog.load_cache()
+        except Exception:
+            log.exception("Failed to reload the cache after reconnecting.")
+
+    def on_notification(
+        self, connection: asyncpg.Connection, pid: int, channel: str, payload: str
+    ):
+        try:
+            self.queue.put_nowait(json.loads(payload))
+        except ValueError:
+            log.error(f"Received an invalid cache notification: {payload}")
+
+    async def process_queue(self):
+        while True:
+            payload = await self.queue.get()
+            try:
+                await self.handle(payload)
+            except Exception:
+                log.exception(f"Failed to handle the cache notification {payload}")
+
+    def get_spawner(self) -> "CountryBallsSpawner | None":
+        return cast("CountryBallsSpawner | None", self.bot.get_cog("CountryBallsSpawner"))
+
+    async def handle(self, payload: dict[str, Any]):
+        table: str = payload["table"]
+        op: str = payload["op"]
+        pk: int = payload["id"]
+        log.debug(f"Received cache notification: {op} on {table} {pk}")
+
+        if table in MODEL_CACHES:
+            model, cache = MODEL_CACHES[table]
+            obj = None if op == "DELETE" else await model.get_or_none(pk=pk)
+            if obj is None:
+                cache.pop(pk, None)
+            else:
+                cache[pk] = obj
+            CATALOG_INDEXES[model].invalidate()
+        elif table == "blacklistedid":
+            self.update_set(self.bot.blacklist, payload)
+        elif table == "blacklistedguild":
+            self.update_set(self.bot.blacklist_guild, payload)
+        elif table == "guildconfig":
+            await self.update_spawn_cache(payload)
+
+    @staticmethod
+    def update_set(ids: set[int], payload: dict[str, Any]):
+        if (old := payload.get("old")) is not None:
+            ids.discard(old)
+        if (new := payload.get("new")) is not None:
+            ids.add(new)
+
+    async def update_spawn_cache(self, payload: dict[str, Any]):
+        cog = self.get_spawner()
+        if cog is None:
+            return
+        cache = cog.spawn_manager.cache
+        if (old := payload.get("old")) is not None and old != payload.get("new"):
+            cache.pop(old, None)
+        if payload["op"] == "DELETE":
+            return
+        config = await GuildConfig.get_or_none(pk=payload["id"])
+        if config is None:
+            return
+        if config.enabled and config.spawn_channel:
+            cache[config.guild_id] = config.spawn_channel
+        else:
+            cache.pop(config.guild_id, None)
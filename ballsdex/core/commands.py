@@ -6,11 +6,12 @@ from typing import TYPE_CHECKING
 import discord
 
 from discord.ext import commands
-from ballsdex.core.models import Ball, BallInstance, Player, Special
-from ballsdex.packages.countryballs.components import CountryballNamePrompt
+from ballsdex.core.models import BallInstance, Player
+from ballsdex.core.utils.bulk import grant_instances
+from ballsdex.core.utils.catalog_index import ball_index, special_index
+from ballsdex.core.utils.tortoise import check_collection_summary, rebuild_collection_summary
 from ballsdex.packages.countryballs.countryball import CountryBall
 from tortoise import Tortoise
-from tortoise.exceptions import DoesNotExist
 from ballsdex.settings import settings
 
 log = logging.getLogger("ballsdex.core.commands")
@@ -65,14 +66,14 @@ class Core(commands.Cog):
 
     @commands.command()
     @commands.is_owner()
-    async def reloadcache(self, ctx: commands.Context):
+    async def reloadcache(self, ctx: commands.Context, full: bool = False):
         """
         Reload the cache of database models.
 
         This is needed each time the database is updated, otherwise changes won't reflect until
-        next start.
+        next start. Only the modified rows are fetched unless `full` is set.
         """
-        await self.bot.load_cache()
+        await self.bot.load_cache(incremental=not full)
         await ctx.message.add_reaction("✅")
 
     @commands.command()
@@ -87,6 +88,50 @@ class Core(commands.Cog):
         t2 = time.time()
         await ctx.send(f"Analyzed database in {round((t2 - t1) * 1000)}ms.")
 
+    @commands.command()
+    @commands.is_owner()
+    async def rebuildcollections(self, ctx: commands.Context, user: discord.User | None = None):
+        """
+        Rebuild the collection summary table from the instances, for one user or everyone.
+
+        Rebuilding everyone blocks catching and trading while running.
+        """
+        player_id = None
+        if user:
+            player = await Player.get_or_none(discord_id=user.id)
+            if not player:
+                await ctx.send("This user does not have a player profile.")
+                return
+            player_id = player.pk
+        t1 = time.time()
+        rows = await rebuild_collection_summary(player_id)
+        t2 = time.time()
+        await ctx.send(f"Rebuilt {rows} collection summary rows in {round((t2 - t1) * 1000)}ms.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def checkcollections(self, ctx: commands.Context):
+        """
+        Check that the collection summary table matches the instances.
+        """
+        async with ctx.typing():
+            mismatches = await check_collection_summary(limit=16)
+        if not mismatches:
+            await ctx.send("The collection summary table is consistent.")
+            return
+        more = len(mismatches) > 15
+        lines = [
+            f"player {x['player_id']} ball {x['ball_id']} shiny {x['shiny']} "
+            f"special {x['special_id']}: {x['count']}/{x['expected_count']} "
+            f"({x['favorite_count']}/{x['expected_favorite_count']} favorites)"
+            for x in mismatches[:15]
+        ]
+        await ctx.send(
+            f"Found {'more than 15' if more else len(mismatches)} mismatching rows "
+            "(summary/actual), use `rebuildcollections` to fix them.\n"
+            "```\n" + "\n".join(lines) + "\n```"
+        )
+
     @commands.command()
     @commands.is_owner()
     async def spawnball(
@@ -102,10 +147,9 @@ class Core(commands.Cog):
         if not ball:
             countryball = await CountryBall.get_random()
         else:
-            try:
-                ball_model = await Ball.get(country__iexact=ball.lower())
-            except DoesNotExist:
-                await ctx.send(f"No such {settings.collictible_name.title()} exists.")
+            ball_model = ball_index.get(ball)
+            if ball_model is None:
+                await ctx.send(f"No such {settings.collectible_name.title()} exists.")
                 return
             countryball = CountryBall(ball_model)
         countryball.message = f"{ctx.author.mention} spawned a {settings.collectible_name.title()}!\nDon't know what it is? Ask in our [official server!](<{settings.discord_invite}>)"
@@ -128,19 +172,17 @@ class Core(commands.Cog):
         Multiple users may be given to afterwards (mention or ID).
         """
         if not users:
-            ctx.send(f"User not specified. Giving {settings.collectible_name.title()} to {ctx.author.mention}.")
-            users[0] = ctx.author
-        try:
-            ball_model = await Ball.get(country__iexact=ball.lower())
-        except DoesNotExist:
-            await ctx.send(f"No such {settings.collictible_name.title()} exists. Picking random.")
-            ball_model = await Ball.get_random()
+            await ctx.send(f"User not specified. Giving {settings.collectible_name.title()} to {ctx.author.mention}.")
+            users = (ctx.author,)
+        ball_model = ball_index.get(ball)
+        if ball_model is None:
+            await ctx.send(f"No such {settings.collectible_name.title()} exists. Picking random.")
+            ball_model = (await CountryBall.get_random()).model
 
-        # Really ugly.
-        fake_prompt = CountryballNamePrompt(CountryBall(ball_model), None)
         async with ctx.typing():
-            for user in users:
-                await fake_prompt.catch_ball(ctx.bot, user)
+            await grant_instances(
+                ball_model, [x.id for x in users], server_id=ctx.guild.id if ctx.guild else None
+            )
         if len(users) > 1:
             await ctx.send(f"{settings.collectible_name.title()} {ball_model.country} given to {len(users)} users.")
         else:
@@ -182,12 +224,15 @@ class Core(commands.Cog):
             ball = ball[1:-1]
 
         player, created = await Player.get_or_create(discord_id=user.id)
-        special_obj = await Special.get(name__iexact=special.lower())
-        ball_obj = await Ball.filter(country__iexact=ball.lower()).first()
+        special_obj = special_index.get(special)
+        ball_obj = ball_index.get(ball)
 
         if not ball_obj:
             await ctx.send("No such ball exists.")
             return
+        if not special_obj:
+            await ctx.send("No such special exists.")
+            return
 
         await BallInstance.create(
             ball=ball_obj,
@@ -1,25 +1,308 @@
 import asyncio
+import inspect
 import logging
 import math
-from collections import defaultdict
-from datetime import datetime
-from typing import TYPE_CHECKING
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import FrameType, SimpleNamespace
+from typing import TYPE_CHECKING, Any
 
+import aiohttp
+import discord
 from aiohttp import web
-from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+from discord.http import HTTPClient, Route
+from discord.webhook.async_ import async_context
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
 
 if TYPE_CHECKING:
     from ballsdex.core.bot import BallsDexBot
 
 log = logging.getLogger("ballsdex.core.metrics")
 
+# Discord requires an initial response within 3 seconds of the creation of an interaction
+INTERACTION_DEADLINE = 3
+INTERACTION_BUCKETS = (
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    1.5,
+    2.0,
+    2.5,
+    3.0,
+    5.0,
+    10.0,
+    float("inf"),
+)
+
+slow_callbacks = Counter(
+    "asyncio_slow_callbacks", "Number of times a coroutine blocked the event loop", ["coroutine"]
+)
+http_requests = Histogram("discord_http_requests", "HTTP requests", ["key", "code"])
+http_request_duration = Histogram(
+    "discord_http_request_duration",
+    "Total duration of REST calls, including rate limits and retries",
+    ["key"],
+)
+http_bucket_wait = Histogram(
+    "discord_http_bucket_wait",
+    "Time spent waiting on rate limit buckets and between retries during REST calls",
+    ["key", "bucket"],
+)
+http_retries = Counter("discord_http_retries", "HTTP requests sent again", ["key"])
+
+
+@dataclass
+class RouteCall:
+    """
+    A REST call in progress, shared with the aiohttp trace callbacks of its requests.
+    """
+
+    route_key: str
+    attempts: int = 0
+    # time spent in HTTP requests, the rest of the call is spent waiting
+    requesting: float = 0
+
+
+current_call: ContextVar[RouteCall | None] = ContextVar("current_call", default=None)
+
+
+@dataclass
+class DispatchTiming:
+    """
+    Timings of an application command or autocompletion being handled.
+    """
+
+    command: str
+    type: str
+    # time in seconds between the creation of the interaction and the start of its handling
+    queue_delay: float
+    started: float = field(default_factory=time.monotonic)
+    responded: float | None = None
+
+    @property
+    def response_time(self) -> float | None:
+        """
+        Time in seconds between the start of the handling and the first response.
+        """
+        if self.responded is None:
+            return None
+        return self.responded - self.started
+
+
+current_dispatch: ContextVar[DispatchTiming | None] = ContextVar("current_dispatch", default=None)
+
+
+async def on_request_start(
+    session: aiohttp.ClientSession,
+    trace_ctx: SimpleNamespace,
+    params: aiohttp.TraceRequestStartParams,
+):
+    trace_ctx.start = session.loop.time()
+
+
+def _observe_request(session: aiohttp.ClientSession, trace_ctx: SimpleNamespace, code: str):
+    duration = session.loop.time() - trace_ctx.start
+    if call := current_call.get():
+        call.attempts += 1
+        call.requesting += duration
+        route_key = call.route_key
+    else:
+        # gateway connections and CDN downloads, their path is not usable as a label
+        route_key = "unknown"
+    http_requests.labels(route_key, code).observe(duration)
+
+
+async def on_request_end(
+    session: aiohttp.ClientSession,
+    trace_ctx: SimpleNamespace,
+    params: aiohttp.TraceRequestEndParams,
+):
+    _observe_request(session, trace_ctx, str(params.response.status))
+
+
+async def on_request_exception(
+    session: aiohttp.ClientSession,
+    trace_ctx: SimpleNamespace,
+    params: aiohttp.TraceRequestExceptionParams,
+):
+    _observe_request(session, trace_ctx, "error")
+
+
+def http_trace_config() -> aiohttp.TraceConfig:
+    """
+    Return the aiohttp trace observing the duration and status code of each HTTP request.
+    """
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    return trace
+
+
+def _instrument(request: Any, get_bucket: Any) -> Any:
+    async def instrumented_request(route: Route, *args, **kwargs):
+        call = RouteCall(route.key)
+        token = current_call.set(call)
+        start = time.monotonic()
+        try:
+            result = await request(route, *args, **kwargs)
+            # the first callback sent is the initial response of the interaction
+            if route.path.endswith("/callback"):
+                timing = current_dispatch.get()
+                if timing and timing.responded is None:
+                    timing.responded = time.monotonic()
+            return result
+        finally:
+            current_call.reset(token)
+            duration = time.monotonic() - start
+            http_request_duration.labels(route.key).observe(duration)
+            http_bucket_wait.labels(route.key, get_bucket(route)).observe(
+                max(duration - call.requesting, 0)
+            )
+            if call.attempts > 1:
+                http_retries.labels(route.key).inc(call.attempts - 1)
+
+    return instrumented_request
+
+
+def instrument_http(http: HTTPClient):
+    """
+    Wrap the REST calls of the bot and of interaction webhooks to record, per route, their
+    total duration, the time spent waiting on rate limits and the number of retries.
+
+    The route of a call is exposed to the aiohttp trace callbacks through a context variable,
+    so the requests are labeled with the route template instead of their raw path.
+    """
+    http.request = _instrument(  # type: ignore
+        http.request, lambda route: http._bucket_hashes.get(route.key, "unknown")
+    )
+    # interaction responses and followups are sent through the webhook adapter, which uses the
+    # session of the bot but has its own rate limit handling, one bucket per webhook
+    adapter = async_context.get()
+    adapter.request = _instrument(adapter.request, lambda route: "webhook")  # type: ignore
+
+
+def guild_size_bucket(guild: discord.Guild) -> int | None:
+    """
+    Return the power of 10 above the member count of a guild, used to label guild sizes.
+    """
+    if not guild.member_count:
+        return None
+    return 10 ** math.ceil(math.log(max(guild.member_count - 1, 1), 10))
+
+
+def coroutine_name(frame: FrameType | None) -> str | None:
+    """
+    Return the qualified name of the innermost coroutine in a stack, which is the one
+    holding the event loop when the stack is captured during a stall.
+    """
+    name = None
+    while frame is not None:
+        if frame.f_code.co_flags & inspect.CO_COROUTINE:
+            module = frame.f_globals.get("__name__", "?")
+            name = f"{module}.{frame.f_code.co_qualname}"
+            break
+        frame = frame.f_back
+    return name
+
+
+def interaction_labels(interaction: discord.Interaction) -> tuple[str, str]:
+    """
+    Return the command name and the type of an interaction, used to label its metrics.
+    """
+    if interaction.command:
+        command = interaction.command.qualified_name
+    else:
+        command = (interaction.data or {}).get("name", "unknown")
+    if interaction.type == discord.InteractionType.autocomplete:
+        return command, "autocomplete"
+    return command, "command"
+
+
+class LagMonitor:
+    """
+    Measures how late the event loop resumes a sleep, continuously in the background.
+
+    A separate thread watches the samples: when the loop does not resume for more than
+    `slow_callback` seconds, the stack of the loop thread is captured to find the coroutine
+    blocking it, which is counted and logged.
+
+    Parameters
+    ----------
+    histogram: Histogram
+        The histogram receiving the delays.
+    interval: float
+        Time in seconds between two samples.
+    slow_callback: float
+        Duration in seconds after which a blocked loop is reported.
+    """
+
+    def __init__(self, histogram: Histogram, interval: float = 0.25, slow_callback: float = 0.1):
+        self.histogram = histogram
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.task: asyncio.Task | None = None
+        self.thread: threading.Thread | None = None
+        self.stopped = threading.Event()
+        self.loop_thread_id: int | None = None
+        # monotonic time at which the loop is expected to resume the current sample
+        self.deadline = 0.0
+
+    async def sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self.deadline = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.histogram.observe(max(loop.time() - start - self.interval, 0))
+
+    def watch(self):
+        reported = 0.0
+        while not self.stopped.wait(self.slow_callback):
+            deadline = self.deadline
+            if deadline == reported or time.monotonic() - deadline < self.slow_callback:
+                continue
+            # only report each stall once, the deadline changes once the loop resumes
+            reported = deadline
+            frame = sys._current_frames().get(self.loop_thread_id)  # type: ignore
+            name = coroutine_name(frame) or "unknown"
+            slow_callbacks.labels(coroutine=name).inc()
+            log.warning(f"Event loop blocked for more than {self.slow_callback}s by {name}")
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.sample())
+        self.thread = threading.Thread(target=self.watch, name="lag-monitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
 
 class PrometheusServer:
     """
     Host an HTTP server for metrics collection by Prometheus.
     """
 
-    def __init__(self, bot: "BallsDexBot", host: str = "localhost", port: int = 15260):
+    def __init__(
+        self,
+        bot: "BallsDexBot",
+        host: str = "localhost",
+        port: int = 15260,
+        *,
+        lag_interval: float = 0.25,
+        slow_callback: float = 0.1,
+    ):
         self.bot = bot
         self.host = host
         self.port = port
@@ -59,27 +342,94 @@ class PrometheusServer:
                 float("inf"),
             ),
         )
+        self.lag_monitor = LagMonitor(self.asyncio_delay, lag_interval, slow_callback)
+
+        self.interaction_queue_delay = Histogram(
+            "interaction_queue_delay",
+            "Time between the creation of an interaction and the start of its handling",
+            ["command", "type"],
+            buckets=INTERACTION_BUCKETS,
+        )
+        self.interaction_response_time = Histogram(
+            "interaction_response_time",
+            "Time between the start of the handling of an interaction and its first response",
+            ["command", "type"],
+            buckets=INTERACTION_BUCKETS,
+        )
+        self.interaction_duration = Histogram(
+            "interaction_handler_duration",
+            "Time spent handling an interaction",
+            ["command", "type"],
+            buckets=INTERACTION_BUCKETS,
+        )
+        self.interaction_deadline_misses = Counter(
+            "interaction_deadline_misses",
+            "Interactions not responded to within the deadline",
+            ["command", "type", "reason"],
+        )
+        # size bucket of each guild, to update the gauge on joins and removals
+        self.guild_sizes: dict[int, int] = {}
 
-    async def collect_metrics(self):
-        guilds: dict[int, int] = defaultdict(int)
+    def count_guilds(self):
+        """
+        Compute the size of all guilds, only needed once the bot is ready.
+        """
+        # buckets without any guild left are reset to 0
+        counts: dict[int, int] = {size: 0 for size in self.guild_sizes.values()}
+        self.guild_sizes.clear()
         for guild in self.bot.guilds:
-            if not guild.member_count:
-                continue
-            guilds[10 ** math.ceil(math.log(max(guild.member_count - 1, 1), 10))] += 1
-        for size, count in guilds.items():
+            if size := guild_size_bucket(guild):
+                self.guild_sizes[guild.id] = size
+                counts[size] = counts.get(size, 0) + 1
+        for size, count in counts.items():
             self.guild_count.labels(size=size).set(count)
 
+    async def on_guild_join(self, guild: discord.Guild):
+        if guild.id in self.guild_sizes:
+            return
+        if size := guild_size_bucket(guild):
+            self.guild_sizes[guild.id] = size
+            self.guild_count.labels(size=size).inc()
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        if size := self.guild_sizes.pop(guild.id, None):
+            self.guild_count.labels(size=size).dec()
+
+    def track_dispatch(self, interaction: discord.Interaction, queue_delay: float):
+        """
+        Time the handling of an application command or autocompletion, until the task running
+        it completes. This must be called from that task, such as in an `interaction_check`.
+        """
+        timing = DispatchTiming(*interaction_labels(interaction), queue_delay)
+        current_dispatch.set(timing)
+        self.interaction_queue_delay.labels(timing.command, timing.type).observe(queue_delay)
+        if task := asyncio.current_task():
+            task.add_done_callback(lambda _: self._observe_dispatch(timing))
+
+    def _observe_dispatch(self, timing: DispatchTiming):
+        labels = (timing.command, timing.type)
+        self.interaction_duration.labels(*labels).observe(time.monotonic() - timing.started)
+        response_time = timing.response_time
+        if response_time is None:
+            self.interaction_deadline_misses.labels(*labels, "unanswered").inc()
+            return
+        self.interaction_response_time.labels(*labels).observe(response_time)
+        if timing.queue_delay + response_time > INTERACTION_DEADLINE:
+            self.interaction_deadline_misses.labels(*labels, "late").inc()
+
+    def deadline_missed(self, interaction: discord.Interaction, reason: str):
+        """
+        Count an interaction that will not be responded to in time.
+        """
+        self.interaction_deadline_misses.labels(*interaction_labels(interaction), reason).inc()
+
+    def collect_metrics(self):
         for shard_id, latency in self.bot.latencies:
             self.shards_latecy.labels(shard_id=shard_id).observe(latency)
 
-        t1 = datetime.now()
-        await asyncio.sleep(1)
-        t2 = datetime.now()
-        self.asyncio_delay.observe((t2 - t1).total_seconds() - 1)
-
     async def get(self, request: web.Request) -> web.Response:
         log.debug("Request received")
-        await self.collect_metrics()
+        self.collect_metrics()
         response = web.Response(body=generate_latest())
         response.content_type = CONTENT_TYPE_LATEST
         return response
@@ -93,9 +443,16 @@ class PrometheusServer:
     async def run(self):
         await self.setup()
         await self.site.start()  # this call isn't blocking
+        self.count_guilds()
+        self.bot.add_listener(self.on_guild_join)
+        self.bot.add_listener(self.on_guild_remove)
+        self.lag_monitor.start()
         log.info(f"Prometheus server started on http://{self.site._host}:{self.site._port}/")
 
     async def stop(self):
+        self.lag_monitor.stop()
+        self.bot.remove_listener(self.on_guild_join)
+        self.bot.remove_listener(self.on_guild_remove)
         if self._inited:
             await self.site.stop()
             await self.runner.cleanup()
@@ -10,11 +10,13 @@ import discord
 from discord.utils import format_dt
 from fastapi_admin.models import AbstractAdmin
 from tortoise import exceptions, fields, models, signals, timezone, validators
+from tortoise.functions import Sum
 
 from ballsdex.core.image_generator.image_gen import draw_card
 
 if TYPE_CHECKING:
     from tortoise.backends.base.client import BaseDBAsyncClient
+    from tortoise.queryset import QuerySet
 
 
 balls: dict[int, Ball] = {}
@@ -22,6 +24,9 @@ regimes: dict[int, Regime] = {}
 economies: dict[int, Economy] = {}
 specials: dict[int, Special] = {}
 
+# time after which the trade lock of an instance expires
+LOCK_DURATION = timedelta(minutes=30)
+
 
 async def lower_catch_names(
     model: Type[Ball],
@@ -67,10 +72,22 @@ class GuildConfig(models.Model):
         default=False,
     )
 
+    @classmethod
+    async def get_many(cls, guild_ids: Iterable[int]) -> dict[int, GuildConfig]:
+        """
+        Return the configurations of the given guilds with a single query, mapped by guild ID.
+        Guilds without a configuration are missing from the result.
+        """
+        ids = list(set(guild_ids))
+        if not ids:
+            return {}
+        return {x.guild_id: x for x in await cls.filter(guild_id__in=ids)}
+
 
 class Regime(models.Model):
     name = fields.CharField(max_length=64)
     background = fields.CharField(max_length=200, description="1428x2000 PNG image")
+    updated_at = fields.DatetimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -79,6 +96,7 @@ class Regime(models.Model):
 class Economy(models.Model):
     name = fields.CharField(max_length=64)
     icon = fields.CharField(max_length=200, description="512x512 PNG image")
+    updated_at = fields.DatetimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -105,6 +123,7 @@ class Special(models.Model):
     )
     tradeable = fields.BooleanField(default=True)
     hidden = fields.BooleanField(default=False, description="Hides the event from user commands")
+    updated_at = fields.DatetimeField(auto_now=True)
 
     def __str__(self) -> str:
         return self.name
@@ -153,6 +172,7 @@ class Ball(models.Model):
     )
     capacity_logic = fields.JSONField(description="Effect of this capacity", default={})
     created_at = fields.DatetimeField(auto_now_add=True, null=True)
+    updated_at = fields.DatetimeField(auto_now=True)
 
     instances: fields.BackwardFKRelation[BallInstance]
 
@@ -171,40 +191,27 @@ class Ball(models.Model):
 Ball.register_listener(signals.Signals.pre_save, lower_catch_names)
 
 
-class BallInstance(models.Model):
-    ball_id: int
-    special_id: int
-    trade_player_id: int
+class BallInstanceDisplayMixin:
+    """
+    Formatting helpers shared by `BallInstance` and its read-only projections.
 
-    ball: fields.ForeignKeyRelation[Ball] = fields.ForeignKeyField("models.Ball")
-    player: fields.ForeignKeyRelation[Player] = fields.ForeignKeyRelation(
-        "models.Player", related_name="balls"
-    )  # type: ignore
-    catch_date = fields.DatetimeField(auto_now_add=True)
-    spawned_time = fields.DatetimeField(null=True)
-    server_id = fields.BigIntField(
-        description="Discord server ID where this ball was caught", null=True
-    )
-    shiny = fields.BooleanField(default=False)
-    special: fields.ForeignKeyRelation[Special] | None = fields.ForeignKeyField(
-        "models.Special", null=True, default=None, on_delete=fields.SET_NULL
-    )
-    health_bonus = fields.IntField(default=0)
-    attack_bonus = fields.IntField(default=0)
-    trade_player: fields.ForeignKeyRelation[Player] | None = fields.ForeignKeyField(
-        "models.Player", null=True, default=None, on_delete=fields.SET_NULL
-    )
-    favorite = fields.BooleanField(default=False)
-    tradeable = fields.BooleanField(default=True)
-    locked: fields.Field[datetime] = fields.DatetimeField(
-        description="If the instance was locked for a trade and when",
-        null=True,
-        default=None,
-    )
-    extra_data = fields.JSONField(default={})
+    Subclasses must provide the attributes annotated below, as well as the `countryball` and
+    `specialcard` properties.
+    """
 
-    class Meta:
-        unique_together = ("player", "id")
+    __slots__ = ()
+
+    pk: int
+    ball_id: int
+    special_id: int | None
+    shiny: bool
+    favorite: bool
+    tradeable: bool
+    health_bonus: int
+    attack_bonus: int
+    catch_date: datetime
+    countryball: Ball
+    specialcard: Special | None
 
     @property
     def is_tradeable(self) -> bool:
@@ -229,17 +236,6 @@ class BallInstance(models.Model):
         if self.specialcard:
             return self.specialcard.background or self.countryball.collection_card
 
-    @property
-    def countryball(self) -> Ball:
-        return balls.get(self.ball_id, self.ball)
-
-    @property
-    def specialcard(self) -> Special | None:
-        return specials.get(self.special_id, self.special)
-
-    def __str__(self) -> str:
-        return self.to_string()
-
     def to_string(self, bot: discord.Client | None = None, is_trade: bool = False) -> str:
         emotes = ""
         if bot and self.pk in bot.locked_balls and not is_trade:  # type: ignore
@@ -297,6 +293,54 @@ class BallInstance(models.Model):
                     text = f"{emoji} {text}"
         return text
 
+
+class BallInstance(BallInstanceDisplayMixin, models.Model):
+    ball_id: int
+    player_id: int
+    special_id: int
+    trade_player_id: int
+
+    ball: fields.ForeignKeyRelation[Ball] = fields.ForeignKeyField("models.Ball")
+    player: fields.ForeignKeyRelation[Player] = fields.ForeignKeyRelation(
+        "models.Player", related_name="balls"
+    )  # type: ignore
+    catch_date = fields.DatetimeField(auto_now_add=True)
+    spawned_time = fields.DatetimeField(null=True)
+    server_id = fields.BigIntField(
+        description="Discord server ID where this ball was caught", null=True
+    )
+    shiny = fields.BooleanField(default=False)
+    special: fields.ForeignKeyRelation[Special] | None = fields.ForeignKeyField(
+        "models.Special", null=True, default=None, on_delete=fields.SET_NULL
+    )
+    health_bonus = fields.IntField(default=0)
+    attack_bonus = fields.IntField(default=0)
+    trade_player: fields.ForeignKeyRelation[Player] | None = fields.ForeignKeyField(
+        "models.Player", null=True, default=None, on_delete=fields.SET_NULL
+    )
+    favorite = fields.BooleanField(default=False)
+    tradeable = fields.BooleanField(default=True)
+    locked: fields.Field[datetime] = fields.DatetimeField(
+        description="If the instance was locked for a trade and when",
+        null=True,
+        default=None,
+    )
+    extra_data = fields.JSONField(default={})
+
+    class Meta:
+        unique_together = ("player", "id")
+
+    @property
+    def countryball(self) -> Ball:
+        return balls.get(self.ball_id, self.ball)
+
+    @property
+    def specialcard(self) -> Special | None:
+        return specials.get(self.special_id, self.special)
+
+    def __str__(self) -> str:
+        return self.to_string()
+
     def draw_card(self) -> BytesIO:
         image = draw_card(self)
         buffer = BytesIO()
@@ -313,20 +357,16 @@ class BallInstance(models.Model):
         await self.fetch_related("trade_player", "special")
         if self.trade_player:
             original_player = None
+            discord_id = int(self.trade_player.discord_id)
             # we want to avoid calling fetch_user if possible (heavily rate-limited call)
             if interaction.guild:
+                original_player = interaction.guild.get_member(discord_id)
+            if original_player is None:
                 try:
-                    original_player = await interaction.guild.fetch_member(
-                        int(self.trade_player.discord_id)
-                    )
-                except discord.NotFound:
-                    pass
-            elif original_player is None:  # try again if not found in guild
-                try:
-                    original_player = await interaction.client.fetch_user(
-                        int(self.trade_player.discord_id)
+                    original_player = await interaction.client.user_resolver.fetch(  # type: ignore
+                        discord_id
                     )
-                except discord.NotFound:
+                except discord.HTTPException:
                     pass
 
             original_player_name = (
@@ -349,18 +389,125 @@ class BallInstance(models.Model):
 
         return content, discord.File(buffer, "card.png")
 
-    async def lock_for_trade(self):
-        self.locked = timezone.now()
-        await self.save(update_fields=("locked",))
+    @property
+    def is_locked(self) -> bool:
+        """
+        Whether this instance was locked for a trade, as of when it was fetched. Use
+        `ballsdex.core.utils.locks.ball_locks` for an up-to-date check.
+        """
+        return self.locked is not None and self.locked + LOCK_DURATION > timezone.now()
+
+
+class BallInstanceSummary(BallInstanceDisplayMixin):
+    """
+    Read-only projection of a `BallInstance` holding only the columns needed to display it.
+
+    This is much lighter than a full model object and should be used for listing large amounts
+    of instances. Build them with `BallInstanceSummary.fetch` from a `BallInstance` queryset.
+    """
+
+    __slots__ = (
+        "pk",
+        "ball_id",
+        "special_id",
+        "shiny",
+        "favorite",
+        "tradeable",
+        "health_bonus",
+        "attack_bonus",
+        "catch_date",
+    )
+    # database columns, in the same order as the slots above
+    FIELDS = ("id", *__slots__[1:])
+
+    def __init__(
+        self,
+        pk: int,
+        ball_id: int,
+        special_id: int | None,
+        shiny: bool,
+        favorite: bool,
+        tradeable: bool,
+        health_bonus: int,
+        attack_bonus: int,
+        catch_date: datetime,
+    ):
+        self.pk = pk
+        self.ball_id = ball_id
+        self.special_id = special_id
+        self.shiny = shiny
+        self.favorite = favorite
+        self.tradeable = tradeable
+        self.health_bonus = health_bonus
+        self.attack_bonus = attack_bonus
+        self.catch_date = catch_date
+
+    @classmethod
+    async def fetch(cls, queryset: QuerySet[BallInstance]) -> list[BallInstanceSummary]:
+        return [cls(*row) for row in await queryset.values_list(*cls.FIELDS)]
+
+    @property
+    def countryball(self) -> Ball:
+        return balls[self.ball_id]
+
+    @property
+    def specialcard(self) -> Special | None:
+        return specials.get(self.special_id) if self.special_id else None
+
+    def __str__(self) -> str:
+        return self.to_string()
+
+    def __repr__(self) -> str:
+        return f"<BallInstanceSummary {self.pk}>"
+
 
-    async def unlock(self):
-        self.locked = None  # type: ignore
-        await self.save(update_fields=("locked",))
+class CollectionSummary(models.Model):
+    """
+    Number of instances owned by a player for each ball, shiny status and special event.
 
-    async def is_locked(self):
-        await self.refresh_from_db(fields=("locked",))
-        self.locked
-        return self.locked is not None and (self.locked + timedelta(minutes=30)) > timezone.now()
+    This table is maintained by database triggers on `ballinstance` and must never be written
+    from the bot. Rows are not deleted when their count drops to 0, always filter on `count`.
+    There are no foreign keys, to let cascading deletions of balls and players go through.
+    """
+
+    player_id = fields.IntField()
+    ball_id = fields.IntField()
+    shiny = fields.BooleanField()
+    special_id = fields.IntField(null=True)
+    count = fields.IntField(default=0)
+    favorite_count = fields.IntField(default=0)
+
+    class Meta:
+        table_description = (
+            "Number of instances owned per player, ball, shiny and special, maintained by triggers"
+        )
+
+    @classmethod
+    async def get_total(cls, player_id: int, *, favorites: bool = False, **filters) -> int:
+        """
+        Return the number of instances owned by a player, optionally filtered by `ball_id`,
+        `shiny` or `special_id`. Set `favorites` to count favorite instances only.
+        """
+        field = "favorite_count" if favorites else "count"
+        result = await (
+            cls.filter(player_id=player_id, **{f"{field}__gt": 0}, **filters)
+            .annotate(total=Sum(field))
+            .values_list("total", flat=True)
+        )
+        # SUM returns NULL when no row matches
+        return (result[0] if result else None) or 0
+
+    @classmethod
+    async def get_owned_ball_ids(cls, player_id: int, **filters) -> set[int]:
+        """
+        Return the IDs of the balls owned at least once by a player, optionally filtered by
+        `shiny` or `special_id`.
+        """
+        return set(
+            await cls.filter(player_id=player_id, count__gt=0, **filters)
+            .distinct()
+            .values_list("ball_id", flat=True)
+        )
 
 
 class DonationPolicy(IntEnum):
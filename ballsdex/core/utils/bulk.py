@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import logging
+import random
+from typing import Awaitable, Callable, Iterable
+
+from tortoise.transactions import in_transaction
+
+from ballsdex.core.models import Ball, BallInstance, Player, Special, Trade
+from ballsdex.core.utils.collection_index import collection_indexes
+from ballsdex.core.utils.locks import ball_locks
+from ballsdex.settings import settings
+
+log = logging.getLogger("ballsdex.core.utils.bulk")
+
+__all__ = ("delete_instances", "grant_instances", "transfer_instances")
+
+# number of instances inserted per statement when granting
+GRANT_BATCH_SIZE = 500
+
+# called with the number of processed items and the total
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+async def delete_instances(
+    player: Player, percentage: int | None = None, *, dry_run: bool = False
+) -> int:
+    """
+    Delete all instances of a player, or a random percentage of them, with a single statement.
+
+    Parameters
+    ----------
+    player: Player
+        The player losing their instances.
+    percentage: int | None
+        The percentage of instances to delete, rounded down. Deletes everything if omitted.
+    dry_run: bool
+        Only return how many instances would be deleted.
+
+    Returns
+    -------
+    int
+        The number of instances deleted.
+    """
+    if dry_run:
+        count = await BallInstance.filter(player_id=player.pk).count()
+        return count * percentage // 100 if percentage else count
+
+    async with in_transaction() as connection:
+        if percentage:
+            count, _ = await connection.execute_query(
+                'DELETE FROM "ballinstance" WHERE "id" IN (SELECT "id" FROM "ballinstance" '
+                'WHERE "player_id" = $1 ORDER BY random() LIMIT ('
+                'SELECT COUNT(*) * $2 / 100 FROM "ballinstance" WHERE "player_id" = $1))',
+                [player.pk, percentage],
+            )
+        else:
+            count, _ = await connection.execute_query(
+                'DELETE FROM "ballinstance" WHERE "player_id" = $1', [player.pk]
+            )
+    collection_indexes.invalidate(player.discord_id)
+    log.debug(f"Deleted {count} instances of player {player.pk}")
+    return count
+
+
+async def grant_instances(
+    ball: Ball,
+    discord_ids: Iterable[int],
+    *,
+    special: Special | None = None,
+    shiny: bool | None = None,
+    attack_bonus: int | None = None,
+    health_bonus: int | None = None,
+    server_id: int | None = None,
+    dry_run: bool = False,
+    progress: ProgressCallback | None = None,
+) -> int:
+    """
+    Give one instance of a ball to each of the given users, in a single transaction.
+
+    Missing players are created, then the instances are inserted by batches of
+    `GRANT_BATCH_SIZE`. Stats omitted are random, like when catching.
+
+    Parameters
+    ----------
+    ball: Ball
+        The ball given.
+    discord_ids: Iterable[int]
+        The Discord IDs of the users receiving the ball. Duplicates receive one instance.
+    special: Special | None
+        The special event of the instances.
+    shiny: bool | None
+        Whether the instances are shiny. Omit to roll it for each instance.
+    attack_bonus: int | None
+        The attack bonus of the instances. Omit to roll it for each instance.
+    health_bonus: int | None
+        The health bonus of the instances. Omit to roll it for each instance.
+    server_id: int | None
+        The ID of the server where the instances are considered caught.
+    dry_run: bool
+        Only return how many instances would be created.
+    progress: ProgressCallback | None
+        Called after each batch with the number of instances created so far.
+
+    Returns
+    -------
+    int
+        The number of instances created.
+    """
+    ids = list(dict.fromkeys(discord_ids))
+    if dry_run or not ids:
+        return len(ids)
+
+    async with in_transaction() as connection:
+        players = {
+            x.discord_id: x for x in await Player.filter(discord_id__in=ids).using_db(connection)
+        }
+        if missing := [x for x in ids if x not in players]:
+            await Player.bulk_create(
+                [Player(discord_id=x) for x in missing], ignore_conflicts=True, using_db=connection
+            )
+            players.update(
+                (x.discord_id, x)
+                for x in await Player.filter(discord_id__in=missing).using_db(connection)
+            )
+
+        for start in range(0, len(ids), GRANT_BATCH_SIZE):
+            batch = ids[start : start + GRANT_BATCH_SIZE]
+            await BallInstance.bulk_create(
+                [
+                    BallInstance(
+                        ball=ball,
+                        player=players[x],
+                        special=special,
+                        shiny=shiny if shiny is not None else random.randint(1, 2048) == 1,
+                        attack_bonus=(
+                            attack_bonus
+                            if attack_bonus is not None
+                            else random.randint(
+                                -settings.max_attack_bonus, settings.max_attack_bonus
+                            )
+                        ),
+                        health_bonus=(
+                            health_bonus
+                            if health_bonus is not None
+                            else random.randint(
+                                -settings.max_health_bonus, settings.max_health_bonus
+                            )
+                        ),
+                        server_id=server_id,
+                    )
+                    for x in batch
+                ],
+                using_db=connection,
+            )
+            if progress:
+                await progress(start + len(batch), len(ids))
+
+    # bulk inserts do not send the signals keeping the autocompletion indexes updated
+    for discord_id in ids:
+        collection_indexes.invalidate(discord_id)
+    log.debug(f"Granted {ball.country} to {len(ids)} users")
+    return len(ids)
+
+
+async def transfer_instances(
+    source: Player,
+    destination: Player,
+    *,
+    ball: Ball | None = None,
+    dry_run: bool = False,
+) -> int:
+    """
+    Move all instances of a player to another one, with a single statement.
+
+    The transfer is recorded as a trade like the manual transfers, and the moved instances lose
+    their favorite status and trade lock like traded ones.
+
+    Parameters
+    ----------
+    source: Player
+        The player losing the instances.
+    destination: Player
+        The player receiving the instances.
+    ball: Ball | None
+        Only transfer the instances of this ball.
+    dry_run: bool
+        Only return how many instances would be transferred.
+
+    Returns
+    -------
+    int
+        The number of instances transferred.
+    """
+    queryset = BallInstance.filter(player_id=source.pk)
+    if ball is not None:
+        queryset = queryset.filter(ball_id=ball.pk)
+    if dry_run:
+        return await queryset.count()
+
+    ball_filter = 'AND "ball_id" = $4' if ball is not None else ""
+    async with in_transaction() as connection:
+        trade = await Trade.create(player1=source, player2=destination, using_db=connection)
+        _, rows = await connection.execute_query(
+            'WITH moved AS (UPDATE "ballinstance" SET "player_id" = $2, '
+            '"trade_player_id" = $1, "favorite" = FALSE, "locked" = NULL '
+            f'WHERE "player_id" = $1 {ball_filter} RETURNING "id") '
+            'INSERT INTO "tradeobject" ("trade_id", "ballinstance_id", "player_id") '
+            'SELECT $3, "id", $1 FROM moved RETURNING "ballinstance_id"',
+            [source.pk, destination.pk, trade.pk, *([ball.pk] if ball is not None else [])],
+        )
+        if not rows:
+            await trade.delete(using_db=connection)
+
+    count = len(rows)
+    ball_locks.forget(row[0] for row in rows)
+    collection_indexes.invalidate(source.discord_id)
+    collection_indexes.invalidate(destination.discord_id)
+    log.debug(f"Transferred {count} instances from player {source.pk} to {destination.pk}")
+    return count
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import logging
+from bisect import bisect_left
+from typing import Callable, Generic, Iterator, TypeVar
+
+from tortoise.models import Model
+
+from ballsdex.core.models import (
+    Ball,
+    Economy,
+    Regime,
+    Special,
+    balls,
+    economies,
+    regimes,
+    specials,
+)
+from ballsdex.core.utils.collection_index import trigrams
+
+log = logging.getLogger("ballsdex.core.utils.catalog_index")
+T = TypeVar("T", bound=Model)
+
+__all__ = (
+    "CatalogIndex",
+    "ball_index",
+    "special_index",
+    "regime_index",
+    "economy_index",
+    "CATALOG_INDEXES",
+)
+
+
+class CatalogIndex(Generic[T]):
+    """
+    Name search index over one of the cached catalog models (balls, specials, regimes,
+    economies).
+
+    The index reads the cache dict it is given and is built on first use. It must be
+    invalidated when the cache changes, which `BallsDexBot.load_cache` and the cache listener
+    do, it is then rebuilt on the next search.
+
+    Parameters
+    ----------
+    cache: dict[int, T]
+        The cache holding the objects, mapped by primary key.
+    key: Callable[[T], str]
+        Returns the name of an object, used for searching and exact lookups.
+    """
+
+    def __init__(self, cache: dict[int, T], key: Callable[[T], str]):
+        self.cache = cache
+        self.key = key
+        self.built = False
+        self.names: dict[int, str] = {}
+        self.sorted_names: list[tuple[str, int]] = []
+        self.exact: dict[str, int] = {}
+        self.ngrams: dict[str, set[int]] = {}
+
+    def invalidate(self):
+        self.built = False
+
+    def build(self):
+        self.names = {pk: self.key(x).lower() for pk, x in self.cache.items()}
+        self.sorted_names = sorted((name, pk) for pk, name in self.names.items())
+        self.exact = {}
+        self.ngrams = {}
+        # lowest primary key wins on duplicate names, like an unordered query would mostly do
+        for name, pk in reversed(self.sorted_names):
+            self.exact[name] = pk
+        for pk, name in self.names.items():
+            for ngram in trigrams(name):
+                self.ngrams.setdefault(ngram, set()).add(pk)
+        self.built = True
+        log.debug(f"Built catalog index with {len(self.names)} entries")
+
+    def maybe_build(self):
+        if not self.built:
+            self.build()
+
+    def get(self, name: str) -> T | None:
+        """
+        Return the object whose name is exactly the given one, ignoring case.
+        """
+        self.maybe_build()
+        pk = self.exact.get(name.strip().lower())
+        return self.cache.get(pk) if pk is not None else None
+
+    def search(self, value: str, predicate: Callable[[T], bool] | None = None) -> Iterator[T]:
+        """
+        Iterate over the objects whose name contains the given text, ignoring case.
+
+        Names starting with the text are yielded first, then the other matches, both in
+        alphabetical order.
+
+        Parameters
+        ----------
+        value: str
+            The text to search.
+        predicate: Callable[[T], bool] | None
+            If given, only the objects for which it returns `True` are yielded.
+        """
+        self.maybe_build()
+        value = value.strip().lower()
+        seen: set[int] = set()
+
+        for position in range(bisect_left(self.sorted_names, (value,)), len(self.sorted_names)):
+            name, pk = self.sorted_names[position]
+            if not name.startswith(value):
+                break
+            seen.add(pk)
+            obj = self.cache.get(pk)
+            if obj is not None and (predicate is None or predicate(obj)):
+                yield obj
+
+        if len(value) < 3:
+            candidates = set(self.names.keys())
+        else:
+            candidates = set.intersection(
+                *(self.ngrams.get(ngram, set()) for ngram in trigrams(value))
+            )
+        matches = sorted(
+            (self.names[pk], pk) for pk in candidates - seen if value in self.names[pk]
+        )
+        for _, pk in matches:
+            obj = self.cache.get(pk)
+            if obj is not None and (predicate is None or predicate(obj)):
+                yield obj
+
+
+ball_index: CatalogIndex[Ball] = CatalogIndex(balls, lambda x: x.country)
+special_index: CatalogIndex[Special] = CatalogIndex(specials, lambda x: x.name)
+regime_index: CatalogIndex[Regime] = CatalogIndex(regimes, lambda x: x.name)
+economy_index: CatalogIndex[Economy] = CatalogIndex(economies, lambda x: x.name)
+
+CATALOG_INDEXES: dict[type[Model], CatalogIndex] = {
+    Ball: ball_index,
+    Special: special_index,
+    Regime: regime_index,
+    Economy: economy_index,
+}
@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable, Iterator, Type
+
+from cachetools import TTLCache
+from tortoise import signals, timezone
+
+from ballsdex.core.models import (
+    LOCK_DURATION,
+    Ball,
+    BallInstance,
+    BallInstanceDisplayMixin,
+    Player,
+    Special,
+    balls,
+    specials,
+)
+from ballsdex.core.utils.queries import create_background_task
+
+if TYPE_CHECKING:
+    from tortoise.backends.base.client import BaseDBAsyncClient
+
+log = logging.getLogger("ballsdex.core.utils.collection_index")
+
+__all__ = ("IndexedBallInstance", "CollectionIndex", "CollectionIndexCache", "collection_indexes")
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def normalize_search(value: str) -> str:
+    """
+    Return the text searched for an autocompletion input. The search ignores case, dots and a
+    leading "#", which are only typed around instance IDs.
+    """
+    return value.replace(".", "").strip().lower().removeprefix("#")
+
+
+def is_hex(value: str) -> bool:
+    try:
+        int(value, 16)
+    except ValueError:
+        return False
+    return True
+
+
+def ball_search_name(ball_id: int) -> str:
+    """
+    Return the text matched by name searches for the instances of a ball.
+    """
+    ball = balls.get(ball_id)
+    if ball is None:
+        return ""
+    return f"{ball.country} {ball.catch_names or ''}".lower()
+
+
+def matches_search(pk: int, ball_id: int, value: str) -> bool:
+    """
+    Return whether an instance is a result of `CollectionIndex.search` for a normalized text.
+    """
+    if not value:
+        return True
+    if is_hex(value) and f"{pk:x}".startswith(value):
+        return True
+    return value in ball_search_name(ball_id)
+
+
+class IndexedBallInstance(BallInstanceDisplayMixin):
+    """
+    Minimal in-memory copy of a `BallInstance`, holding what autocompletion needs to filter and
+    display it.
+    """
+
+    __slots__ = (
+        "pk",
+        "ball_id",
+        "special_id",
+        "shiny",
+        "favorite",
+        "health_bonus",
+        "attack_bonus",
+        "locked",
+    )
+    # database columns, in the same order as the slots above
+    FIELDS = ("id", *__slots__[1:])
+
+    def __init__(
+        self,
+        pk: int,
+        ball_id: int,
+        special_id: int | None,
+        shiny: bool,
+        favorite: bool,
+        health_bonus: int,
+        attack_bonus: int,
+        locked: datetime | None,
+    ):
+        self.pk = pk
+        self.ball_id = ball_id
+        self.special_id = special_id
+        self.shiny = shiny
+        self.favorite = favorite
+        self.health_bonus = health_bonus
+        self.attack_bonus = attack_bonus
+        self.locked = locked
+
+    @classmethod
+    def from_instance(cls, instance: BallInstance) -> IndexedBallInstance:
+        return cls(*(getattr(instance, x) for x in cls.__slots__))
+
+    @property
+    def countryball(self) -> Ball:
+        return balls[self.ball_id]
+
+    @property
+    def specialcard(self) -> Special | None:
+        return specials.get(self.special_id) if self.special_id else None
+
+    @property
+    def is_locked(self) -> bool:
+        return self.locked is not None and self.locked + LOCK_DURATION > timezone.now()
+
+    def __repr__(self) -> str:
+        return f"<IndexedBallInstance {self.pk}>"
+
+
+class CollectionIndex:
+    """
+    Search index over the collection of a single player.
+
+    Two structures are maintained:
+
+    - a sorted list of the hexadecimal IDs, for prefix searches on the IDs
+    - a trigram index over the country and catch names of each owned ball, mapping each trigram
+      to the set of ball IDs containing it
+
+    Both structures are updated in place when instances are added or removed, so the index can
+    be kept around and patched instead of being rebuilt.
+
+    Attributes
+    ----------
+    player_id: int | None
+        Primary key of the indexed player, `None` if they are not registered yet.
+    entries: dict[int, IndexedBallInstance]
+        Indexed instances, mapped by primary key.
+    built_at: float
+        Monotonic time of the build, used to periodically rebuild the index.
+    """
+
+    def __init__(self, player_id: int | None, entries: Iterable[IndexedBallInstance] = ()):
+        self.player_id = player_id
+        self.built_at = time.monotonic()
+        self.entries: dict[int, IndexedBallInstance] = {}
+        self.by_ball: dict[int, set[int]] = {}
+        self.hex_ids: list[tuple[str, int]] = []
+        self.names: dict[int, str] = {}
+        self.ngrams: dict[str, set[int]] = {}
+
+        for entry in entries:
+            self._add_entry(entry)
+            self.hex_ids.append((f"{entry.pk:X}", entry.pk))
+        self.hex_ids.sort()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _index_ball(self, ball_id: int):
+        name = ball_search_name(ball_id)
+        self.names[ball_id] = name
+        for ngram in trigrams(name):
+            self.ngrams.setdefault(ngram, set()).add(ball_id)
+
+    def _add_entry(self, entry: IndexedBallInstance):
+        self.entries[entry.pk] = entry
+        if entry.ball_id not in self.names:
+            self._index_ball(entry.ball_id)
+        self.by_ball.setdefault(entry.ball_id, set()).add(entry.pk)
+
+    def add(self, entry: IndexedBallInstance):
+        """
+        Add an instance to the index, or replace the existing copy.
+        """
+        if entry.pk in self.entries:
+            self.remove(entry.pk)
+        self._add_entry(entry)
+        insort(self.hex_ids, (f"{entry.pk:X}", entry.pk))
+
+    def remove(self, pk: int):
+        """
+        Remove an instance from the index if present.
+        """
+        entry = self.entries.pop(pk, None)
+        if entry is None:
+            return
+        if owned := self.by_ball.get(entry.ball_id):
+            owned.discard(pk)
+        key = (f"{pk:X}", pk)
+        position = bisect_left(self.hex_ids, key)
+        if position < len(self.hex_ids) and self.hex_ids[position] == key:
+            del self.hex_ids[position]
+
+    def search_ids(self, prefix: str) -> Iterator[IndexedBallInstance]:
+        prefix = prefix.upper()
+        for position in range(bisect_left(self.hex_ids, (prefix,)), len(self.hex_ids)):
+            hex_id, pk = self.hex_ids[position]
+            if not hex_id.startswith(prefix):
+                break
+            yield self.entries[pk]
+
+    def search_names(self, text: str) -> Iterator[IndexedBallInstance]:
+        text = text.lower()
+        if len(text) < 3:
+            candidates: Iterable[int] = self.names.keys()
+        else:
+            candidates = set.intersection(
+                *(self.ngrams.get(ngram, set()) for ngram in trigrams(text))
+            )
+        matches = [x for x in candidates if self.by_ball.get(x) and text in self.names[x]]
+        for ball_id in sorted(matches, key=self.names.__getitem__):
+            for pk in self.by_ball[ball_id]:
+                yield self.entries[pk]
+
+    def search(self, value: str) -> Iterator[IndexedBallInstance]:
+        """
+        Iterate over the instances matching the given text, either as a prefix of their ID or
+        as a part of their ball's country or catch names.
+
+        Results are not limited, stop iterating once enough were yielded.
+        """
+        value = normalize_search(value)
+        if not value:
+            yield from self.entries.values()
+            return
+        seen: set[int] = set()
+        if is_hex(value):
+            for entry in self.search_ids(value):
+                seen.add(entry.pk)
+                yield entry
+        for entry in self.search_names(value):
+            if entry.pk not in seen:
+                yield entry
+
+
+class CollectionIndexCache:
+    """
+    Keeps the collection indexes of the users currently running autocompletion.
+
+    An index is built on first use and kept while the user keeps using it, then dropped after
+    `ttl` seconds of inactivity. It is also rebuilt every `max_age` seconds to pick up changes
+    that were not done through model instances (bulk queryset updates, admin panel).
+
+    Catches, trades, donations, locks and deletions done with `BallInstance.save` and
+    `BallInstance.delete` are applied to the loaded indexes through Tortoise signals.
+
+    Users without a player are remembered for `unregistered_ttl` seconds only, so that their
+    first catch is picked up quickly.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 500,
+        ttl: float = 600,
+        max_age: float = 3600,
+        unregistered_ttl: float = 30,
+    ):
+        self.indexes: TTLCache[int, CollectionIndex] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.unregistered: TTLCache[int, CollectionIndex] = TTLCache(
+            maxsize=maxsize, ttl=unregistered_ttl
+        )
+        self.max_age = max_age
+        self.building: dict[int, asyncio.Task[CollectionIndex]] = {}
+
+    async def build(self, discord_id: int) -> CollectionIndex:
+        t1 = time.perf_counter()
+        player = await Player.get_or_none(discord_id=discord_id)
+        if player is None:
+            return CollectionIndex(None)
+        rows = (
+            await BallInstance.filter(player_id=player.pk)
+            .order_by("id")
+            .values_list(*IndexedBallInstance.FIELDS)
+        )
+        index = CollectionIndex(player.pk, (IndexedBallInstance(*row) for row in rows))
+        log.debug(
+            f"Built collection index of {discord_id} with {len(index)} entries "
+            f"in {round((time.perf_counter() - t1) * 1000)}ms"
+        )
+        return index
+
+    def _store(self, discord_id: int, task: asyncio.Task[CollectionIndex]):
+        self.building.pop(discord_id, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if task.result().player_id is None:
+            self.unregistered[discord_id] = task.result()
+        else:
+            self.indexes[discord_id] = task.result()
+
+    def get_ready(self, discord_id: int) -> CollectionIndex | None:
+        index = self.indexes.get(discord_id)
+        if index is not None and time.monotonic() - index.built_at < self.max_age:
+            # storing again resets the TTL
+            self.indexes[discord_id] = index
+            return index
+        return self.unregistered.get(discord_id)
+
+    def start_build(self, discord_id: int) -> asyncio.Task[CollectionIndex]:
+        """
+        Start building the index of a user in the background, or return the running build.
+        """
+        task = self.building.get(discord_id)
+        if task is None:
+            task = create_background_task(self.build(discord_id))
+            task.add_done_callback(lambda t: self._store(discord_id, t))
+            self.building[discord_id] = task
+        return task
+
+    async def get(self, discord_id: int) -> CollectionIndex:
+        """
+        Return the collection index of a user, building it if needed.
+
+        Concurrent calls for the same user share the same build.
+        """
+        if (index := self.get_ready(discord_id)) is not None:
+            return index
+        return await asyncio.shield(self.start_build(discord_id))
+
+    def get_nowait(self, discord_id: int) -> CollectionIndex | None:
+        """
+        Return the collection index of a user if it is ready. Otherwise, start building it in
+        the background and return `None`.
+        """
+        if (index := self.get_ready(discord_id)) is not None:
+            return index
+        self.start_build(discord_id)
+        return None
+
+    def invalidate(self, discord_id: int):
+        self.indexes.pop(discord_id, None)
+        self.unregistered.pop(discord_id, None)
+
+    def update(self, instance: BallInstance, update_fields: Iterable[str] | None = None):
+        if update_fields is not None and set(update_fields) <= {"locked", "favorite"}:
+            for index in list(self.indexes.values()):
+                if entry := index.entries.get(instance.pk):
+                    entry.locked = instance.locked
+                    entry.favorite = instance.favorite
+            return
+        for index in list(self.indexes.values()):
+            if index.player_id == instance.player_id:
+                index.add(IndexedBallInstance.from_instance(instance))
+            else:
+                index.remove(instance.pk)
+
+    def remove(self, instance: BallInstance):
+        for index in list(self.indexes.values()):
+            index.remove(instance.pk)
+
+
+collection_indexes = CollectionIndexCache()
+
+
+async def on_ballinstance_save(
+    model: Type[BallInstance],
+    instance: BallInstance,
+    created: bool,
+    using_db: "BaseDBAsyncClient | None" = None,
+    update_fields: Iterable[str] | None = None,
+):
+    collection_indexes.update(instance, update_fields)
+
+
+async def on_ballinstance_delete(
+    model: Type[BallInstance], instance: BallInstance, using_db: "BaseDBAsyncClient | None" = None
+):
+    collection_indexes.remove(instance)
+
+
+BallInstance.register_listener(signals.Signals.post_save, on_ballinstance_save)
+BallInstance.register_listener(signals.Signals.post_delete, on_ballinstance_delete)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Iterable, Sequence
+
+from tortoise import timezone
+
+from ballsdex.core.models import LOCK_DURATION, BallInstance
+from ballsdex.core.utils.collection_index import collection_indexes
+
+log = logging.getLogger("ballsdex.core.utils.locks")
+
+__all__ = ("BallLockManager", "ball_locks")
+
+
+class BallLockManager:
+    """
+    Keeps track of the instances locked for a trade or a donation.
+
+    The locks are held in memory, which is authoritative: checking a lock does not query the
+    database, and a lock is visible to other commands as soon as `lock` is called, before the
+    database write completes. The `locked` column is still written, in a single statement for
+    all the given instances, so that autocompletion queries and restarts see the same state.
+
+    A lock expires `LOCK_DURATION` after being taken, the same duration used by the
+    autocompletion filters.
+    """
+
+    def __init__(self):
+        self.locks: dict[int, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self.locks)
+
+    def __contains__(self, pk: int) -> bool:
+        return self.is_locked(pk)
+
+    def is_locked(self, pk: int) -> bool:
+        locked = self.locks.get(pk)
+        if locked is None:
+            return False
+        if locked + LOCK_DURATION > timezone.now():
+            return True
+        del self.locks[pk]
+        return False
+
+    def prune(self):
+        """
+        Remove the expired locks.
+        """
+        limit = timezone.now() - LOCK_DURATION
+        for pk in [pk for pk, locked in self.locks.items() if locked <= limit]:
+            del self.locks[pk]
+
+    async def load(self) -> int:
+        """
+        Load the locks that have not expired yet from the database, replacing the ones in
+        memory. This should only be done on startup.
+        """
+        rows = await BallInstance.filter(
+            locked__isnull=False, locked__gt=timezone.now() - LOCK_DURATION
+        ).values_list("id", "locked")
+        self.locks = dict(rows)
+        return len(self.locks)
+
+    async def lock(self, instances: Sequence[BallInstance]):
+        """
+        Lock the given instances for a trade, or refresh their lock.
+        """
+        if not instances:
+            return
+        self.prune()
+        now = timezone.now()
+        pks = [x.pk for x in instances]
+        for pk in pks:
+            self.locks[pk] = now
+        try:
+            await BallInstance.filter(id__in=pks).update(locked=now)
+        except BaseException:
+            self.forget(pks)
+            raise
+        for instance in instances:
+            instance.locked = now
+            # bulk updates do not send the signals keeping the autocompletion indexes updated
+            collection_indexes.update(instance, ("locked",))
+        log.debug(f"Locked {len(pks)} instances")
+
+    async def unlock(self, instances: Sequence[BallInstance]):
+        """
+        Release the lock of the given instances.
+        """
+        if not instances:
+            return
+        pks = [x.pk for x in instances]
+        self.forget(pks)
+        await BallInstance.filter(id__in=pks).update(locked=None)
+        for instance in instances:
+            instance.locked = None  # type: ignore
+            collection_indexes.update(instance, ("locked",))
+        log.debug(f"Unlocked {len(pks)} instances")
+
+    def forget(self, pks: Iterable[int]):
+        """
+        Release locks in memory only, for instances whose column was already cleared.
+        """
+        for pk in pks:
+            self.locks.pop(pk, None)
+
+
+ball_locks = BallLockManager()
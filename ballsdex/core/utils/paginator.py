@@ -3,14 +3,19 @@
 from __future__ import annotations
 
 import logging
-from typing import TYPE_CHECKING, Any, Dict, Optional
+import math
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence
 
 import discord
+from cachetools import LRUCache
 from discord.ext.commands import Paginator as CommandPaginator
+from tortoise.expressions import Q
 
 from ballsdex.core.utils import menus
 
 if TYPE_CHECKING:
+    from tortoise.queryset import QuerySet
+
     from ballsdex.core.bot import BallsDexBot
 
 log = logging.getLogger("ballsdex.core.utils.paginator")
@@ -337,3 +342,117 @@ class SimplePages(Pages):
     ):
         super().__init__(SimplePageSource(entries, per_page=per_page), interaction=interaction)
         self.embed = discord.Embed(colour=discord.Colour.blurple())
+
+
+class KeysetPageSource(menus.PageSource):
+    """
+    A page source lazily fetching its entries from a queryset, one page at a time.
+
+    Pages are fetched with keyset pagination: the sort key of the last (or first) entry of a
+    known page filters the query of the next (or previous) one, so the cost of a page does not
+    depend on its position. Jumping to a page with no known neighbour falls back to an
+    ``OFFSET`` query, counted from the closest end of the list.
+
+    Subclasses must implement `format_page`, and can override `build_entry` to convert the rows.
+
+    Parameters
+    ----------
+    queryset: QuerySet
+        The filtered queryset, not ordered. Annotations used as sort keys must already be added.
+    ordering: Sequence[tuple[str, bool]]
+        The fields or annotations to sort by, with whether the order is descending. They must
+        not be nullable. The primary key is added as a final ascending tiebreaker if missing.
+    fields: Sequence[str]
+        The fields fetched for each entry with `values_list`.
+    per_page: int
+        The number of entries per page.
+    count: int | None
+        The total number of entries if already known, otherwise it is counted when preparing.
+    """
+
+    def __init__(
+        self,
+        queryset: "QuerySet",
+        ordering: Sequence[tuple[str, bool]],
+        fields: Sequence[str],
+        *,
+        per_page: int,
+        count: int | None = None,
+    ):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        if all(name != "id" for name, _ in ordering):
+            self.ordering.append(("id", False))
+        self.fields = tuple(fields)
+        self.per_page = per_page
+        self.count = count
+        # sort keys of the first and last entry of each page fetched
+        self.first_keys: dict[int, tuple] = {}
+        self.last_keys: dict[int, tuple] = {}
+        self.cache: LRUCache[int, list] = LRUCache(maxsize=8)
+
+    async def prepare(self):
+        if self.count is None:
+            self.count = await self.queryset.count()
+
+    def is_paginating(self) -> bool:
+        return (self.count or 0) > self.per_page
+
+    def get_max_pages(self) -> int:
+        return max(1, math.ceil((self.count or 0) / self.per_page))
+
+    def build_entry(self, row: tuple) -> Any:
+        return row
+
+    def _order_by(self, reverse: bool) -> list[str]:
+        return [f"-{name}" if desc != reverse else name for name, desc in self.ordering]
+
+    def _keyset_filter(self, keys: tuple, after: bool) -> Q:
+        # (a, b, c) > (x, y, z) is expanded as a > x OR (a = x AND b > y) OR ...
+        # as each column may be sorted in a different direction
+        clauses: list[Q] = []
+        for i, ((name, desc), value) in enumerate(zip(self.ordering, keys)):
+            equal = {prev_name: prev for (prev_name, _), prev in zip(self.ordering, keys[:i])}
+            operator = "gt" if after != desc else "lt"
+            clauses.append(Q(**equal, **{f"{name}__{operator}": value}))
+        return Q(*clauses, join_type="OR")
+
+    async def _fetch(
+        self, *, keys: tuple | None = None, after: bool = True, offset: int = 0, limit: int
+    ) -> list[tuple]:
+        queryset = self.queryset
+        if keys is not None:
+            queryset = queryset.filter(self._keyset_filter(keys, after))
+        reverse = not after
+        queryset = queryset.order_by(*self._order_by(reverse)).offset(offset).limit(limit)
+        rows = await queryset.values_list(*self.fields, *(name for name, _ in self.ordering))
+        return rows[::-1] if reverse else rows
+
+    async def get_page(self, page_number: int) -> list:
+        if page_number in self.cache:
+            return self.cache[page_number]
+
+        if page_number - 1 in self.last_keys:
+            rows = await self._fetch(keys=self.last_keys[page_number - 1], limit=self.per_page)
+        elif page_number + 1 in self.first_keys:
+            rows = await self._fetch(
+                keys=self.first_keys[page_number + 1], after=False, limit=self.per_page
+            )
+        elif page_number * 2 < self.get_max_pages():
+            rows = await self._fetch(offset=page_number * self.per_page, limit=self.per_page)
+        else:
+            count = self.count or 0
+            end = min(count, (page_number + 1) * self.per_page)
+            rows = await self._fetch(
+                after=False,
+                offset=count - end,
+                limit=max(0, end - page_number * self.per_page),
+            )
+
+        length = len(self.fields)
+        if rows:
+            self.first_keys[page_number] = tuple(rows[0][length:])
+            self.last_keys[page_number] = tuple(rows[-1][length:])
+        entries = [self.build_entry(tuple(row[:length])) for row in rows]
+        self.cache[page_number] = entries
+        return entries
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Coroutine, TypeVar
+
+from prometheus_client import Histogram
+from tortoise.backends.asyncpg.client import AsyncpgDBClient, TransactionWrapper
+
+from ballsdex.core.metrics import current_call, current_dispatch
+from ballsdex.settings import settings
+
+if TYPE_CHECKING:
+    import discord
+
+log = logging.getLogger("ballsdex.core.utils.queries")
+
+__all__ = (
+    "QueryStats",
+    "QueryBudgetExceeded",
+    "query_budgets",
+    "instrument_queries",
+    "track_interaction",
+    "assert_max_queries",
+    "create_background_task",
+)
+
+T = TypeVar("T")
+
+INSTRUMENTED_METHODS = ("execute_insert", "execute_many", "execute_query", "execute_query_dict")
+
+interaction_queries = Histogram(
+    "interaction_db_queries",
+    "Number of database queries sent per interaction",
+    ["command"],
+    buckets=(0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50, 100, float("inf")),
+)
+interaction_db_time = Histogram(
+    "interaction_db_time", "Time spent in database queries per interaction", ["command"]
+)
+interaction_slowest_query = Histogram(
+    "interaction_db_slowest_query", "Duration of the slowest query per interaction", ["command"]
+)
+
+
+@dataclass
+class QueryStats:
+    """
+    The database queries sent while handling an interaction.
+
+    Attributes
+    ----------
+    name: str
+        The command or component that was used.
+    count: int
+        Number of queries sent.
+    duration: float
+        Total time in seconds spent in queries.
+    slowest: float
+        Duration of the slowest query.
+    slowest_query: str | None
+        The SQL of the slowest query.
+    queries: list[str] | None
+        The SQL of all queries, only kept when not `None` initially.
+    observed: bool
+        The stats were recorded, queries sent afterwards are ignored.
+    """
+
+    name: str
+    count: int = 0
+    duration: float = 0
+    slowest: float = 0
+    slowest_query: str | None = None
+    queries: list[str] | None = field(default=None, repr=False)
+    observed: bool = False
+
+    def add(self, query: str, duration: float):
+        if self.observed:
+            return
+        self.count += 1
+        self.duration += duration
+        if duration >= self.slowest:
+            self.slowest = duration
+            self.slowest_query = query
+        if self.queries is not None:
+            self.queries.append(query)
+
+
+current_queries: ContextVar[QueryStats | None] = ContextVar("current_queries", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised by `assert_max_queries` when more queries than allowed were sent.
+    """
+
+
+@functools.cache
+def query_budgets() -> dict[str, int]:
+    """
+    Maximum number of queries expected for the core interactions, going over it means an
+    N+1 pattern was likely introduced.
+
+    These are the counts measured in the slowest case by `tests/test_query_budgets.py`, update
+    both when a command legitimately needs more queries.
+    """
+    group = settings.players_group_cog_name
+    return {
+        f"{group} list": 3,
+        f"{group} completion": 2,
+        # instance obtained by trade with a special event
+        f"{group} info": 4,
+        # searched in the database until the collection index is built
+        "autocomplete": 1,
+        # first catch, creating the player
+        "catch": 5,
+        "trade confirm": 4,
+    }
+
+
+def _instrument(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    @functools.wraps(method)
+    async def instrumented(self, query: str, *args, **kwargs):
+        stats = current_queries.get()
+        if stats is None:
+            return await method(self, query, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        finally:
+            stats.add(query, time.perf_counter() - start)
+
+    instrumented.__instrumented__ = True  # type: ignore
+    return instrumented
+
+
+def instrument_queries():
+    """
+    Wrap the query methods of the asyncpg client to count the queries sent while a
+    `QueryStats` is active in the current context. Queries sent outside of a tracked
+    interaction are not affected.
+    """
+    for cls in (AsyncpgDBClient, TransactionWrapper):
+        for name in INSTRUMENTED_METHODS:
+            method = cls.__dict__.get(name)
+            if method is None or getattr(method, "__instrumented__", False):
+                continue
+            setattr(cls, name, _instrument(method))
+
+
+def _observe(stats: QueryStats):
+    stats.observed = True
+    interaction_queries.labels(command=stats.name).observe(stats.count)
+    interaction_db_time.labels(command=stats.name).observe(stats.duration)
+    interaction_slowest_query.labels(command=stats.name).observe(stats.slowest)
+    budget = query_budgets().get(stats.name)
+    if budget is not None and stats.count > budget:
+        log.warning(
+            f"{stats.name} sent {stats.count} queries (budget {budget}) in "
+            f"{stats.duration * 1000:.0f}ms, slowest ({stats.slowest * 1000:.0f}ms): "
+            f"{stats.slowest_query}"
+        )
+
+
+def track_interaction(interaction: discord.Interaction, name: str) -> QueryStats:
+    """
+    Count the queries sent until the task handling the interaction completes, then record
+    them under the given name.
+
+    This must be called from the task running the callback, such as an `interaction_check`.
+    """
+    stats = QueryStats(name)
+    current_queries.set(stats)
+    interaction.extras["queries"] = stats
+    if task := asyncio.current_task():
+        task.add_done_callback(lambda _: _observe(stats))
+    return stats
+
+
+def _detach():
+    current_queries.set(None)
+    current_dispatch.set(None)
+    current_call.set(None)
+
+
+def create_background_task(coro: Coroutine[Any, Any, T]) -> asyncio.Task[T]:
+    """
+    Start a task that may outlive the interaction creating it, such as a cache build shared
+    between users.
+
+    Tasks inherit the context of their creator, this one is started without the tracking of the
+    current interaction so its queries and requests are not attributed to it.
+    """
+    context = copy_context()
+    context.run(_detach)
+    return asyncio.create_task(coro, context=context)
+
+
+@contextlib.asynccontextmanager
+async def assert_max_queries(name: str, limit: int | None = None) -> AsyncIterator[QueryStats]:
+    """
+    Fail if the code inside the block sends more queries than the budget of an interaction,
+    for use in tests.
+
+    Example
+    -------
+        async with assert_max_queries("trade confirm"):
+            await menu.confirm(trader)
+
+    Parameters
+    ----------
+    name: str
+        The name of the interaction, as given to `track_interaction`.
+    limit: int | None
+        The maximum number of queries. Defaults to the budget of the interaction.
+
+    Raises
+    ------
+    QueryBudgetExceeded
+        Too many queries were sent, the message lists all of them.
+    """
+    if limit is None:
+        limit = query_budgets()[name]
+    instrument_queries()
+    stats = QueryStats(name, queries=[])
+    token = current_queries.set(stats)
+    try:
+        yield stats
+    finally:
+        current_queries.reset(token)
+    if stats.count > limit:
+        queries = "\n".join(f"- {x}" for x in stats.queries or ())
+        raise QueryBudgetExceeded(f"{name} sent {stats.count} queries, limit {limit}:\n{queries}")
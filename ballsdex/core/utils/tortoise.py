@@ -1,4 +1,7 @@
+from datetime import datetime
+
 from tortoise import Tortoise
+from tortoise.transactions import in_transaction
 
 
 async def row_count_estimate(table_name: str, *, analyze: bool = True) -> int:
@@ -37,3 +40,131 @@ async def row_count_estimate(table_name: str, *, analyze: bool = True) -> int:
         return await row_count_estimate(table_name, analyze=False)  # prevent recursion error
 
     return result
+
+
+async def rebuild_collection_summary(player_id: int | None = None) -> int:
+    """
+    Recompute the `collectionsummary` table from `ballinstance`, also dropping the empty rows.
+
+    Writes to `ballinstance` are blocked while this runs, to avoid counting concurrent changes
+    twice. Prefer passing a player to rebuild when possible.
+
+    Parameters
+    ----------
+    player_id: int | None
+        The database ID of the only player to rebuild. Rebuilds everything if omitted.
+
+    Returns
+    -------
+    int
+        Number of summary rows written.
+    """
+    where = "WHERE player_id = $1" if player_id is not None else ""
+    values = [player_id] if player_id is not None else None
+    async with in_transaction() as connection:
+        await connection.execute_query("LOCK TABLE ballinstance IN SHARE MODE")
+        await connection.execute_query(f"DELETE FROM collectionsummary {where}", values)
+        _, rows = await connection.execute_query(
+            "WITH inserted AS (INSERT INTO collectionsummary "
+            "(player_id, ball_id, shiny, special_id, count, favorite_count) "
+            "SELECT player_id, ball_id, shiny, special_id, COUNT(*), "
+            "COUNT(*) FILTER (WHERE favorite) "
+            f"FROM ballinstance {where} GROUP BY 1, 2, 3, 4 RETURNING 1) "
+            "SELECT COUNT(*) FROM inserted",
+            values,
+        )
+    return rows[0][0]
+
+
+async def check_collection_summary(limit: int = 25) -> list[dict]:
+    """
+    Compare the `collectionsummary` table with the actual content of `ballinstance`.
+
+    Parameters
+    ----------
+    limit: int
+        Maximum number of mismatches returned.
+
+    Returns
+    -------
+    list[dict]
+        The mismatching entries, with `player_id`, `ball_id`, `shiny`, `special_id` and the
+        `count`, `expected_count`, `favorite_count` and `expected_favorite_count` columns.
+        Empty when the table is consistent.
+    """
+    connection = Tortoise.get_connection("default")
+    return await connection.execute_query_dict(
+        "SELECT COALESCE(s.player_id, r.player_id) AS player_id, "
+        "COALESCE(s.ball_id, r.ball_id) AS ball_id, COALESCE(s.shiny, r.shiny) AS shiny, "
+        "COALESCE(s.special_id, r.special_id) AS special_id, "
+        "COALESCE(s.count, 0) AS count, COALESCE(r.count, 0) AS expected_count, "
+        "COALESCE(s.favorite_count, 0) AS favorite_count, "
+        "COALESCE(r.favorite_count, 0) AS expected_favorite_count "
+        "FROM (SELECT * FROM collectionsummary WHERE count <> 0 OR favorite_count <> 0) s "
+        "FULL OUTER JOIN ("
+        "  SELECT player_id, ball_id, shiny, special_id, COUNT(*) AS count, "
+        "  COUNT(*) FILTER (WHERE favorite) AS favorite_count "
+        "  FROM ballinstance GROUP BY 1, 2, 3, 4"
+        ") r ON s.player_id = r.player_id AND s.ball_id = r.ball_id AND s.shiny = r.shiny "
+        "AND s.special_id IS NOT DISTINCT FROM r.special_id "
+        "WHERE COALESCE(s.count, 0) <> COALESCE(r.count, 0) "
+        "OR COALESCE(s.favorite_count, 0) <> COALESCE(r.favorite_count, 0) "
+        "LIMIT $1",
+        [limit],
+    )
+
+
+async def guild_catch_stats(guild_id: int, since: datetime) -> dict:
+    """
+    Count the instances caught in a server since the given date, without fetching them.
+
+    Parameters
+    ----------
+    guild_id: int
+        The Discord ID of the server.
+    since: datetime
+        Only count instances caught after this date.
+
+    Returns
+    -------
+    dict
+        The `count` of instances and the number of distinct `players` who caught them.
+    """
+    connection = Tortoise.get_connection("default")
+    rows = await connection.execute_query_dict(
+        "SELECT COUNT(*) AS count, COUNT(DISTINCT player_id) AS players FROM ballinstance "
+        "WHERE server_id = $1 AND catch_date >= $2",
+        [guild_id, since],
+    )
+    return rows[0]
+
+
+async def player_catch_stats(player_id: int, since: datetime) -> dict:
+    """
+    Count the instances of a player, overall and caught since the given date, without fetching
+    them.
+
+    Parameters
+    ----------
+    player_id: int
+        The database ID of the player.
+    since: datetime
+        The date from which instances are counted in the `recent_*` values.
+
+    Returns
+    -------
+    dict
+        The `recent_count` of instances, the number of distinct balls (`recent_balls`) and
+        servers (`recent_servers`) among them, and the number of distinct `servers` of all
+        the instances of the player.
+    """
+    connection = Tortoise.get_connection("default")
+    rows = await connection.execute_query_dict(
+        "SELECT COUNT(*) FILTER (WHERE catch_date >= $2) AS recent_count, "
+        "COUNT(DISTINCT ball_id) FILTER (WHERE catch_date >= $2) AS recent_balls, "
+        "COUNT(DISTINCT server_id) FILTER (WHERE catch_date >= $2) AS recent_servers, "
+        "COUNT(DISTINCT server_id) AS servers "
+        "FROM ballinstance WHERE player_id = $1",
+        [player_id, since],
+    )
+    return rows[0]
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import logging
+from typing import Sequence
+
+from tortoise.transactions import in_transaction
+
+from ballsdex.core.models import BallInstance, Player, Trade, TradeObject
+from ballsdex.core.utils.collection_index import collection_indexes
+from ballsdex.core.utils.locks import ball_locks
+
+log = logging.getLogger("ballsdex.core.utils.trade_commit")
+
+__all__ = ("TradeConflict", "commit_trade")
+
+
+class TradeConflict(Exception):
+    """
+    Raised when an instance of a trade does not belong to the expected player anymore, or was
+    deleted. Nothing was written when this is raised.
+    """
+
+    def __init__(self, pks: list[int]):
+        super().__init__(f"Instances {pks} changed owner during the trade")
+        self.pks = pks
+
+
+async def commit_trade(
+    player1: Player,
+    player2: Player,
+    proposal1: Sequence[BallInstance],
+    proposal2: Sequence[BallInstance] = (),
+) -> Trade:
+    """
+    Exchange the instances of two players and record the trade, in a single transaction.
+
+    The instances are locked with `SELECT ... FOR UPDATE` and their owners are checked in one
+    query, then the trade objects are inserted in bulk and the instances are updated with a
+    single statement. A donation is a trade where the second proposal is empty.
+
+    Transferred instances lose their favorite status and trade lock, and remember their
+    previous owner in `trade_player`. The given model objects are updated to reflect this.
+
+    Parameters
+    ----------
+    player1: Player
+        The first player, owning the instances of `proposal1`.
+    player2: Player
+        The second player, owning the instances of `proposal2`.
+    proposal1: Sequence[BallInstance]
+        Instances given by the first player to the second.
+    proposal2: Sequence[BallInstance]
+        Instances given by the second player to the first.
+
+    Returns
+    -------
+    Trade
+        The created trade.
+
+    Raises
+    ------
+    TradeConflict
+        One of the instances is not owned by the expected player anymore.
+    """
+    expected = {x.pk: player1.pk for x in proposal1}
+    expected.update((x.pk, player2.pk) for x in proposal2)
+    pks = sorted(expected.keys())
+
+    async with in_transaction() as connection:
+        # rows are locked in a consistent order to avoid deadlocks between concurrent trades
+        _, rows = await connection.execute_query(
+            'SELECT "id", "player_id" FROM "ballinstance" WHERE "id" = ANY($1::int[]) '
+            'ORDER BY "id" FOR UPDATE',
+            [pks],
+        )
+        owners = {row["id"]: row["player_id"] for row in rows}
+        if conflicts := [x for x in pks if owners.get(x) != expected[x]]:
+            raise TradeConflict(conflicts)
+
+        trade = await Trade.create(player1=player1, player2=player2, using_db=connection)
+        await TradeObject.bulk_create(
+            [TradeObject(trade=trade, ballinstance=x, player=player1) for x in proposal1]
+            + [TradeObject(trade=trade, ballinstance=x, player=player2) for x in proposal2],
+            using_db=connection,
+        )
+        # the right side of SET sees the values before the update
+        await connection.execute_query(
+            'UPDATE "ballinstance" SET "trade_player_id" = "player_id", '
+            '"player_id" = CASE WHEN "player_id" = $1 THEN $2 ELSE $1 END, '
+            '"favorite" = FALSE, "locked" = NULL WHERE "id" = ANY($3::int[])',
+            [player1.pk, player2.pk, pks],
+        )
+    ball_locks.forget(pks)
+
+    for instances, old_player, new_player in (
+        (proposal1, player1, player2),
+        (proposal2, player2, player1),
+    ):
+        for instance in instances:
+            instance.trade_player = old_player
+            instance.player = new_player
+            instance.favorite = False
+            instance.locked = None  # type: ignore
+            # bulk updates do not send the signals keeping the autocompletion indexes updated
+            collection_indexes.update(instance)
+
+    log.debug(f"Committed trade {trade.pk} of {len(pks)} instances")
+    return trade
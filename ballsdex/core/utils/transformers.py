@@ -1,26 +1,33 @@
+import asyncio
 import logging
 import time
-from datetime import timedelta
+from datetime import datetime
 from enum import Enum
-from typing import TYPE_CHECKING, Generic, Iterable, Optional, TypeVar
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Generic, Iterable, Optional, TypeVar
 
 import discord
+from cachetools import TTLCache
 from discord import app_commands
 from discord.interactions import Interaction
 from tortoise.exceptions import DoesNotExist
-from tortoise.expressions import Q, RawSQL
+from tortoise.expressions import Q, RawSQL, Subquery
 from tortoise.models import Model
 from tortoise.timezone import now as tortoise_now
 
-from ballsdex.core.models import (
-    Ball,
-    BallInstance,
-    Economy,
-    Regime,
-    Special,
-    balls,
-    economies,
-    regimes,
+from ballsdex.core.models import LOCK_DURATION, Ball, BallInstance, Economy, Regime, Special
+from ballsdex.core.utils.catalog_index import (
+    CatalogIndex,
+    ball_index,
+    economy_index,
+    regime_index,
+    special_index,
+)
+from ballsdex.core.utils.collection_index import (
+    IndexedBallInstance,
+    collection_indexes,
+    is_hex,
+    matches_search,
+    normalize_search,
 )
 from ballsdex.settings import settings
 
@@ -30,6 +37,14 @@ if TYPE_CHECKING:
 log = logging.getLogger("ballsdex.core.utils.transformers")
 T = TypeVar("T", bound=Model)
 
+# search expressions backed by the pg_trgm and prefix indexes of migration 37
+BALL_SEARCH_SQL = "LOWER(\"country\" || ' ' || COALESCE(\"catch_names\", ''))"
+INSTANCE_HEX_SQL = 'to_hex("ballinstance"."id")'
+# Discord does not accept more choices
+MAX_CHOICES = 25
+
+RefineCallback = Callable[[list[app_commands.Choice], str], list[app_commands.Choice]]
+
 __all__ = (
     "BallTransform",
     "BallInstanceTransform",
@@ -58,6 +73,145 @@ class ValidationError(Exception):
         self.message = message
 
 
+def focused_option(options: list[dict[str, Any]]) -> str | None:
+    """
+    Return the name of the option being autocompleted from the raw interaction options,
+    looking into subcommands.
+    """
+    for option in options:
+        if option.get("focused"):
+            return option["name"]
+        if found := focused_option(option.get("options", [])):
+            return found
+    return None
+
+
+class AutocompleteDispatcher:
+    """
+    Runs autocompletion callbacks, avoiding work whose result cannot be used anymore.
+
+    Discord sends one autocomplete interaction per keystroke and only displays the response to
+    the latest one. Calls are grouped by user, command and focused option:
+
+    - when a new call arrives, the previous one still running for the same group is cancelled
+      and answers with no choices
+    - results are kept for a few seconds and reused when the same text and other options are
+      sent again (typing then erasing a character)
+    - for transformers with `substring_match`, a longer text is answered by refining the
+      results of the longest text it starts with, if they were not truncated
+    - a call still running `deadline` seconds after the interaction was created is cancelled,
+      Discord would reject a late response anyway
+
+    Parameters
+    ----------
+    deadline: float
+        Seconds after the creation of the interaction before giving up. Discord allows 3
+        seconds, a margin is kept for sending the response.
+    ttl: float
+        Seconds to keep the results for reuse.
+    """
+
+    def __init__(self, deadline: float = 2.5, ttl: float = 5):
+        self.deadline = deadline
+        self.pending: dict[tuple, asyncio.Task] = {}
+        self.results: TTLCache[tuple, list[app_commands.Choice]] = TTLCache(maxsize=10000, ttl=ttl)
+
+    def get_key(self, interaction: discord.Interaction["BallsDexBot"]) -> tuple:
+        command = interaction.command.qualified_name if interaction.command else None
+        option = focused_option(interaction.data.get("options", []))  # type: ignore
+        # the other options act as filters for some transformers
+        others = tuple(sorted((k, str(v)) for k, v in interaction.namespace if k != option))
+        return (interaction.user.id, command, option, others)
+
+    def get_cached(
+        self,
+        key: tuple,
+        value: str,
+        refine: RefineCallback | None,
+    ) -> list[app_commands.Choice] | None:
+        if (choices := self.results.get((key, value))) is not None:
+            return choices
+        if refine is None:
+            return None
+        for length in range(len(value) - 1, -1, -1):
+            choices = self.results.get((key, value[:length]))
+            # a truncated list may miss matches of the longer text
+            if choices is not None and len(choices) < MAX_CHOICES:
+                choices = refine(choices, value)
+                self.results[(key, value)] = choices
+                return choices
+        return None
+
+    async def dispatch(
+        self,
+        interaction: discord.Interaction["BallsDexBot"],
+        value: str,
+        callback: Callable[[], Awaitable[list[app_commands.Choice]]],
+        *,
+        refine: RefineCallback | None = None,
+    ) -> list[app_commands.Choice]:
+        """
+        Return the choices for a text, from the cache or by running the callback.
+
+        Parameters
+        ----------
+        interaction: discord.Interaction
+            The autocomplete interaction.
+        value: str
+            The normalized text, used as the cache key.
+        callback: Callable[[], Awaitable[list[app_commands.Choice]]]
+            Searches the choices.
+        refine: RefineCallback | None
+            Selects the choices of a normalized text among the complete choices of a text it
+            starts with. Prefix results are not reused if omitted.
+        """
+        key = self.get_key(interaction)
+        if (choices := self.get_cached(key, value, refine)) is not None:
+            return choices
+
+        if (previous := self.pending.get(key)) and not previous.done():
+            previous.cancel()
+        elapsed = datetime.now(tz=interaction.created_at.tzinfo) - interaction.created_at
+        timeout = self.deadline - elapsed.total_seconds()
+        if timeout <= 0:
+            return []
+
+        task = asyncio.create_task(callback())
+        self.pending[key] = task
+        try:
+            choices = await asyncio.wait_for(task, timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning(f"Autocompletion for {key[1]} ({key[2]}) exceeded the deadline.")
+            return []
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                raise
+            # superseded by a newer call
+            return []
+        finally:
+            if self.pending.get(key) is task:
+                del self.pending[key]
+        self.results[(key, value)] = choices
+        return choices
+
+
+autocomplete_dispatcher = AutocompleteDispatcher()
+
+
+class InstanceChoice(app_commands.Choice[str]):
+    """
+    A ball instance choice remembering its ball, to match it against longer texts without
+    searching again.
+    """
+
+    __slots__ = ("ball_id",)
+
+    def __init__(self, *, name: str, value: str, ball_id: int):
+        super().__init__(name=name, value=value)
+        self.ball_id = ball_id
+
+
 class ModelTransformer(app_commands.Transformer, Generic[T]):
     """
     Base abstract class for autocompletion from on Tortoise models
@@ -72,6 +226,9 @@ class ModelTransformer(app_commands.Transformer, Generic[T]):
 
     name: str
     model: T
+    # every result of a normalized text is also a result of the texts it starts with, the
+    # autocompletion of longer texts is then refined from the results of shorter ones
+    substring_match: bool = False
 
     def key(self, model: T) -> str:
         """
@@ -109,12 +266,34 @@ class ModelTransformer(app_commands.Transformer, Generic[T]):
         """
         raise NotImplementedError()
 
+    def normalize(self, value: str) -> str:
+        """
+        Return the text as understood by the search. Texts normalized the same way share their
+        autocompletion results.
+        """
+        return value.strip().lower()
+
+    def refine_choices(
+        self, choices: list[app_commands.Choice], value: str
+    ) -> list[app_commands.Choice]:
+        """
+        Return the choices matching a normalized text, among the complete results of a text it
+        starts with. Must be implemented when `substring_match` is set, with the same result
+        as a new search.
+        """
+        raise NotImplementedError()
+
     async def autocomplete(
         self, interaction: Interaction["BallsDexBot"], value: str
     ) -> list[app_commands.Choice[int]]:
         t1 = time.time()
         choices: list[app_commands.Choice[int]] = []
-        for option in await self.get_options(interaction, value):
+        for option in await autocomplete_dispatcher.dispatch(
+            interaction,
+            self.normalize(value),
+            lambda: self.get_options(interaction, value),
+            refine=self.refine_choices if self.substring_match else None,
+        ):
             choices.append(option)
         t2 = time.time()
         log.debug(
@@ -149,6 +328,7 @@ class ModelTransformer(app_commands.Transformer, Generic[T]):
 class BallInstanceTransformer(ModelTransformer[BallInstance]):
     name = settings.collectible_name
     model = BallInstance  # type: ignore
+    substring_match = True
 
     async def get_from_pk(self, value: int) -> BallInstance:
         return await self.model.get(pk=value).prefetch_related("player")
@@ -156,113 +336,166 @@ class BallInstanceTransformer(ModelTransformer[BallInstance]):
     async def validate(self, interaction: discord.Interaction["BallsDexBot"], item: BallInstance):
         # checking if the ball does belong to user, and a custom ID wasn't forced
         if item.player.discord_id != interaction.user.id:
+            # the suggestion may come from an outdated index
+            collection_indexes.invalidate(interaction.user.id)
             raise ValidationError(f"That {settings.collectible_name} doesn't belong to you.")
 
+    async def search_database(
+        self,
+        discord_id: int,
+        value: str,
+        special_id: int | None,
+        shiny: bool | None,
+        trade_type: TradeCommandType | None,
+    ) -> list[IndexedBallInstance]:
+        """
+        Search instances with a database query, used until the collection index is ready.
+
+        The expressions must stay identical to the ones indexed in migration 37.
+        """
+        queryset = BallInstance.filter(player__discord_id=discord_id)
+        if special_id is not None:
+            queryset = queryset.filter(special_id=special_id)
+        if shiny:
+            queryset = queryset.filter(shiny=shiny)
+        if trade_type == TradeCommandType.PICK:
+            queryset = queryset.filter(
+                Q(locked__isnull=True) | Q(locked__lt=tortoise_now() - LOCK_DURATION)
+            )
+        elif trade_type == TradeCommandType.REMOVE:
+            queryset = queryset.filter(
+                locked__isnull=False, locked__gt=tortoise_now() - LOCK_DURATION
+            )
+
+        value = normalize_search(value)
+        if value:
+            matching_balls = (
+                Ball.annotate(searchable=RawSQL(BALL_SEARCH_SQL))
+                .filter(searchable__contains=value)
+                .values("id")
+            )
+            search = Q(ball_id__in=Subquery(matching_balls))
+            if is_hex(value):
+                queryset = queryset.annotate(hex_id=RawSQL(INSTANCE_HEX_SQL))
+                search |= Q(hex_id__startswith=value)
+            queryset = queryset.filter(search)
+
+        rows = await queryset.limit(MAX_CHOICES).values_list(*IndexedBallInstance.FIELDS)
+        return [IndexedBallInstance(*row) for row in rows]
+
+    def normalize(self, value: str) -> str:
+        return normalize_search(value)
+
+    def refine_choices(
+        self, choices: list[app_commands.Choice], value: str
+    ) -> list[app_commands.Choice]:
+        return [
+            x
+            for x in choices
+            if isinstance(x, InstanceChoice) and matches_search(int(x.value), x.ball_id, value)
+        ]
+
     async def get_options(
         self, interaction: Interaction["BallsDexBot"], value: str
     ) -> list[app_commands.Choice[int]]:
-        balls_queryset = BallInstance.filter(player__discord_id=interaction.user.id)
-
+        special_id: int | None = None
         if (special := getattr(interaction.namespace, "special", None)) and special.isdigit():
-            balls_queryset = balls_queryset.filter(special_id=int(special))
-        if (shiny := getattr(interaction.namespace, "shiny", None)) and shiny is not None:
-            balls_queryset = balls_queryset.filter(shiny=shiny)
-
-        if interaction.command and (trade_type := interaction.command.extras.get("trade", None)):
-            if trade_type == TradeCommandType.PICK:
-                balls_queryset = balls_queryset.filter(
-                    Q(
-                        Q(locked__isnull=True)
-                        | Q(locked__lt=tortoise_now() - timedelta(minutes=30))
-                    )
-                )
-            else:
-                balls_queryset = balls_queryset.filter(
-                    locked__isnull=False, locked__gt=tortoise_now() - timedelta(minutes=30)
-                )
-        balls_queryset = (
-            balls_queryset.select_related("ball")
-            .annotate(
-                searchable=RawSQL(
-                    "to_hex(ballinstance.id) || ' ' || ballinstance__ball.country || "
-                    "' ' || ballinstance__ball.catch_names"
-                )
+            special_id = int(special)
+        shiny: bool | None = getattr(interaction.namespace, "shiny", None)
+        trade_type: TradeCommandType | None = None
+        if interaction.command:
+            trade_type = interaction.command.extras.get("trade", None)
+
+        # served from an in-memory index of the user's collection, see collection_index.py
+        # building it takes a moment for large collections, the database is used meanwhile
+        index = collection_indexes.get_nowait(interaction.user.id)
+        if index is None:
+            entries: Iterable[IndexedBallInstance] = await self.search_database(
+                interaction.user.id, value, special_id, shiny, trade_type
             )
-            .filter(searchable__icontains=value.replace(".", ""))
-            .limit(25)
-        )
+        else:
+            entries = index.search(value)
+
+        filters: list[Callable[[IndexedBallInstance], bool]] = []
+        if special_id is not None:
+            filters.append(lambda x: x.special_id == special_id)
+        if shiny:
+            filters.append(lambda x: x.shiny == shiny)
+        if trade_type == TradeCommandType.PICK:
+            filters.append(lambda x: not x.is_locked)
+        elif trade_type == TradeCommandType.REMOVE:
+            filters.append(lambda x: x.is_locked)
 
-        choices: list[app_commands.Choice] = [
-            app_commands.Choice(name=x.description(bot=interaction.client), value=str(x.pk))
-            for x in await balls_queryset
-        ]
+        choices: list[app_commands.Choice] = []
+        for entry in entries:
+            if all(check(entry) for check in filters):
+                choices.append(
+                    InstanceChoice(
+                        name=entry.description(bot=interaction.client),
+                        value=str(entry.pk),
+                        ball_id=entry.ball_id,
+                    )
+                )
+                if len(choices) == MAX_CHOICES:
+                    break
         return choices
 
 
-class TTLModelTransformer(ModelTransformer[T]):
+class CatalogTransformer(ModelTransformer[T]):
     """
-    Base class for simple Tortoise model autocompletion with TTL cache.
+    Base class for the autocompletion of cached catalog models, served from their shared
+    `CatalogIndex`.
 
     This is used in most cases except for BallInstance which requires special handling depending
     on the interaction passed.
 
     Attributes
     ----------
-    ttl: float
-        Delay in seconds for `items` to live until refreshed with `load_items`, defaults to 300
+    index: CatalogIndex[T]
+        The search index of the model's cache.
     """
 
-    ttl: float = 300
+    index: CatalogIndex[T]
+    substring_match = True
 
-    def __init__(self):
-        self.items: dict[int, T] = {}
-        self.search_map: dict[T, str] = {}
-        self.last_refresh: float = 0
-        log.debug(f"Inited transformer for {self.name}")
+    def key(self, model: T) -> str:
+        return self.index.key(model)
 
-    async def load_items(self) -> Iterable[T]:
+    def filter(self, item: T) -> bool:
         """
-        Query values to fill `items` with.
+        Return whether the item can be suggested, all of them by default.
         """
-        return await self.model.all()
-
-    async def maybe_refresh(self):
-        t = time.time()
-        if t - self.last_refresh > self.ttl:
-            self.items = {x.pk: x for x in await self.load_items()}
-            self.last_refresh = t
-            self.search_map = {x: self.key(x).lower() for x in self.items.values()}
+        return True
 
     async def get_options(
         self, interaction: Interaction["BallsDexBot"], value: str
     ) -> list[app_commands.Choice[str]]:
-        await self.maybe_refresh()
-
-        i = 0
         choices: list[app_commands.Choice] = []
-        for item in self.items.values():
-            if value.lower() in self.search_map[item]:
-                choices.append(app_commands.Choice(name=self.key(item), value=str(item.pk)))
-                i += 1
-                if i == 25:
-                    break
+        for item in self.index.search(value, self.filter):
+            choices.append(app_commands.Choice(name=self.key(item), value=str(item.pk)))
+            if len(choices) == MAX_CHOICES:
+                break
         return choices
 
+    def refine_choices(
+        self, choices: list[app_commands.Choice], value: str
+    ) -> list[app_commands.Choice]:
+        matches = [x for x in choices if value in x.name.lower()]
+        # same order as the index: names starting with the text first, alphabetically
+        return sorted(
+            matches, key=lambda x: (not x.name.lower().startswith(value), x.name.lower())
+        )
+
 
-class BallTransformer(TTLModelTransformer[Ball]):
+class BallTransformer(CatalogTransformer[Ball]):
     name = settings.collectible_name
     model = Ball()
-
-    def key(self, model: Ball) -> str:
-        return model.country
-
-    async def load_items(self) -> Iterable[Ball]:
-        return balls.values()
+    index = ball_index
 
 
 class BallEnabledTransformer(BallTransformer):
-    async def load_items(self) -> Iterable[Ball]:
-        return {k: v for k, v in balls.items() if v.enabled}.values()
+    def filter(self, item: Ball) -> bool:
+        return item.enabled
 
     async def transform(
         self, interaction: discord.Interaction["BallsDexBot"], value: str
@@ -279,39 +512,27 @@ class BallEnabledTransformer(BallTransformer):
             return None
 
 
-class SpecialTransformer(TTLModelTransformer[Special]):
+class SpecialTransformer(CatalogTransformer[Special]):
     name = "special event"
     model = Special()
-
-    def key(self, model: Special) -> str:
-        return model.name
+    index = special_index
 
 
 class SpecialEnabledTransformer(SpecialTransformer):
-    async def load_items(self) -> Iterable[Special]:
-        return await Special.filter(hidden=False).all()
+    def filter(self, item: Special) -> bool:
+        return not item.hidden
 
 
-class RegimeTransformer(TTLModelTransformer[Regime]):
+class RegimeTransformer(CatalogTransformer[Regime]):
     name = "regime"
     model = Regime()
+    index = regime_index
 
-    def key(self, model: Regime) -> str:
-        return model.name
 
-    async def load_items(self) -> Iterable[Regime]:
-        return regimes.values()
-
-
-class EconomyTransformer(TTLModelTransformer[Economy]):
+class EconomyTransformer(CatalogTransformer[Economy]):
     name = "economy"
     model = Economy()
-
-    def key(self, model: Economy) -> str:
-        return model.name
-
-    async def load_items(self) -> Iterable[Economy]:
-        return economies.values()
+    index = economy_index
 
 
 BallTransform = app_commands.Transform[Ball, BallTransformer]
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+import discord
+from cachetools import TTLCache
+
+from ballsdex.core.utils.queries import create_background_task
+
+if TYPE_CHECKING:
+    from ballsdex.core.bot import BallsDexBot
+
+log = logging.getLogger("ballsdex.core.utils.users")
+
+__all__ = ("UserResolver",)
+
+
+class UserResolver:
+    """
+    Resolves Discord users from their ID for display purposes, avoiding the heavily
+    rate-limited `fetch_user` REST call whenever possible.
+
+    Users are looked up in this order:
+
+    - the gateway cache of the bot
+    - a bounded cache of the users fetched recently, also remembering unknown IDs
+    - a REST call, with a limited number of calls running at the same time
+
+    Concurrent lookups of the same user share the same REST call.
+
+    Parameters
+    ----------
+    bot: BallsDexBot
+        The bot used for lookups.
+    maxsize: int
+        Maximum number of fetched users kept in memory.
+    ttl: float
+        Time in seconds after which a fetched user is fetched again, to pick up name changes.
+    concurrency: int
+        Maximum number of REST calls running at the same time.
+    """
+
+    def __init__(
+        self, bot: "BallsDexBot", maxsize: int = 5000, ttl: float = 3600, concurrency: int = 4
+    ):
+        self.bot = bot
+        self.users: TTLCache[int, discord.User] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.missing: TTLCache[int, discord.NotFound] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending: dict[int, asyncio.Task[discord.User]] = {}
+
+    def get(self, user_id: int) -> discord.User | None:
+        """
+        Return a user if it is cached, without making any request.
+        """
+        return self.bot.get_user(user_id) or self.users.get(user_id)
+
+    async def _fetch(self, user_id: int) -> discord.User:
+        try:
+            async with self.semaphore:
+                user = await self.bot.fetch_user(user_id)
+        except discord.NotFound as e:
+            self.missing[user_id] = e
+            raise
+        self.users[user_id] = user
+        return user
+
+    def _done(self, user_id: int, task: asyncio.Task[discord.User]):
+        self.pending.pop(user_id, None)
+        # retrieve the exception to avoid warnings if all the waiters were cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch(self, user_id: int) -> discord.User:
+        """
+        Return a user, fetching it if it is not cached.
+
+        Raises
+        ------
+        discord.NotFound
+            The user does not exist.
+        discord.HTTPException
+            Fetching the user failed.
+        """
+        if user := self.get(user_id):
+            return user
+        if error := self.missing.get(user_id):
+            raise error
+        task = self.pending.get(user_id)
+        if task is None:
+            task = create_background_task(self._fetch(user_id))
+            task.add_done_callback(lambda t: self._done(user_id, t))
+            self.pending[user_id] = task
+        return await asyncio.shield(task)
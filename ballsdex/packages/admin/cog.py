@@ -1,4 +1,3 @@
-import asyncio
 import datetime
 import logging
 import random
@@ -14,6 +13,7 @@ from discord.ui import Button
 from discord.utils import format_dt
 from tortoise.exceptions import BaseORMException, DoesNotExist, IntegrityError
 from tortoise.expressions import Q
+from tortoise.timezone import now as tortoise_now
 
 from ballsdex.core.models import (
     Ball,
@@ -21,16 +21,19 @@ from ballsdex.core.models import (
     BlacklistedGuild,
     BlacklistedID,
     BlacklistHistory,
+    CollectionSummary,
     GuildConfig,
     Player,
     Trade,
     TradeObject,
     balls,
 )
+from ballsdex.core.utils.bulk import delete_instances, transfer_instances
 from ballsdex.core.utils.buttons import ConfirmChoiceView
 from ballsdex.core.utils.enums import DONATION_POLICY_MAP, PRIVATE_POLICY_MAP
 from ballsdex.core.utils.logging import log_action
 from ballsdex.core.utils.paginator import FieldPageSource, Pages, TextPageSource
+from ballsdex.core.utils.tortoise import guild_catch_stats, player_catch_stats
 from ballsdex.core.utils.transformers import (
     BallTransform,
     EconomyTransform,
@@ -38,6 +41,7 @@ from ballsdex.core.utils.transformers import (
     SpecialTransform,
 )
 from ballsdex.packages.admin.menu import BlacklistViewFormat
+from ballsdex.packages.countryballs.bomb import spawn_bomb
 from ballsdex.packages.countryballs.countryball import CountryBall
 from ballsdex.packages.trade.display import TradeViewFormat, fill_trade_embed_fields
 from ballsdex.packages.trade.trade_user import TradingUser
@@ -350,9 +354,10 @@ class Admin(commands.GroupCog):
                 )
             return
 
+        configs = await GuildConfig.get_many(x.id for x in guilds)
         entries: list[tuple[str, str]] = []
         for guild in guilds:
-            if config := await GuildConfig.get_or_none(guild_id=guild.id):
+            if config := configs.get(guild.id):
                 spawn_enabled = config.enabled and config.guild_id
             else:
                 spawn_enabled = False
@@ -405,59 +410,6 @@ class Admin(commands.GroupCog):
         )
         await pages.start(ephemeral=True)
 
-    async def _spawn_bomb(
-        self,
-        interaction: discord.Interaction,
-        countryball: Ball | None,
-        channel: discord.TextChannel,
-        n: int,
-    ):
-        spawned = 0
-
-        async def update_message_loop():
-            nonlocal spawned
-            for i in range(5 * 12 * 10):  # timeout progress after 10 minutes
-                await interaction.followup.edit_message(
-                    "@original",  # type: ignore
-                    content=f"Spawn bomb in progress in {channel.mention}, "
-                    f"{settings.collectible_name.title()}: {countryball or 'Random'}\n"
-                    f"{spawned}/{n} spawned ({round((spawned / n) * 100)}%)",
-                )
-                await asyncio.sleep(5)
-            await interaction.followup.edit_message(
-                "@original", content="Spawn bomb seems to have timed out."  # type: ignore
-            )
-
-        await interaction.response.send_message(
-            f"Starting spawn bomb in {channel.mention}...", ephemeral=True
-        )
-        task = self.bot.loop.create_task(update_message_loop())
-        try:
-            for i in range(n):
-                if not countryball:
-                    ball = await CountryBall.get_random()
-                else:
-                    ball = CountryBall(countryball)
-                result = await ball.spawn(channel)
-                if not result:
-                    task.cancel()
-                    await interaction.followup.edit_message(
-                        "@original",  # type: ignore
-                        content=f"A {settings.collectible_name} failed to spawn, probably "
-                        "indicating a lack of permissions to send messages "
-                        f"or upload files in {channel.mention}.",
-                    )
-                    return
-                spawned += 1
-            task.cancel()
-            await interaction.followup.edit_message(
-                "@original",  # type: ignore
-                content=f"Successfully spawned {spawned} {settings.plural_collectible_name} "
-                f"in {channel.mention}!",
-            )
-        finally:
-            task.cancel()
-
     @balls.command()
     @app_commands.checks.has_any_role(*settings.root_role_ids)
     async def spawn(
@@ -489,26 +441,24 @@ class Admin(commands.GroupCog):
             amount = 100
         elif amount % 1 != 0:
             amount = int(amount)
+        if amount > 1:
+            bomb = await spawn_bomb(
+                interaction, channel or interaction.channel, amount, ball  # type: ignore
+            )
+            await log_action(
+                f"{interaction.user} spawned {bomb.spawned} {settings.plural_collectible_name} "
+                f"({ball or 'random'}) in {channel or interaction.channel}.",
+                self.bot,
+            )
+            return
         if not ball:
             countryball = await CountryBall.get_random()
         else:
             countryball = CountryBall(ball)
-        i: int = 0
-        while i < amount:
-            await countryball.spawn(channel or interaction.channel)  # type: ignore
-            if not ball:
-                countryball = await CountryBall.get_random()
-            else:
-                countryball = CountryBall(ball)
-            i += 1
-        if amount == 1:
-            await interaction.followup.send(
-                f"{settings.collectible_name.title()} spawned.", ephemeral=True
-            )
-        else:
-            await interaction.followup.send(
-                f"{amount} balls spawned.", ephemeral=True
-            )
+        await countryball.spawn(channel or interaction.channel)  # type: ignore
+        await interaction.followup.send(
+            f"{settings.collectible_name.title()} spawned.", ephemeral=True
+        )
         await log_action(
             f"{interaction.user} spawned {settings.collectible_name} {countryball.name} "
             f"in {channel or interaction.channel}.",
@@ -688,7 +638,7 @@ class Admin(commands.GroupCog):
                 id_type="user",
                 action_type="unblacklist",
             )
-            self.bot.blacklist.remove(user.id)
+            self.bot.blacklist.discard(user.id)
             await interaction.response.send_message(
                 "User is now removed from blacklist.", ephemeral=True
             )
@@ -742,7 +692,7 @@ class Admin(commands.GroupCog):
         else:
             if blacklisted.moderator_id:
                 moderator_msg = (
-                    f"Moderator: {await self.bot.fetch_user(blacklisted.moderator_id)}"
+                    f"Moderator: {await self.bot.user_resolver.fetch(blacklisted.moderator_id)}"
                     f" ({blacklisted.moderator_id})"
                 )
             else:
@@ -896,7 +846,7 @@ class Admin(commands.GroupCog):
                 id_type="guild",
                 action_type="unblacklist",
             )
-            self.bot.blacklist_guild.remove(guild.id)
+            self.bot.blacklist_guild.discard(guild.id)
             await interaction.response.send_message(
                 "Guild is now removed from blacklist.", ephemeral=True
             )
@@ -943,7 +893,7 @@ class Admin(commands.GroupCog):
         else:
             if blacklisted.moderator_id:
                 moderator_msg = (
-                    f"Moderator: {await self.bot.fetch_user(blacklisted.moderator_id)}"
+                    f"Moderator: {await self.bot.user_resolver.fetch(blacklisted.moderator_id)}"
                     f"({blacklisted.moderator_id})"
                 )
             else:
@@ -1089,10 +1039,87 @@ class Admin(commands.GroupCog):
             self.bot,
         )
 
+    @balls.command(name="transfer_all")
+    @app_commands.checks.has_any_role(*settings.root_role_ids)
+    async def balls_transfer_all(
+        self,
+        interaction: discord.Interaction,
+        user: discord.User,
+        new_user: discord.User,
+        countryball: BallTransform | None = None,
+        dry_run: bool = False,
+    ):
+        """
+        Transfer all balls of a user to another one.
+
+        Parameters
+        ----------
+        user: discord.User
+            The user you want to take the balls from.
+        new_user: discord.User
+            The user you want to give the balls to.
+        countryball: Ball | None
+            Only transfer the balls of this countryball.
+        dry_run: bool
+            Only show how many balls would be transferred.
+        """
+        # the transformers triggered a response, meaning user tried an incorrect input
+        if interaction.response.is_done():
+            return
+        if user.id == new_user.id:
+            await interaction.response.send_message(
+                "You cannot transfer balls to the same user.", ephemeral=True
+            )
+            return
+        player = await Player.get_or_none(discord_id=user.id)
+        if not player:
+            await interaction.response.send_message(
+                "The user you gave does not exist.", ephemeral=True
+            )
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        if dry_run:
+            count = await transfer_instances(
+                player, Player(discord_id=new_user.id), ball=countryball, dry_run=True
+            )
+            await interaction.followup.send(
+                f"{count} {settings.plural_collectible_name} from {user} would be transferred "
+                f"to {new_user}.",
+                ephemeral=True,
+            )
+            return
+
+        view = ConfirmChoiceView(interaction)
+        await interaction.followup.send(
+            f"Are you sure you want to transfer {user}'s {settings.plural_collectible_name} "
+            f"to {new_user}?",
+            view=view,
+            ephemeral=True,
+        )
+        await view.wait()
+        if not view.value:
+            return
+        new_player, _ = await Player.get_or_create(discord_id=new_user.id)
+        count = await transfer_instances(player, new_player, ball=countryball)
+        await interaction.followup.send(
+            f"Transferred {count} {settings.plural_collectible_name} from {user} to {new_user}.",
+            ephemeral=True,
+        )
+        await log_action(
+            f"{interaction.user} transferred {count} {settings.plural_collectible_name} "
+            f"from {user} to {new_user}"
+            f"{f' (only {countryball.country})' if countryball else ''}.",
+            self.bot,
+        )
+
     @balls.command(name="reset")
     @app_commands.checks.has_any_role(*settings.root_role_ids)
     async def balls_reset(
-        self, interaction: discord.Interaction, user: discord.User, percentage: int | None = None
+        self,
+        interaction: discord.Interaction,
+        user: discord.User,
+        percentage: int | None = None,
+        dry_run: bool = False,
     ):
         """
         Reset a player's balls.
@@ -1103,6 +1130,8 @@ class Admin(commands.GroupCog):
             The user you want to reset the balls of.
         percentage: int | None
             The percentage of balls to delete, if not all. Used for sanctions.
+        dry_run: bool
+            Only show how many balls would be deleted.
         """
         player = await Player.get(discord_id=user.id)
         if not player:
@@ -1117,6 +1146,13 @@ class Admin(commands.GroupCog):
             return
         await interaction.response.defer(ephemeral=True, thinking=True)
 
+        if dry_run:
+            count = await delete_instances(player, percentage, dry_run=True)
+            await interaction.followup.send(
+                f"{count} {settings.plural_collectible_name} from {user} would be deleted.",
+                ephemeral=True,
+            )
+            return
         if not percentage:
             text = f"Are you sure you want to delete {user}'s {settings.plural_collectible_name}?"
         else:
@@ -1133,14 +1169,7 @@ class Admin(commands.GroupCog):
         await view.wait()
         if not view.value:
             return
-        if percentage:
-            balls = await BallInstance.filter(player=player)
-            to_delete = random.sample(balls, int(len(balls) * (percentage / 100)))
-            for ball in to_delete:
-                await ball.delete()
-            count = len(to_delete)
-        else:
-            count = await BallInstance.filter(player=player).delete()
+        count = await delete_instances(player, percentage)
         await interaction.followup.send(
             f"{count} {settings.plural_collectible_name} from {user} have been deleted.",
             ephemeral=True,
@@ -1321,7 +1350,7 @@ class Admin(commands.GroupCog):
             files = [await collection_card.to_file()]
             if wild_card:
                 files.append(await wild_card.to_file())
-            await self.bot.load_cache()
+            await self.bot.load_cache(incremental=True)
             await interaction.followup.send(
                 f"Successfully created a {settings.collectible_name} with ID {ball.pk}! "
                 "The internal cache was reloaded.\n"
@@ -1434,10 +1463,8 @@ class Admin(commands.GroupCog):
             start_date = end_date - datetime.timedelta(days=days)
             queryset = queryset.filter(date__range=(start_date, end_date))
 
-        queryset = queryset.order_by(sorting.value).prefetch_related("player1", "player2")
-        history = await queryset
-
-        if not history:
+        count = await queryset.count()
+        if not count:
             await interaction.followup.send("No history found.", ephemeral=True)
             return
 
@@ -1446,7 +1473,14 @@ class Admin(commands.GroupCog):
                 f"History of {user.display_name} and {user2.display_name}:"
             )
 
-        source = TradeViewFormat(history, user.display_name, self.bot, True)
+        source = TradeViewFormat(
+            queryset,
+            user.display_name,
+            self.bot,
+            True,
+            descending=sorting.value == "-date",
+            count=count,
+        )
         pages = Pages(source=source, interaction=interaction)
         await pages.start(ephemeral=True)
 
@@ -1509,13 +1543,19 @@ class Admin(commands.GroupCog):
             queryset = queryset.filter(
                 tradeobjects__ballinstance_id=pk, date__range=(start_date, end_date)
             )
-        trades = await queryset.order_by(sorting.value).prefetch_related("player1", "player2")
-
-        if not trades:
+        count = await queryset.count()
+        if not count:
             await interaction.followup.send("No history found.", ephemeral=True)
             return
 
-        source = TradeViewFormat(trades, f"{settings.collectible_name} {ball}", self.bot, True)
+        source = TradeViewFormat(
+            queryset,
+            f"{settings.collectible_name} {ball}",
+            self.bot,
+            True,
+            descending=sorting.value == "-date",
+            count=count,
+        )
         pages = Pages(source=source, interaction=interaction)
         await pages.start(ephemeral=True)
 
@@ -1602,12 +1642,9 @@ class Admin(commands.GroupCog):
         else:
             spawn_enabled = False
 
-        total_server_balls = await BallInstance.filter(
-            catch_date__gte=datetime.datetime.now() - datetime.timedelta(days=days),
-            server_id=guild.id,
-        ).prefetch_related("player")
+        stats = await guild_catch_stats(guild.id, tortoise_now() - datetime.timedelta(days=days))
         if guild.owner_id:
-            owner = await self.bot.fetch_user(guild.owner_id)
+            owner = await self.bot.user_resolver.fetch(guild.owner_id)
             embed = discord.Embed(
                 title=f"{guild.name} ({guild.id})",
                 description=f"**Owner:** {owner} ({guild.owner_id})",
@@ -1623,11 +1660,11 @@ class Admin(commands.GroupCog):
         embed.add_field(name="Created at:", value=format_dt(guild.created_at, style="F"))
         embed.add_field(
             name=f"{settings.plural_collectible_name.title()} caught ({days} days):",
-            value=len(total_server_balls),
+            value=stats["count"],
         )
         embed.add_field(
             name=f"Amount of users who caught\n{settings.plural_collectible_name} ({days} days):",
-            value=len(set([x.player.discord_id for x in total_server_balls])),
+            value=stats["players"],
         )
         embed.set_thumbnail(url=guild.icon.url)  # type: ignore
         await interaction.followup.send(embed=embed, ephemeral=True)
@@ -1654,10 +1691,7 @@ class Admin(commands.GroupCog):
         if not player:
             await interaction.followup.send("The user you gave does not exist.", ephemeral=True)
             return
-        total_user_balls = await BallInstance.filter(
-            catch_date__gte=datetime.datetime.now() - datetime.timedelta(days=days),
-            player=player,
-        )
+        stats = await player_catch_stats(player.pk, tortoise_now() - datetime.timedelta(days=days))
         embed = discord.Embed(
             title=f"{user} ({user.id})",
             description=(
@@ -1668,27 +1702,27 @@ class Admin(commands.GroupCog):
         )
         embed.add_field(
             name=f"{settings.plural_collectible_name.title()} caught ({days} days):",
-            value=len(total_user_balls),
+            value=stats["recent_count"],
         )
         embed.add_field(
             name=f"Unique {settings.plural_collectible_name} caught ({days} days):",
-            value=len(set(total_user_balls)),
+            value=stats["recent_balls"],
         )
         embed.add_field(
             name=f"Total servers with {settings.plural_collectible_name} caught ({days} days):",
-            value=len(set([x.server_id for x in total_user_balls])),
+            value=stats["recent_servers"],
         )
         embed.add_field(
             name=f"Total {settings.plural_collectible_name} caught:",
-            value=await BallInstance.filter(player__discord_id=user.id).count(),
+            value=await CollectionSummary.get_total(player.pk),
         )
         embed.add_field(
             name=f"Total unique {settings.plural_collectible_name} caught:",
-            value=len(set([x.countryball for x in total_user_balls])),
+            value=len(await CollectionSummary.get_owned_ball_ids(player.pk)),
         )
         embed.add_field(
             name=f"Total servers with {settings.plural_collectible_name} caught:",
-            value=len(set([x.server_id for x in total_user_balls])),
+            value=stats["servers"],
         )
         embed.set_thumbnail(url=user.display_avatar)  # type: ignore
         await interaction.followup.send(embed=embed, ephemeral=True)
@@ -24,7 +24,7 @@ class BlacklistViewFormat(menus.ListPageSource):
             timestamp=blacklist.date,
         )
         if blacklist.moderator_id:
-            moderator = await self.bot.fetch_user(blacklist.moderator_id)
+            moderator = await self.bot.user_resolver.fetch(blacklist.moderator_id)
             embed.add_field(
                 name=(
                     "Blacklisted by"
@@ -1,6 +1,5 @@
 import enum
 import logging
-from collections import defaultdict
 from typing import TYPE_CHECKING, Union
 
 import discord
@@ -8,25 +7,32 @@ from discord import app_commands
 from discord.ext import commands
 from discord.ui import Button, View, button
 from tortoise.exceptions import DoesNotExist
+from tortoise.expressions import RawSQL
+from tortoise.queryset import QuerySet
 
 from ballsdex.core.models import (
     BallInstance,
+    CollectionSummary,
     DonationPolicy,
     Player,
     PrivacyPolicy,
-    Trade,
-    TradeObject,
+    Special,
     balls,
 )
 from ballsdex.core.utils.buttons import ConfirmChoiceView
+from ballsdex.core.utils.locks import ball_locks
 from ballsdex.core.utils.paginator import FieldPageSource, Pages
+from ballsdex.core.utils.trade_commit import TradeConflict, commit_trade
 from ballsdex.core.utils.transformers import (
     BallEnabledTransform,
     BallInstanceTransform,
     SpecialEnabledTransform,
     TradeCommandType,
 )
-from ballsdex.packages.balls.countryballs_paginator import CountryballsViewer
+from ballsdex.packages.balls.countryballs_paginator import (
+    CountryballsViewer,
+    LazyCountryballsSource,
+)
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
@@ -66,7 +72,7 @@ class DonationRequest(View):
             )
         except discord.NotFound:
             pass
-        await self.countryball.unlock()
+        await ball_locks.unlock([self.countryball])
 
     @button(
         style=discord.ButtonStyle.success, emoji="\N{HEAVY CHECK MARK}\N{VARIATION SELECTOR-16}"
@@ -75,20 +81,21 @@ class DonationRequest(View):
         self.stop()
         for item in self.children:
             item.disabled = True  # type: ignore
-        self.countryball.favorite = False
-        self.countryball.trade_player = self.countryball.player
-        self.countryball.player = self.new_player
-        await self.countryball.save()
-        trade = await Trade.create(player1=self.countryball.trade_player, player2=self.new_player)
-        await TradeObject.create(
-            trade=trade, ballinstance=self.countryball, player=self.countryball.trade_player
-        )
+        try:
+            await commit_trade(self.countryball.player, self.new_player, [self.countryball])
+        except TradeConflict:
+            await interaction.response.edit_message(
+                content=interaction.message.content  # type: ignore
+                + f"\n\N{CROSS MARK} This {settings.collectible_name} was given away "
+                "in the meantime.",
+                view=self,
+            )
+            return
         await interaction.response.edit_message(
             content=interaction.message.content  # type: ignore
             + "\n\N{WHITE HEAVY CHECK MARK} The donation was accepted!",
             view=self,
         )
-        await self.countryball.unlock()
 
     @button(
         style=discord.ButtonStyle.danger,
@@ -103,7 +110,7 @@ class DonationRequest(View):
             + "\n\N{CROSS MARK} The donation was denied.",
             view=self,
         )
-        await self.countryball.unlock()
+        await ball_locks.unlock([self.countryball])
 
 
 class SortingChoices(enum.Enum):
@@ -118,9 +125,85 @@ class SortingChoices(enum.Enum):
     stats_bonus = "stats"
     total_stats = "total_stats"
 
-    # manual sorts are not sorted by SQL queries but by our code
-    # this may be do-able with SQL still, but I don't have much experience ngl
-    duplicates = "manualsort-duplicates"
+    duplicates = "duplicates"
+
+
+# SQL expressions of the sort keys that are not plain columns, matching BallInstance.health
+# and BallInstance.attack (integer division truncates like int())
+# "ballinstance__ball" is the alias of the joined ball table, present when ordering by a ball field
+# No index covers these keys: sorting by health, attack, stats, total stats or duplicates computes
+# the key of every row of the filtered collection for each page, only the rows returned are limited
+BALL_HEALTH_SQL = (
+    '("ballinstance__ball"."health" '
+    '+ "ballinstance__ball"."health" * "ballinstance"."health_bonus" / 100)'
+)
+BALL_ATTACK_SQL = (
+    '("ballinstance__ball"."attack" '
+    '+ "ballinstance__ball"."attack" * "ballinstance"."attack_bonus" / 100)'
+)
+SORT_EXPRESSIONS: dict[SortingChoices, tuple[dict[str, str], list[tuple[str, bool]]]] = {
+    SortingChoices.alphabetic: ({}, [("ball__country", False)]),
+    SortingChoices.catch_date: ({}, [("catch_date", True)]),
+    SortingChoices.rarity: ({}, [("ball__rarity", False), ("ball__country", False)]),
+    SortingChoices.special: (
+        {
+            "sort_no_special": '("ballinstance"."special_id" IS NULL)',
+            "sort_special": 'COALESCE("ballinstance"."special_id", 0)',
+        },
+        [("sort_no_special", False), ("sort_special", False)],
+    ),
+    SortingChoices.health: (
+        {"sort_health": BALL_HEALTH_SQL},
+        [("sort_health", True), ("ball__country", False)],
+    ),
+    SortingChoices.attack: (
+        {"sort_attack": BALL_ATTACK_SQL},
+        [("sort_attack", True), ("ball__country", False)],
+    ),
+    SortingChoices.health_bonus: ({}, [("health_bonus", True)]),
+    SortingChoices.attack_bonus: ({}, [("attack_bonus", True)]),
+    SortingChoices.stats_bonus: (
+        {"sort_stats": '("ballinstance"."health_bonus" + "ballinstance"."attack_bonus")'},
+        [("sort_stats", True)],
+    ),
+    SortingChoices.total_stats: (
+        {"sort_total_stats": f"({BALL_HEALTH_SQL} + {BALL_ATTACK_SQL})"},
+        [("sort_total_stats", True), ("ball__country", False)],
+    ),
+}
+
+
+def get_list_ordering(
+    queryset: QuerySet[BallInstance],
+    sort: SortingChoices | None,
+    reverse: bool = False,
+    special: Special | None = None,
+) -> tuple[QuerySet[BallInstance], list[tuple[str, bool]]]:
+    """
+    Return the queryset annotated with the sort keys needed, and the ordering to use with
+    `KeysetPageSource` for the given sort option of `/balls list`.
+    """
+    if sort is None:
+        annotations, ordering = {}, [("favorite", True), ("shiny", True)]
+    elif sort == SortingChoices.duplicates:
+        # number of instances of the same ball in the (filtered) collection, read from the
+        # few summary rows of the ball instead of counting its instances again for each row
+        special_filter = f'AND "dup"."special_id" = {special.pk}' if special else ""
+        annotations = {
+            "sort_duplicates": (
+                'COALESCE((SELECT SUM("dup"."count") FROM "collectionsummary" "dup" '
+                'WHERE "dup"."player_id" = "ballinstance"."player_id" '
+                f'AND "dup"."ball_id" = "ballinstance"."ball_id" {special_filter}), 0)'
+            )
+        }
+        ordering = [("sort_duplicates", True), ("ball_id", False)]
+    else:
+        annotations, ordering = SORT_EXPRESSIONS[sort]
+    if annotations:
+        queryset = queryset.annotate(**{k: RawSQL(v) for k, v in annotations.items()})
+    if reverse:
+        ordering = [(name, not desc) for name, desc in [*ordering, ("id", False)]]
+    return queryset, ordering
 
 
 class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
@@ -177,36 +260,13 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             if await inventory_privacy(self.bot, interaction, player, user_obj) is False:
                 return
 
-        await player.fetch_related("balls")
-        filters = {"ball__id": countryball.pk} if countryball else {}
+        filters = {"ball": countryball} if countryball else {}
         if special:
             filters["special"] = special
-        if sort:
-            if sort == SortingChoices.duplicates:
-                countryballs = await player.balls.filter(**filters)
-                count = defaultdict(int)
-                for ball in countryballs:
-                    count[ball.countryball.pk] += 1
-                countryballs.sort(key=lambda m: (-count[m.countryball.pk], m.countryball.pk))
-            elif sort == SortingChoices.stats_bonus:
-                countryballs = await player.balls.filter(**filters)
-                countryballs.sort(key=lambda x: x.health_bonus + x.attack_bonus, reverse=True)
-            elif sort == SortingChoices.health or sort == SortingChoices.attack:
-                countryballs = await player.balls.filter(**filters)
-                countryballs.sort(key=lambda x: getattr(x, sort.value), reverse=True)
-            elif sort == SortingChoices.total_stats:
-                countryballs = await player.balls.filter(**filters)
-                countryballs.sort(key=lambda x: x.health + x.attack, reverse=True)
-            elif sort == SortingChoices.rarity:
-                countryballs = await player.balls.filter(**filters).order_by(
-                    sort.value, "ball__country"
-                )
-            else:
-                countryballs = await player.balls.filter(**filters).order_by(sort.value)
-        else:
-            countryballs = await player.balls.filter(**filters).order_by("-favorite", "-shiny")
+        queryset = BallInstance.filter(player=player, **filters)
+        count = await queryset.count()
 
-        if len(countryballs) < 1:
+        if count < 1:
             ball_txt = countryball.country if countryball else ""
             special_txt = special if special else ""
             if user_obj == interaction.user:
@@ -220,10 +280,9 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
                     f"{special_txt}{ball_txt} {settings.plural_collectible_name} yet."
                 )
             return
-        if reverse:
-            countryballs.reverse()
-
-        paginator = CountryballsViewer(interaction, countryballs)
+        queryset, ordering = get_list_ordering(queryset, sort, reverse, special)
+        source = LazyCountryballsSource(queryset, ordering, count=count)
+        paginator = CountryballsViewer(interaction, source)
         if user_obj == interaction.user:
             await paginator.start()
         else:
@@ -270,9 +329,9 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         bot_countryballs = {x: y.emoji_id for x, y in balls.items() if y.enabled}
 
         # Set of ball IDs owned by the player
-        filters = {"player__discord_id": user_obj.id, "ball__enabled": True}
+        filters = {}
         if special:
-            filters["special"] = special
+            filters["special_id"] = special.pk
             bot_countryballs = {
                 x: y.emoji_id
                 for x, y in balls.items()
@@ -290,12 +349,15 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
 
         if shiny is not None:
             filters["shiny"] = shiny
-        owned_countryballs = set(
-            x[0]
-            for x in await BallInstance.filter(**filters)
-            .distinct()  # Do not query everything
-            .values_list("ball_id")
-        )
+        if user is None:
+            player = await Player.get_or_none(discord_id=user_obj.id)
+        owned_countryballs = set()
+        if player:
+            owned_countryballs = {
+                x
+                for x in await CollectionSummary.get_owned_ball_ids(player.pk, **filters)
+                if x in balls and balls[x].enabled
+            }
 
         entries: list[tuple[str, str]] = []
 
@@ -462,13 +524,13 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             return
 
         if not countryball.favorite:
-            player = await Player.get(discord_id=interaction.user.id).prefetch_related("balls")
             grammar = (
                 f"{settings.collectible_name}"
                 if settings.max_favorites == 1
                 else f"{settings.plural_collectible_name}"
             )
-            if await player.balls.filter(favorite=True).count() >= settings.max_favorites:
+            favorites = await CollectionSummary.get_total(countryball.player_id, favorites=True)
+            if favorites >= settings.max_favorites:
                 await interaction.response.send_message(
                     f"You cannot set more than {settings.max_favorites} favorite {grammar}.",
                     ephemeral=True,
@@ -527,7 +589,7 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         if user.bot:
             await interaction.response.send_message("You cannot donate to bots.", ephemeral=True)
             return
-        if await countryball.is_locked():
+        if ball_locks.is_locked(countryball.pk):
             await interaction.response.send_message(
                 f"This {settings.collectible_name} is currently locked for a trade. "
                 "Please try again later.",
@@ -548,7 +610,7 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             interaction = view.interaction_response
         else:
             await interaction.response.defer()
-        await countryball.lock_for_trade()
+        await ball_locks.lock([countryball])
         new_player, _ = await Player.get_or_create(discord_id=user.id)
         old_player = countryball.player
 
@@ -556,20 +618,20 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             await interaction.followup.send(
                 f"You cannot give a {settings.collectible_name} to yourself.", ephemeral=True
             )
-            await countryball.unlock()
+            await ball_locks.unlock([countryball])
             return
         if new_player.donation_policy == DonationPolicy.ALWAYS_DENY:
             await interaction.followup.send(
                 "This player does not accept donations. You can use trades instead.",
                 ephemeral=True,
             )
-            await countryball.unlock()
+            await ball_locks.unlock([countryball])
             return
         if new_player.discord_id in self.bot.blacklist:
             await interaction.followup.send(
                 "You cannot donate to a blacklisted user.", ephemeral=True
             )
-            await countryball.unlock()
+            await ball_locks.unlock([countryball])
             return
         elif new_player.donation_policy == DonationPolicy.REQUEST_APPROVAL:
             await interaction.followup.send(
@@ -580,13 +642,14 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             )
             return
 
-        countryball.player = new_player
-        countryball.trade_player = old_player
-        countryball.favorite = False
-        await countryball.save()
-
-        trade = await Trade.create(player1=old_player, player2=new_player)
-        await TradeObject.create(trade=trade, ballinstance=countryball, player=old_player)
+        try:
+            await commit_trade(old_player, new_player, [countryball])
+        except TradeConflict:
+            await interaction.followup.send(
+                f"This {settings.collectible_name} does not belong to you anymore.",
+                ephemeral=True,
+            )
+            return
 
         cb_txt = (
             countryball.description(short=True, include_emoji=True, bot=self.bot, is_trade=True)
@@ -595,7 +658,6 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         await interaction.followup.send(
             f"You just gave the {settings.collectible_name} {cb_txt} to {user.mention}!"
         )
-        await countryball.unlock()
 
     @app_commands.command()
     async def count(
@@ -623,18 +685,29 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         if interaction.response.is_done():
             return
         assert interaction.guild
+        await interaction.response.defer(ephemeral=True, thinking=True)
         filters = {}
-        if countryball:
-            filters["ball"] = countryball
         if shiny is not None:
             filters["shiny"] = shiny
-        if special:
-            filters["special"] = special
         if current_server:
-            filters["server_id"] = interaction.guild.id
-        filters["player__discord_id"] = interaction.user.id
-        await interaction.response.defer(ephemeral=True, thinking=True)
-        balls = await BallInstance.filter(**filters).count()
+            # the summary table does not track servers
+            if countryball:
+                filters["ball"] = countryball
+            if special:
+                filters["special"] = special
+            balls = await BallInstance.filter(
+                player__discord_id=interaction.user.id,
+                server_id=interaction.guild.id,
+                **filters,
+            ).count()
+        elif player := await Player.get_or_none(discord_id=interaction.user.id):
+            if countryball:
+                filters["ball_id"] = countryball.pk
+            if special:
+                filters["special_id"] = special.pk
+            balls = await CollectionSummary.get_total(player.pk, **filters)
+        else:
+            balls = 0
         country = f"{countryball.country} " if countryball else ""
         plural = "s" if balls > 1 or balls == 0 else ""
         shiny_str = "shiny " if shiny else ""
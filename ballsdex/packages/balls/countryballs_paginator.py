@@ -1,34 +1,63 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, List, Sequence
 
 import discord
 
-from ballsdex.core.models import BallInstance
+from ballsdex.core.models import BallInstance, BallInstanceDisplayMixin, BallInstanceSummary
 from ballsdex.core.utils import menus
-from ballsdex.core.utils.paginator import Pages
+from ballsdex.core.utils.paginator import KeysetPageSource, Pages
 
 if TYPE_CHECKING:
+    from tortoise.queryset import QuerySet
+
     from ballsdex.core.bot import BallsDexBot
 
 
 class CountryballsSource(menus.ListPageSource):
-    def __init__(self, entries: List[BallInstance]):
+    def __init__(self, entries: Sequence[BallInstanceDisplayMixin]):
         super().__init__(entries, per_page=25)
 
-    async def format_page(self, menu: CountryballsSelector, balls: List[BallInstance]):
+    async def format_page(self, menu: CountryballsSelector, balls: List[BallInstanceDisplayMixin]):
+        menu.set_options(balls)
+        return True  # signal to edit the page
+
+
+class LazyCountryballsSource(KeysetPageSource):
+    """
+    Fetches the countryballs of a queryset as `BallInstanceSummary`, only when their page
+    is displayed.
+    """
+
+    def __init__(
+        self,
+        queryset: "QuerySet[BallInstance]",
+        ordering: Sequence[tuple[str, bool]],
+        *,
+        count: int,
+    ):
+        super().__init__(queryset, ordering, BallInstanceSummary.FIELDS, per_page=25, count=count)
+
+    def build_entry(self, row: tuple) -> BallInstanceSummary:
+        return BallInstanceSummary(*row)
+
+    async def format_page(self, menu: CountryballsSelector, balls: List[BallInstanceSummary]):
         menu.set_options(balls)
         return True  # signal to edit the page
 
 
 class CountryballsSelector(Pages):
-    def __init__(self, interaction: discord.Interaction["BallsDexBot"], balls: List[BallInstance]):
+    def __init__(
+        self,
+        interaction: discord.Interaction["BallsDexBot"],
+        balls: Sequence[BallInstanceDisplayMixin] | menus.PageSource,
+    ):
         self.bot = interaction.client
-        source = CountryballsSource(balls)
+        source = balls if isinstance(balls, menus.PageSource) else CountryballsSource(balls)
         super().__init__(source, interaction=interaction)
         self.add_item(self.select_ball_menu)
 
-    def set_options(self, balls: List[BallInstance]):
+    def set_options(self, balls: List[BallInstanceDisplayMixin]):
         options: List[discord.SelectOption] = []
         for ball in balls:
             emoji = self.bot.get_emoji(int(ball.countryball.emoji_id))
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+import discord
+from discord.ui import Button, View
+
+from ballsdex.packages.countryballs.countryball import CountryBall
+from ballsdex.settings import settings
+
+if TYPE_CHECKING:
+    from ballsdex.core.models import Ball
+
+log = logging.getLogger("ballsdex.packages.countryballs.bomb")
+
+__all__ = ("SpawnBomb", "SpawnBombView", "spawn_bomb")
+
+# Discord allows 5 messages every 5 seconds per channel, the window is slightly widened to
+# absorb latency variations and never hit a 429
+SPAWN_RATE = 5
+SPAWN_PER = 5.5
+# minimum time in seconds between two progress reports
+REPORT_INTERVAL = 3
+
+ProgressCallback = Callable[["SpawnBomb"], Awaitable[None]]
+
+
+class SpawnRateLimiter:
+    """
+    Sliding window limiting the number of spawns sent in a channel, waiting for a slot instead
+    of letting the requests fail with a 429.
+    """
+
+    def __init__(self, rate: int = SPAWN_RATE, per: float = SPAWN_PER):
+        self.rate = rate
+        self.per = per
+        self.sent: deque[float] = deque(maxlen=rate)
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            if len(self.sent) == self.rate:
+                delay = self.sent[0] + self.per - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.sent.append(time.monotonic())
+
+
+class SpawnBomb:
+    """
+    Spawns many countryballs in a channel, as fast as the rate limit of the channel allows.
+
+    Up to `SPAWN_RATE` spawns are sent at the same time, so the latency of a request does not
+    slow down the next ones. The bomb stops at the first spawn failing, or once `cancel` is
+    called, after the spawns already sent complete.
+
+    Parameters
+    ----------
+    channel: discord.TextChannel
+        The channel where the countryballs are spawned.
+    amount: int
+        The number of countryballs to spawn.
+    ball: Ball | None
+        The countryball spawned. Random according to rarities for each spawn if omitted.
+    progress: ProgressCallback | None
+        Called when the number of spawns changed, at most once every `REPORT_INTERVAL` seconds.
+    """
+
+    def __init__(
+        self,
+        channel: discord.TextChannel,
+        amount: int,
+        ball: Ball | None = None,
+        *,
+        progress: ProgressCallback | None = None,
+    ):
+        self.channel = channel
+        self.amount = amount
+        self.ball = ball
+        self.progress = progress
+        self.limiter = SpawnRateLimiter()
+        self.spawned = 0
+        self.claimed = 0
+        self.failed = False
+        self.cancelled = False
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """
+        The number of spawns per second achieved so far.
+        """
+        elapsed = self.elapsed
+        return self.spawned / elapsed if elapsed else 0
+
+    def cancel(self):
+        """
+        Stop sending new spawns.
+        """
+        self.cancelled = True
+
+    async def _spawn(self) -> bool:
+        if self.ball:
+            countryball = CountryBall(self.ball)
+        else:
+            countryball = await CountryBall.get_random()
+        return await countryball.spawn(self.channel)
+
+    async def _worker(self):
+        while self.claimed < self.amount and not self.failed and not self.cancelled:
+            self.claimed += 1
+            await self.limiter.acquire()
+            if self.failed or self.cancelled:
+                return
+            try:
+                spawned = await self._spawn()
+            except Exception:
+                # the other workers stop at their next spawn instead of running unattended
+                log.exception(f"Spawn bomb in channel {self.channel.id} failed")
+                spawned = False
+            if not spawned:
+                self.failed = True
+                return
+            self.spawned += 1
+            self.changed.set()
+
+    async def _report(self):
+        assert self.progress
+        reported = 0
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            if self.spawned != reported:
+                reported = self.spawned
+                try:
+                    await self.progress(self)
+                except discord.HTTPException:
+                    log.warning("Failed to report spawn bomb progress", exc_info=True)
+                    return
+            await asyncio.sleep(REPORT_INTERVAL)
+
+    async def run(self) -> int:
+        """
+        Spawn the countryballs and return the number of successful spawns.
+        """
+        self.started_at = time.monotonic()
+        reporter = asyncio.create_task(self._report()) if self.progress else None
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(min(SPAWN_RATE, self.amount))))
+        finally:
+            self.finished_at = time.monotonic()
+            if reporter:
+                reporter.cancel()
+        log.info(
+            f"Spawn bomb in channel {self.channel.id}: {self.spawned}/{self.amount} spawned "
+            f"in {self.elapsed:.1f}s ({self.rate:.2f}/s)"
+        )
+        return self.spawned
+
+
+class SpawnBombView(View):
+    def __init__(self, bomb: SpawnBomb, author: discord.abc.User):
+        super().__init__(timeout=None)
+        self.bomb = bomb
+        self.author = author
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user != self.author:
+            await interaction.response.send_message(
+                "Only the original author can use this.", ephemeral=True
+            )
+            return False
+        return True
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.danger)
+    async def cancel_button(self, interaction: discord.Interaction, button: Button):
+        self.bomb.cancel()
+        button.disabled = True
+        await interaction.response.edit_message(view=self)
+
+
+async def spawn_bomb(
+    interaction: discord.Interaction,
+    channel: discord.TextChannel,
+    amount: int,
+    ball: Ball | None = None,
+) -> SpawnBomb:
+    """
+    Run a spawn bomb, reporting its progress with a cancel button on the original response of
+    a deferred interaction.
+    """
+    name = ball.country if ball else "Random"
+    bomb = SpawnBomb(channel, amount, ball)
+    view = SpawnBombView(bomb, interaction.user)
+
+    def status() -> str:
+        return (
+            f"{bomb.spawned}/{amount} spawned ({round(bomb.spawned / amount * 100)}%), "
+            f"{bomb.rate:.2f} spawns/s"
+        )
+
+    async def progress(bomb: SpawnBomb):
+        await interaction.edit_original_response(
+            content=f"Spawn bomb in progress in {channel.mention}, "
+            f"{settings.collectible_name.title()}: {name}\n{status()}",
+            view=view,
+        )
+
+    bomb.progress = progress
+    await interaction.edit_original_response(
+        content=f"Starting spawn bomb in {channel.mention}...", view=view
+    )
+    try:
+        await bomb.run()
+    finally:
+        view.stop()
+
+    if bomb.failed:
+        content = (
+            f"A {settings.collectible_name} failed to spawn, probably "
+            "indicating a lack of permissions to send messages "
+            f"or upload files in {channel.mention}.\n{status()}"
+        )
+    elif bomb.cancelled:
+        content = f"Spawn bomb in {channel.mention} cancelled.\n{status()}"
+    else:
+        content = (
+            f"Successfully spawned {bomb.spawned} {settings.plural_collectible_name} "
+            f"in {channel.mention}! ({bomb.rate:.2f} spawns/s)"
+        )
+    try:
+        await interaction.edit_original_response(content=content, view=None)
+    except discord.HTTPException:
+        # the interaction token expires after 15 minutes
+        log.warning(f"Failed to report the end of spawn bomb in channel {channel.id}")
+    return bomb
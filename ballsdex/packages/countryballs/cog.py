@@ -20,15 +20,15 @@ class CountryBallsSpawner(commands.Cog):
         self.bot = bot
 
     async def load_cache(self):
-        i = 0
-        async for config in GuildConfig.all():
-            if not config.enabled:
-                continue
-            if not config.spawn_channel:
-                continue
-            self.spawn_manager.cache[config.guild_id] = config.spawn_channel
-            i += 1
-        log.info(f"Loaded {i} guilds in cache")
+        # filled separately, then swapped, to avoid an empty cache when reloading
+        cache: dict[int, int] = dict(
+            await GuildConfig.filter(enabled=True, spawn_channel__isnull=False).values_list(
+                "guild_id", "spawn_channel"
+            )
+        )
+        self.spawn_manager.cache.clear()
+        self.spawn_manager.cache.update(cache)
+        log.info(f"Loaded {len(cache)} guilds in cache")
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -11,6 +11,7 @@ from prometheus_client import Counter
 from tortoise.timezone import now as datetime_now
 
 from ballsdex.core.models import BallInstance, GuildConfig, Player, specials
+from ballsdex.core.utils.queries import track_interaction
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
@@ -50,6 +51,10 @@ class CountryballNamePrompt(Modal, title=f"Catch this {settings.collectible_name
                 ephemeral=config.silent,
             )
 
+    async def interaction_check(self, interaction: discord.Interaction["BallsDexBot"], /) -> bool:
+        track_interaction(interaction, "catch")
+        return True
+
     async def on_submit(self, interaction: discord.Interaction["BallsDexBot"]):
         config = await GuildConfig.get(guild_id=interaction.guild_id)
 
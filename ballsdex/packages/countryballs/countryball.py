@@ -1,7 +1,9 @@
+import io
 import logging
 import random
 import string
 from datetime import datetime
+from functools import lru_cache
 
 import discord
 
@@ -12,6 +14,15 @@ from ballsdex.settings import settings
 log = logging.getLogger("ballsdex.packages.countryballs")
 
 
+@lru_cache(maxsize=256)
+def load_wild_card(path: str) -> bytes:
+    """
+    Read the wild card of a ball once, new uploads are saved under a different path.
+    """
+    with open("." + path, "rb") as file:
+        return file.read()
+
+
 class CountryBall:
     def __init__(self, model: Ball):
         self.name = model.country
@@ -68,7 +79,6 @@ class CountryBall:
             return possibilities[num]
 
         extension = self.model.wild_card.split(".")[-1]
-        file_location = "." + self.model.wild_card
         file_name = f"nt_{generate_random_name()}.{extension}"
         try:
             permissions = channel.permissions_for(channel.guild.me)
@@ -76,7 +86,9 @@ class CountryBall:
                 self.message = await channel.send(
                     f"{generate_spawn_message()}\nDon't know what it is? Ask in our [official server!](<{settings.discord_invite}>)",
                     view=CatchView(self),
-                    file=discord.File(file_location, filename=file_name),
+                    file=discord.File(
+                        io.BytesIO(load_wild_card(self.model.wild_card)), filename=file_name
+                    ),
                 )
                 return True
             else:
@@ -9,6 +9,7 @@ from discord.ext import commands
 
 from ballsdex.settings import settings
 from ballsdex.core.models import BallInstance, Player
+from ballsdex.packages.countryballs.bomb import spawn_bomb
 from ballsdex.packages.countryballs.countryball import CountryBall
 from ballsdex.core.utils.transformers import BallTransform, SpecialTransform
 from ballsdex.core.utils.logging import log_action
@@ -56,7 +57,7 @@ class Owner(commands.Cog):
         channel: discord.TextChannel
             The channel to spawn the ball in
         n: int
-            The number of balls to spawn
+            The number of balls to spawn, between 1 and 100. 1 if not specified.
         visible: bool
             Whether to send a message with the ball spawned
         """
@@ -69,26 +70,25 @@ class Owner(commands.Cog):
             return
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        randomized: bool
-
-        if n is None:
+        if (not n) or (n < 1):
             n = 1
+        elif n >= 100:
+            n = 100
         if visible is None:
             visible = True
 
-        if not countryball:
+        if n > 1:
+            bomb = await spawn_bomb(
+                interaction, channel or interaction.channel, n, countryball  # type: ignore
+            )
+            if bomb.failed or bomb.cancelled:
+                return
+        elif not countryball:
             countryball = await CountryBall.get_random()
-            randomized = True
+            await countryball.spawn(channel or interaction.channel)  # type: ignore
         else:
             countryball = CountryBall(countryball)
-            randomized = False
-
-        i: int = 0
-        while i < n:
             await countryball.spawn(channel or interaction.channel)  # type: ignore
-            if randomized:
-                countryball = await CountryBall.get_random()
-            i += 1
 
         if n == 1:
             if countryball:
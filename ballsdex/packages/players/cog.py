@@ -1,16 +1,19 @@
-import zipfile
-from io import BytesIO
 from typing import TYPE_CHECKING
 
 import discord
 from discord import app_commands
 from discord.ext import commands
-from tortoise.expressions import Q
 
-from ballsdex.core.models import BallInstance, DonationPolicy
+from ballsdex.core.models import DonationPolicy
 from ballsdex.core.models import Player as PlayerModel
-from ballsdex.core.models import PrivacyPolicy, Trade, TradeObject
+from ballsdex.core.models import PrivacyPolicy
 from ballsdex.core.utils.buttons import ConfirmChoiceView
+from ballsdex.packages.players.export import (
+    ExportTooLarge,
+    export_player_data,
+    write_items_csv,
+    write_trades_csv,
+)
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
@@ -129,96 +132,38 @@ class Player(commands.GroupCog):
                 "You don't have any player data to export.", ephemeral=True
             )
             return
-        await interaction.response.defer()
-        files = []
+        items = (f"{interaction.user.id}_{settings.collectible_name}.csv", write_items_csv)
+        trades = (f"{interaction.user.id}_trades.csv", write_trades_csv)
         if type == "balls":
-            data = await get_items_csv(player)
-            filename = f"{interaction.user.id}_{settings.collectible_name}.csv"
-            data.filename = filename  # type: ignore
-            files.append(data)
+            files = [items]
         elif type == "trades":
-            data = await get_trades_csv(player)
-            filename = f"{interaction.user.id}_trades.csv"
-            data.filename = filename  # type: ignore
-            files.append(data)
+            files = [trades]
         elif type == "all":
-            balls = await get_items_csv(player)
-            trades = await get_trades_csv(player)
-            balls_filename = f"{interaction.user.id}_{settings.collectible_name}.csv"
-            trades_filename = f"{interaction.user.id}_trades.csv"
-            balls.filename = balls_filename  # type: ignore
-            trades.filename = trades_filename  # type: ignore
-            files.append(balls)
-            files.append(trades)
+            files = [items, trades]
         else:
-            await interaction.followup.send("Invalid input!", ephemeral=True)
+            await interaction.response.send_message("Invalid input!", ephemeral=True)
             return
-        zip_file = BytesIO()
-        with zipfile.ZipFile(zip_file, "w") as z:
-            for file in files:
-                z.writestr(file.filename, file.getvalue())
-        zip_file.seek(0)
-        if zip_file.tell() > 25_000_000:
+        await interaction.response.defer()
+        try:
+            archive = await export_player_data(player, files)
+        except ExportTooLarge:
             await interaction.followup.send(
-                "Your data is too large to export."
+                "Your data is too large to export. "
                 "Please contact the bot support for more information.",
                 ephemeral=True,
             )
             return
-        files = [discord.File(zip_file, "player_data.zip")]
-        try:
-            await interaction.user.send("Here is your player data:", files=files)
-            await interaction.followup.send(
-                "Your player data has been sent via DMs.", ephemeral=True
-            )
-        except discord.Forbidden:
-            await interaction.followup.send(
-                "I couldn't send the player data to you in DM. "
-                "Either you blocked me or you disabled DMs in this server.",
-                ephemeral=True,
-            )
-
-
-async def get_items_csv(player: PlayerModel) -> BytesIO:
-    """
-    Get a CSV file with all items of the player.
-    """
-    balls = await BallInstance.filter(player=player).prefetch_related(
-        "ball", "trade_player", "special"
-    )
-    txt = (
-        f"id,hex id,{settings.collectible_name},catch date,trade_player"
-        ",special,shiny,attack,attack bonus,hp,hp_bonus\n"
-    )
-    for ball in balls:
-        txt += (
-            f"{ball.id},{ball.id:0X},{ball.ball.country},{ball.catch_date},"  # type: ignore
-            f"{ball.trade_player.discord_id if ball.trade_player else 'None'},{ball.special},"
-            f"{ball.shiny},{ball.attack},{ball.attack_bonus},{ball.health},{ball.health_bonus}\n"
-        )
-    return BytesIO(txt.encode("utf-8"))
-
-
-async def get_trades_csv(player: PlayerModel) -> BytesIO:
-    """
-    Get a CSV file with all trades of the player.
-    """
-    trade_history = (
-        await Trade.filter(Q(player1=player) | Q(player2=player))
-        .order_by("date")
-        .prefetch_related("player1", "player2")
-    )
-    txt = "id,date,player1,player2,player1 received,player2 received\n"
-    for trade in trade_history:
-        player1_items = await TradeObject.filter(
-            trade=trade, player=trade.player1
-        ).prefetch_related("ballinstance")
-        player2_items = await TradeObject.filter(
-            trade=trade, player=trade.player2
-        ).prefetch_related("ballinstance")
-        txt += (
-            f"{trade.id},{trade.date},{trade.player1.discord_id},{trade.player2.discord_id},"
-            f"{','.join([i.ballinstance.to_string() for i in player2_items])},"  # type: ignore
-            f"{','.join([i.ballinstance.to_string() for i in player1_items])}\n"  # type: ignore
-        )
-    return BytesIO(txt.encode("utf-8"))
+        with archive:
+            try:
+                await interaction.user.send(
+                    "Here is your player data:", file=discord.File(archive, "player_data.zip")
+                )
+                await interaction.followup.send(
+                    "Your player data has been sent via DMs.", ephemeral=True
+                )
+            except discord.Forbidden:
+                await interaction.followup.send(
+                    "I couldn't send the player data to you in DM. "
+                    "Either you blocked me or you disabled DMs in this server.",
+                    ephemeral=True,
+                )
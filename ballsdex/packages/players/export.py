@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import tempfile
+import zipfile
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Sequence, cast
+
+from tortoise import Tortoise
+
+from ballsdex.core.models import BallInstanceSummary, Player
+from ballsdex.settings import settings
+
+if TYPE_CHECKING:
+    from tortoise.backends.asyncpg.client import AsyncpgDBClient
+
+log = logging.getLogger("ballsdex.packages.players.export")
+
+# maximum size of the archive, files bigger than this cannot be uploaded
+EXPORT_SIZE_LIMIT = 25_000_000
+# archives smaller than this are kept in memory instead of a temporary file
+SPOOL_SIZE = 1_000_000
+# number of rows fetched at once from the server-side cursor
+CURSOR_PREFETCH = 1000
+
+SUMMARY_COLUMNS = ", ".join(f'bi."{x}"' for x in BallInstanceSummary.FIELDS)
+ITEMS_SQL = (
+    f'SELECT {SUMMARY_COLUMNS}, tp."discord_id" AS "trade_player" FROM "ballinstance" bi '
+    'LEFT JOIN "player" tp ON tp."id" = bi."trade_player_id" '
+    'WHERE bi."player_id" = $1 ORDER BY bi."id"'
+)
+# one row per trade object, trades without any object still have one row with null columns
+TRADES_SQL = (
+    'SELECT t."id" AS "trade_id", t."date", p1."discord_id" AS "player1", '
+    'p2."discord_id" AS "player2", o."player_id" = t."player1_id" AS "from_player1", '
+    f"{SUMMARY_COLUMNS} "
+    'FROM "trade" t JOIN "player" p1 ON p1."id" = t."player1_id" '
+    'JOIN "player" p2 ON p2."id" = t."player2_id" '
+    'LEFT JOIN "tradeobject" o ON o."trade_id" = t."id" '
+    'LEFT JOIN "ballinstance" bi ON bi."id" = o."ballinstance_id" '
+    'WHERE t."player1_id" = $1 OR t."player2_id" = $1 ORDER BY t."date", t."id", o."id"'
+)
+
+CsvWriter = Callable[[Any, Player, Callable[[], None]], Awaitable[None]]
+
+
+class ExportTooLarge(Exception):
+    """
+    Raised when the archive of an export goes over `EXPORT_SIZE_LIMIT`.
+    """
+
+
+async def stream_records(query: str, *args: Any) -> AsyncIterator[Any]:
+    """
+    Iterate over the results of a query with a server-side cursor, only keeping
+    `CURSOR_PREFETCH` rows in memory at once.
+    """
+    client = cast("AsyncpgDBClient", Tortoise.get_connection("default"))
+    async with client.acquire_connection() as connection:
+        # cursors only live inside a transaction
+        async with connection.transaction():
+            async for record in connection.cursor(query, *args, prefetch=CURSOR_PREFETCH):
+                yield record
+
+
+def _summary(record: Any) -> BallInstanceSummary:
+    return BallInstanceSummary(*(record[x] for x in BallInstanceSummary.FIELDS))
+
+
+async def write_items_csv(writer: Any, player: Player, check_size: Callable[[], None]):
+    """
+    Write the CSV rows of all items of the player.
+    """
+    writer.writerow(
+        (
+            "id",
+            "hex id",
+            settings.collectible_name,
+            "catch date",
+            "trade_player",
+            "special",
+            "shiny",
+            "attack",
+            "attack bonus",
+            "hp",
+            "hp_bonus",
+        )
+    )
+    async for record in stream_records(ITEMS_SQL, player.pk):
+        ball = _summary(record)
+        writer.writerow(
+            (
+                ball.pk,
+                f"{ball.pk:0X}",
+                ball.countryball.country,
+                ball.catch_date,
+                record["trade_player"],
+                ball.specialcard,
+                ball.shiny,
+                ball.attack,
+                ball.attack_bonus,
+                ball.health,
+                ball.health_bonus,
+            )
+        )
+        check_size()
+
+
+async def write_trades_csv(writer: Any, player: Player, check_size: Callable[[], None]):
+    """
+    Write the CSV rows of all trades of the player.
+    """
+    writer.writerow(("id", "date", "player1", "player2", "player1 received", "player2 received"))
+    trade: Any = None
+    received1: list[str] = []
+    received2: list[str] = []
+
+    def write_trade():
+        writer.writerow(
+            (
+                trade["trade_id"],
+                trade["date"],
+                trade["player1"],
+                trade["player2"],
+                ",".join(received1),
+                ",".join(received2),
+            )
+        )
+        check_size()
+
+    # rows are ordered by trade, a trade is written once all of its rows were read
+    async for record in stream_records(TRADES_SQL, player.pk):
+        if trade is None or trade["trade_id"] != record["trade_id"]:
+            if trade is not None:
+                write_trade()
+            trade = record
+            received1, received2 = [], []
+        if record["id"] is None:
+            continue
+        text = _summary(record).to_string()
+        if record["from_player1"]:
+            received2.append(text)
+        else:
+            received1.append(text)
+    if trade is not None:
+        write_trade()
+
+
+async def export_player_data(
+    player: Player, files: Sequence[tuple[str, CsvWriter]]
+) -> tempfile.SpooledTemporaryFile:
+    """
+    Build a zip archive containing the given CSV files of a player.
+
+    Rows are streamed from the database and written to the archive as they are read, which is
+    spooled to a temporary file once it grows too big, so memory usage does not depend on the
+    size of the collection.
+
+    Parameters
+    ----------
+    player: Player
+        The player whose data is exported.
+    files: Sequence[tuple[str, CsvWriter]]
+        The name of each CSV file in the archive, with the function writing its rows.
+
+    Returns
+    -------
+    tempfile.SpooledTemporaryFile
+        The archive, positioned at its start. The caller must close it.
+
+    Raises
+    ------
+    ExportTooLarge
+        The archive is bigger than `EXPORT_SIZE_LIMIT`.
+    """
+    archive = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+    def check_size():
+        if archive.tell() > EXPORT_SIZE_LIMIT:
+            raise ExportTooLarge()
+
+    try:
+        with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+            for filename, write_csv in files:
+                with zip_file.open(filename, "w") as binary:
+                    with io.TextIOWrapper(binary, encoding="utf-8", newline="") as text:
+                        await write_csv(csv.writer(text), player, check_size)
+        check_size()
+    except BaseException:
+        archive.close()
+        raise
+    log.debug(f"Exported data of player {player.pk}, {archive.tell()} bytes")
+    archive.seek(0)
+    return archive
@@ -1,16 +1,17 @@
 import datetime
-from collections import defaultdict
 from typing import TYPE_CHECKING, Optional, cast
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 from discord.utils import MISSING
-from tortoise.expressions import Q
+from tortoise.expressions import Q, Subquery
 
 from ballsdex.core.models import BallInstance, Player
 from ballsdex.core.models import Trade as TradeModel
+from ballsdex.core.models import TradeObject
 from ballsdex.core.utils.buttons import ConfirmChoiceView
+from ballsdex.core.utils.locks import ball_locks
 from ballsdex.core.utils.paginator import Pages
 from ballsdex.core.utils.transformers import (
     BallEnabledTransform,
@@ -20,6 +21,8 @@ from ballsdex.core.utils.transformers import (
 )
 from ballsdex.packages.trade.display import TradeViewFormat
 from ballsdex.packages.trade.menu import BulkAddView, TradeMenu, TradeViewMenu
+from ballsdex.packages.trade.registry import TradeRegistry
+from ballsdex.packages.trade.scheduler import TradeScheduler
 from ballsdex.packages.trade.trade_user import TradingUser
 from ballsdex.settings import settings
 
@@ -34,7 +37,16 @@ class Trade(commands.GroupCog):
 
     def __init__(self, bot: "BallsDexBot"):
         self.bot = bot
-        self.trades: dict[int, dict[int, list[TradeMenu]]] = defaultdict(lambda: defaultdict(list))
+        self.registry = TradeRegistry()
+        self.scheduler = TradeScheduler()
+
+    async def cog_load(self):
+        self.registry.start()
+        self.scheduler.start()
+
+    async def cog_unload(self):
+        self.registry.stop()
+        self.scheduler.stop()
 
     bulk = app_commands.Group(name="bulk", description="Bulk Commands")
 
@@ -58,44 +70,17 @@ class Trade(commands.GroupCog):
         tuple[TradeMenu, TradingUser] | tuple[None, None]
             A tuple with the `TradeMenu` and `TradingUser` if found, else `None`.
         """
-        guild: discord.Guild
         if interaction:
-            guild = cast(discord.Guild, interaction.guild)
             channel = cast(discord.TextChannel, interaction.channel)
             user = interaction.user
-        elif channel:
-            guild = channel.guild
-        else:
+        elif not channel:
             raise TypeError("Missing interaction or channel")
 
-        if guild.id not in self.trades:
-            return (None, None)
-        if channel.id not in self.trades[guild.id]:
+        trade = self.registry.get(user.id)
+        # trade commands only apply in the channel where the trade happens
+        if trade is None or trade.channel.id != channel.id:
             return (None, None)
-        to_remove: list[TradeMenu] = []
-        for trade in self.trades[guild.id][channel.id]:
-            if (
-                trade.current_view.is_finished()
-                or trade.trader1.cancelled
-                or trade.trader2.cancelled
-            ):
-                # remove what was supposed to have been removed
-                to_remove.append(trade)
-                continue
-            try:
-                trader = trade._get_trader(user)
-            except RuntimeError:
-                continue
-            else:
-                break
-        else:
-            for trade in to_remove:
-                self.trades[guild.id][channel.id].remove(trade)
-            return (None, None)
-
-        for trade in to_remove:
-            self.trades[guild.id][channel.id].remove(trade)
-        return (trade, trader)
+        return (trade, trade._get_trader(user))
 
     @app_commands.command()
     async def begin(self, interaction: discord.Interaction["BallsDexBot"], user: discord.User):
@@ -116,14 +101,12 @@ class Trade(commands.GroupCog):
             )
             return
 
-        trade1, trader1 = self.get_trade(interaction)
-        trade2, trader2 = self.get_trade(channel=interaction.channel, user=user)  # type: ignore
-        if trade1 or trader1:
+        if self.registry.get(interaction.user.id):
             await interaction.response.send_message(
                 "You already have an ongoing trade.", ephemeral=True
             )
             return
-        if trade2 or trader2:
+        if self.registry.get(user.id):
             await interaction.response.send_message(
                 "The user you are trying to trade with is already in a trade.", ephemeral=True
             )
@@ -140,7 +123,14 @@ class Trade(commands.GroupCog):
         menu = TradeMenu(
             self, interaction, TradingUser(interaction.user, player1), TradingUser(user, player2)
         )
-        self.trades[interaction.guild.id][interaction.channel.id].append(menu)  # type: ignore
+        try:
+            self.registry.add(menu)
+        except ValueError:
+            # another trade was started while fetching the players
+            await interaction.response.send_message(
+                "One of you has started another trade in the meantime.", ephemeral=True
+            )
+            return
         await menu.start()
         await interaction.response.send_message("Trade started!", ephemeral=True)
 
@@ -201,7 +191,7 @@ class Trade(commands.GroupCog):
                 ephemeral=True,
             )
             return
-        if await countryball.is_locked():
+        if ball_locks.is_locked(countryball.pk):
             await interaction.followup.send(
                 f"This {settings.collectible_name} is currently in an active trade or donation, "
                 "please try again later.",
@@ -209,8 +199,9 @@ class Trade(commands.GroupCog):
             )
             return
 
-        await countryball.lock_for_trade()
+        await ball_locks.lock([countryball])
         trader.proposal.append(countryball)
+        trade.mark_dirty()
         await interaction.followup.send(
             f"{countryball.countryball.country} added.", ephemeral=True
         )
@@ -325,10 +316,11 @@ class Trade(commands.GroupCog):
             )
             return
         trader.proposal.remove(countryball)
+        trade.mark_dirty()
         await interaction.response.send_message(
             f"{countryball.countryball.country} removed.", ephemeral=True
         )
-        await countryball.unlock()
+        await ball_locks.unlock([countryball])
 
     @app_commands.command()
     async def cancel(self, interaction: discord.Interaction):
@@ -399,17 +391,24 @@ class Trade(commands.GroupCog):
             queryset = queryset.filter(date__range=(start_date, end_date))
 
         if countryball:
-            queryset = queryset.filter(Q(tradeobjects__ballinstance__ball=countryball)).distinct()
-
-        history = await queryset.order_by(sorting.value).prefetch_related(
-            "player1", "player2", "tradeobjects__ballinstance__ball"
-        )
+            queryset = queryset.filter(
+                id__in=Subquery(
+                    TradeObject.filter(ballinstance__ball=countryball).values("trade_id")
+                )
+            )
 
-        if not history:
+        count = await queryset.count()
+        if not count:
             await interaction.followup.send("No history found.", ephemeral=True)
             return
 
-        source = TradeViewFormat(history, interaction.user.name, self.bot)
+        source = TradeViewFormat(
+            queryset,
+            interaction.user.name,
+            self.bot,
+            descending=sorting.value == "-date",
+            count=count,
+        )
         pages = Pages(source=source, interaction=interaction)
         await pages.start()
 
@@ -1,45 +1,139 @@
-from typing import TYPE_CHECKING, Iterable
+import asyncio
+from collections import defaultdict
+from typing import TYPE_CHECKING
 
 import discord
+from cachetools import LRUCache
 
+from ballsdex.core.models import BallInstance
 from ballsdex.core.models import Trade as TradeModel
+from ballsdex.core.models import TradeObject
 from ballsdex.core.utils import menus
-from ballsdex.core.utils.paginator import Pages
+from ballsdex.core.utils.paginator import KeysetPageSource, Pages
 from ballsdex.packages.trade.trade_user import TradingUser
 
 if TYPE_CHECKING:
+    from tortoise.queryset import QuerySet
+
     from ballsdex.core.bot import BallsDexBot
 
+# number of trades fetched at once when paginating the history
+HISTORY_WINDOW = 10
+
+# a trade with the instances given by the first player, then the second one
+HistoryEntry = tuple[TradeModel, list[BallInstance], list[BallInstance]]
+
+
+class TradeViewFormat(menus.PageSource):
+    """
+    Displays the trades of a queryset, one per page, fetching them only when needed.
+
+    Trades are fetched by windows of `HISTORY_WINDOW` pages, with keyset pagination over their
+    date and ID. The trades of a window and all of their trade objects are loaded together, so
+    turning pages inside a window does not query the database. Rendered pages are cached.
+
+    Parameters
+    ----------
+    queryset: QuerySet[TradeModel]
+        The filtered trades, not ordered.
+    header: str
+        The name displayed in the title of each page.
+    bot: BallsDexBot
+        The bot object, used for emojis and user lookups.
+    is_admin: bool
+        Whether to show the IDs of the traders.
+    descending: bool
+        Show the most recent trades first.
+    count: int | None
+        The number of trades if already known, otherwise it is counted when preparing.
+    """
 
-class TradeViewFormat(menus.ListPageSource):
     def __init__(
         self,
-        entries: Iterable[TradeModel],
+        queryset: "QuerySet[TradeModel]",
         header: str,
         bot: "BallsDexBot",
         is_admin: bool = False,
+        *,
+        descending: bool = True,
+        count: int | None = None,
     ):
         self.header = header
         self.bot = bot
         self.is_admin = is_admin
-        super().__init__(entries, per_page=1)
+        self.ids = KeysetPageSource(
+            queryset, [("date", descending)], ("id",), per_page=HISTORY_WINDOW, count=count
+        )
+        self.windows: LRUCache[int, list[HistoryEntry]] = LRUCache(maxsize=4)
+        self.embeds: LRUCache[int, discord.Embed] = LRUCache(maxsize=HISTORY_WINDOW * 2)
+
+    async def prepare(self):
+        await self.ids.prepare()
+
+    def is_paginating(self) -> bool:
+        return (self.ids.count or 0) > 1
+
+    def get_max_pages(self) -> int:
+        return max(1, self.ids.count or 0)
 
-    async def format_page(self, menu: Pages, trade: TradeModel) -> discord.Embed:
+    async def _load_window(self, window: int) -> list[HistoryEntry]:
+        ids = [row[0] for row in await self.ids.get_page(window)]
+        trades = {
+            x.pk: x
+            for x in await TradeModel.filter(id__in=ids).select_related("player1", "player2")
+        }
+        trade_objects = (
+            await TradeObject.filter(trade_id__in=ids)
+            .select_related("ballinstance")
+            .order_by("id")
+        )
+        proposals: dict[tuple[int, int], list[BallInstance]] = defaultdict(list)
+        for trade_object in trade_objects:
+            key = (trade_object.trade_id, trade_object.player_id)  # type: ignore
+            proposals[key].append(trade_object.ballinstance)
+        return [
+            (trade, proposals[trade.pk, trade.player1.pk], proposals[trade.pk, trade.player2.pk])
+            for trade in (trades[x] for x in ids if x in trades)
+        ]
+
+    async def get_page(self, page_number: int) -> tuple[int, HistoryEntry | None]:
+        window, position = divmod(page_number, HISTORY_WINDOW)
+        entries = self.windows.get(window)
+        if entries is None:
+            entries = self.windows[window] = await self._load_window(window)
+        # trades deleted since counting shift the others
+        return page_number, entries[position] if position < len(entries) else None
+
+    async def format_page(
+        self, menu: Pages, page: tuple[int, HistoryEntry | None]
+    ) -> discord.Embed:
+        page_number, entry = page
+        if embed := self.embeds.get(page_number):
+            return embed
+        if entry is None:
+            return discord.Embed(
+                title=f"Trade history for {self.header}",
+                description="This trade does not exist anymore.",
+            )
+        trade, proposal1, proposal2 = entry
         embed = discord.Embed(
             title=f"Trade history for {self.header}",
             description=f"Trade ID: {trade.pk:0X}",
             timestamp=trade.date,
         )
-        embed.set_footer(
-            text=f"Trade {menu.current_page + 1}/{menu.source.get_max_pages()} | Trade date: "
+        embed.set_footer(text=f"Trade {page_number + 1}/{self.get_max_pages()} | Trade date: ")
+        user1, user2 = await asyncio.gather(
+            self.bot.user_resolver.fetch(trade.player1.discord_id),
+            self.bot.user_resolver.fetch(trade.player2.discord_id),
         )
         fill_trade_embed_fields(
             embed,
             self.bot,
-            await TradingUser.from_trade_model(trade, trade.player1, self.bot),
-            await TradingUser.from_trade_model(trade, trade.player2, self.bot),
+            TradingUser(user1, trade.player1, proposal1),
+            TradingUser(user2, trade.player2, proposal2),
             is_admin=self.is_admin,
         )
+        self.embeds[page_number] = embed
         return embed
 
 
@@ -1,19 +1,22 @@
 from __future__ import annotations
 
-import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import TYPE_CHECKING, List, Set, cast
+from datetime import timedelta
+from typing import TYPE_CHECKING, Dict, List, Set, cast
 
 import discord
 from discord.ui import Button, View, button
 from discord.utils import format_dt, utcnow
 
-from ballsdex.core.models import BallInstance, Player, Trade, TradeObject
+from ballsdex.core.models import BallInstance, Player
 from ballsdex.core.utils import menus
+from ballsdex.core.utils.locks import ball_locks
 from ballsdex.core.utils.paginator import Pages
+from ballsdex.core.utils.queries import track_interaction
+from ballsdex.core.utils.trade_commit import TradeConflict, commit_trade
 from ballsdex.packages.balls.countryballs_paginator import CountryballsViewer
 from ballsdex.packages.trade.display import fill_trade_embed_fields
+from ballsdex.packages.trade.scheduler import TRADE_TIMEOUT
 from ballsdex.packages.trade.trade_user import TradingUser
 from ballsdex.settings import settings
 
@@ -75,9 +78,9 @@ class TradeView(View):
                 ephemeral=True,
             )
         else:
-            for countryball in trader.proposal:
-                await countryball.unlock()
+            await ball_locks.unlock(trader.proposal)
             trader.proposal.clear()
+            self.trade.mark_dirty()
             await interaction.response.send_message("Proposal cleared.", ephemeral=True)
 
     @button(
@@ -104,6 +107,7 @@ class ConfirmView(View):
             )
             return False
         else:
+            track_interaction(interaction, "trade confirm")
             return True
 
     @discord.ui.button(
@@ -153,7 +157,6 @@ class TradeMenu:
         self.trader1 = trader1
         self.trader2 = trader2
         self.embed = discord.Embed()
-        self.task: asyncio.Task | None = None
         self.current_view: TradeView | ConfirmView = TradeView(self)
         self.message: discord.Message
 
@@ -177,42 +180,39 @@ class TradeMenu:
             "Once you're finished, click the lock button below to confirm your proposal.\n"
             "You can also lock with nothing if you're receiving a gift.\n\n"
             "*This trade will timeout "
-            f"{format_dt(utcnow() + timedelta(minutes=30), style='R')}.*\n\n"
+            f"{format_dt(utcnow() + timedelta(seconds=TRADE_TIMEOUT), style='R')}.*\n\n"
             f"Use the {view_command} command to see the full"
             f" list of {settings.plural_collectible_name}."
         )
         self.embed.set_footer(
-            text="This message is updated every 15 seconds, "
-            "but you can keep on editing your proposal."
+            text="This message is updated a few seconds after each change, "
+            "you can keep on editing your proposal."
         )
 
-    async def update_message_loop(self):
+    def mark_dirty(self):
         """
-        A loop task that updates each 5 second the menu with the new content.
+        Schedule an update of the message after a change of the proposals or state.
         """
+        self.cog.scheduler.mark_dirty(self)
 
-        assert self.task
-        start_time = datetime.utcnow()
-
-        while True:
-            await asyncio.sleep(15)
-            if datetime.utcnow() - start_time > timedelta(minutes=15):
-                self.embed.colour = discord.Colour.dark_red()
-                await self.cancel("The trade timed out")
-                return
+    async def refresh(self):
+        """
+        Update the message with the current proposals, called by the scheduler.
+        """
+        try:
+            fill_trade_embed_fields(self.embed, self.bot, self.trader1, self.trader2)
+            await self.message.edit(embed=self.embed)
+        except Exception:
+            log.exception(
+                "Failed to refresh the trade menu "
+                f"guild={self.message.guild.id} "  # type: ignore
+                f"trader1={self.trader1.user.id} trader2={self.trader2.user.id}"
+            )
+            await self.timeout()
 
-            try:
-                fill_trade_embed_fields(self.embed, self.bot, self.trader1, self.trader2)
-                await self.message.edit(embed=self.embed)
-            except Exception:
-                log.exception(
-                    "Failed to refresh the trade menu "
-                    f"guild={self.message.guild.id} "  # type: ignore
-                    f"trader1={self.trader1.user.id} trader2={self.trader2.user.id}"
-                )
-                self.embed.colour = discord.Colour.dark_red()
-                await self.cancel("The trade timed out")
-                return
+    async def timeout(self):
+        self.embed.colour = discord.Colour.dark_red()
+        await self.cancel("The trade timed out")
 
     async def start(self):
         """
@@ -226,17 +226,16 @@ class TradeMenu:
             embed=self.embed,
             view=self.current_view,
         )
-        self.task = self.bot.loop.create_task(self.update_message_loop())
+        self.cog.scheduler.add(self)
 
     async def cancel(self, reason: str = "The trade has been cancelled."):
         """
         Cancel the trade immediately.
         """
-        if self.task:
-            self.task.cancel()
+        self.cog.scheduler.remove(self)
+        self.cog.registry.remove(self)
 
-        for countryball in self.trader1.proposal + self.trader2.proposal:
-            await countryball.unlock()
+        await ball_locks.unlock(self.trader1.proposal + self.trader2.proposal)
 
         self.current_view.stop()
         for item in self.current_view.children:
@@ -252,8 +251,7 @@ class TradeMenu:
         """
         trader.locked = True
         if self.trader1.locked and self.trader2.locked:
-            if self.task:
-                self.task.cancel()
+            self.cog.scheduler.remove(self)
             self.current_view.stop()
             fill_trade_embed_fields(self.embed, self.bot, self.trader1, self.trader2)
 
@@ -263,6 +261,8 @@ class TradeMenu:
             )
             self.current_view = ConfirmView(self)
             await self.message.edit(content=None, embed=self.embed, view=self.current_view)
+        else:
+            self.mark_dirty()
 
     async def user_cancel(self, trader: TradingUser):
         """
@@ -273,38 +273,16 @@ class TradeMenu:
         await self.cancel()
 
     async def perform_trade(self):
-        valid_transferable_countryballs: list[BallInstance] = []
-
-        trade = await Trade.create(player1=self.trader1.player, player2=self.trader2.player)
-
-        for countryball in self.trader1.proposal:
-            await countryball.refresh_from_db()
-            if countryball.player.discord_id != self.trader1.player.discord_id:
-                # This is a invalid mutation, the player is not the owner of the countryball
-                raise InvalidTradeOperation()
-            countryball.player = self.trader2.player
-            countryball.trade_player = self.trader1.player
-            countryball.favorite = False
-            valid_transferable_countryballs.append(countryball)
-            await TradeObject.create(
-                trade=trade, ballinstance=countryball, player=self.trader1.player
-            )
-
-        for countryball in self.trader2.proposal:
-            if countryball.player.discord_id != self.trader2.player.discord_id:
-                # This is a invalid mutation, the player is not the owner of the countryball
-                raise InvalidTradeOperation()
-            countryball.player = self.trader1.player
-            countryball.trade_player = self.trader2.player
-            countryball.favorite = False
-            valid_transferable_countryballs.append(countryball)
-            await TradeObject.create(
-                trade=trade, ballinstance=countryball, player=self.trader2.player
+        try:
+            await commit_trade(
+                self.trader1.player,
+                self.trader2.player,
+                self.trader1.proposal,
+                self.trader2.proposal,
             )
-
-        for countryball in valid_transferable_countryballs:
-            await countryball.unlock()
-            await countryball.save()
+        except TradeConflict as e:
+            # This is a invalid mutation, the player is not the owner of the countryball
+            raise InvalidTradeOperation() from e
 
     async def confirm(self, trader: TradingUser) -> bool:
         """
@@ -316,9 +294,9 @@ class TradeMenu:
         trader.accepted = True
         fill_trade_embed_fields(self.embed, self.bot, self.trader1, self.trader2)
         if self.trader1.accepted and self.trader2.accepted:
-            if self.task and not self.task.cancelled():
-                # shouldn't happen but just in case
-                self.task.cancel()
+            # shouldn't be needed but just in case
+            self.cog.scheduler.remove(self)
+            self.cog.registry.remove(self)
 
             self.embed.description = "Trade concluded!"
             self.embed.colour = discord.Colour.green()
@@ -364,6 +342,8 @@ class CountryballsSelector(Pages):
     ):
         self.bot = interaction.client
         self.interaction = interaction
+        # instances displayed on the current page, selections are taken from there
+        self.page_balls: Dict[int, BallInstance] = {}
         source = CountryballsSource(balls)
         super().__init__(source, interaction=interaction)
         self.add_item(self.select_ball_menu)
@@ -374,6 +354,7 @@ class CountryballsSelector(Pages):
         self.cog = cog
 
     def set_options(self, balls: List[BallInstance]):
+        self.page_balls = {ball.pk: ball for ball in balls}
         options: List[discord.SelectOption] = []
         for ball in balls:
             if ball.is_tradeable is False:
@@ -394,24 +375,28 @@ class CountryballsSelector(Pages):
             )
         self.select_ball_menu.options = options
 
+    async def get_selected_balls(self, values: List[str]) -> List[BallInstance]:
+        """
+        Return the instances matching the selected values, from the current page or with a
+        single query for those that are not displayed anymore.
+        """
+        pks = [int(x) for x in values]
+        if missing := [x for x in pks if x not in self.page_balls]:
+            for ball in await BallInstance.filter(id__in=missing).select_related("ball", "player"):
+                self.page_balls[ball.pk] = ball
+        return [self.page_balls[x] for x in pks if x in self.page_balls]
+
     @discord.ui.select(min_values=1, max_values=25)
     async def select_ball_menu(self, interaction: discord.Interaction, item: discord.ui.Select):
-        for value in item.values:
-            ball_instance = await BallInstance.get(id=int(value)).prefetch_related(
-                "ball", "player"
-            )
-            self.balls_selected.add(ball_instance)
+        self.balls_selected.update(await self.get_selected_balls(item.values))
         await interaction.response.defer()
 
     @discord.ui.button(label="Select Page", style=discord.ButtonStyle.secondary)
     async def select_all_button(self, interaction: discord.Interaction, button: Button):
         await interaction.response.defer(thinking=True, ephemeral=True)
-        for ball in self.select_ball_menu.options:
-            ball_instance = await BallInstance.get(id=int(ball.value)).prefetch_related(
-                "ball", "player"
-            )
-            if ball_instance not in self.balls_selected:
-                self.balls_selected.add(ball_instance)
+        self.balls_selected.update(
+            await self.get_selected_balls([x.value for x in self.select_ball_menu.options])
+        )
         await interaction.followup.send(
             (
                 f"All {settings.plural_collectible_name} on this page have been selected.\n"
@@ -454,8 +439,15 @@ class CountryballsSelector(Pages):
                     f"{settings.collectible_name.title()} #{ball.pk:0X} is not tradeable.",
                     ephemeral=True,
                 )
-            trader.proposal.append(ball)
-            await ball.lock_for_trade()
+            if ball_locks.is_locked(ball.pk):
+                return await interaction.followup.send(
+                    f"{settings.collectible_name.title()} #{ball.pk:0X} is currently in an "
+                    "active trade or donation, please try again later.",
+                    ephemeral=True,
+                )
+        await ball_locks.lock(list(self.balls_selected))
+        trader.proposal.extend(self.balls_selected)
+        trade.mark_dirty()
         grammar = (
             f"{settings.collectible_name}"
             if len(self.balls_selected) == 1
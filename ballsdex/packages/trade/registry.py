@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ballsdex.packages.trade.menu import TradeMenu
+
+log = logging.getLogger("ballsdex.packages.trade.registry")
+
+SWEEP_INTERVAL = 60
+
+
+class TradeRegistry:
+    """
+    Ongoing trades, indexed by the Discord ID of both traders. A user can only be part of one
+    active trade at a time.
+
+    Trades are removed when they end, a background task also sweeps the ones that finished
+    without being removed (view timeout, error). Finished trades are never returned.
+
+    The rest of the cog only goes through `get`, `add` and `remove`, so this can be replaced by
+    an implementation backed by a shared store to run trades across processes.
+    """
+
+    def __init__(self):
+        self.trades: dict[int, TradeMenu] = {}
+        self.task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(set(self.trades.values()))
+
+    @staticmethod
+    def is_active(menu: TradeMenu) -> bool:
+        return not (
+            menu.current_view.is_finished() or menu.trader1.cancelled or menu.trader2.cancelled
+        )
+
+    def get(self, user_id: int) -> TradeMenu | None:
+        """
+        Return the active trade of a user, if any.
+        """
+        menu = self.trades.get(user_id)
+        if menu is None:
+            return None
+        if not self.is_active(menu):
+            self.remove(menu)
+            return None
+        return menu
+
+    def add(self, menu: TradeMenu):
+        """
+        Register a new trade.
+
+        Raises
+        ------
+        ValueError
+            One of the traders is already in an active trade.
+        """
+        users = (menu.trader1.user.id, menu.trader2.user.id)
+        if any(self.get(x) for x in users):
+            raise ValueError("One of the traders is already in a trade")
+        for user_id in users:
+            self.trades[user_id] = menu
+
+    def remove(self, menu: TradeMenu):
+        for user_id in (menu.trader1.user.id, menu.trader2.user.id):
+            if self.trades.get(user_id) is menu:
+                del self.trades[user_id]
+
+    def sweep(self) -> int:
+        """
+        Remove the finished trades and return how many were removed.
+        """
+        finished = {x for x in self.trades.values() if not self.is_active(x)}
+        for menu in finished:
+            self.remove(menu)
+        return len(finished)
+
+    def start(self):
+        self.task = asyncio.create_task(self.sweep_loop())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            if removed := self.sweep():
+                log.debug(f"Swept {removed} finished trades, {len(self)} remaining")
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from enum import Enum
+from typing import TYPE_CHECKING, Coroutine
+
+if TYPE_CHECKING:
+    from ballsdex.packages.trade.menu import TradeMenu
+
+log = logging.getLogger("ballsdex.packages.trade.scheduler")
+
+# time after which an unlocked trade is cancelled
+TRADE_TIMEOUT = 15 * 60
+# delay between a change and the edit of the message, to merge bursts of changes in one edit
+REFRESH_DELAY = 2
+# minimum time between two edits of the same trade message
+MIN_REFRESH_INTERVAL = 5
+
+
+class TimerAction(Enum):
+    REFRESH = 0
+    TIMEOUT = 1
+
+
+class TradeScheduler:
+    """
+    Refreshes the messages of all open trades and times them out, from a single task.
+
+    Trades are only edited after being marked as changed with `mark_dirty`, a few seconds
+    later so that consecutive changes are merged in one edit, and never more often than
+    `MIN_REFRESH_INTERVAL`. Refreshes and timeouts of all trades are kept in one heap of timers,
+    the task sleeps until the earliest one is due.
+
+    Timers of trades removed with `remove` are left in the heap and skipped when due.
+    """
+
+    def __init__(self):
+        self.menus: set[TradeMenu] = set()
+        self.dirty: set[TradeMenu] = set()
+        self.last_refresh: dict[TradeMenu, float] = {}
+        self.timers: list[tuple[float, int, TimerAction, TradeMenu]] = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.running: set[asyncio.Task] = set()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _push(self, when: float, action: TimerAction, menu: TradeMenu):
+        heapq.heappush(self.timers, (when, next(self.counter), action, menu))
+        self.wakeup.set()
+
+    def add(self, menu: TradeMenu):
+        """
+        Start tracking a trade, which will time out after `TRADE_TIMEOUT` seconds.
+        """
+        now = self._now()
+        self.menus.add(menu)
+        self.last_refresh[menu] = now
+        self._push(now + TRADE_TIMEOUT, TimerAction.TIMEOUT, menu)
+
+    def remove(self, menu: TradeMenu):
+        """
+        Stop refreshing and timing out a trade.
+        """
+        self.menus.discard(menu)
+        self.dirty.discard(menu)
+        self.last_refresh.pop(menu, None)
+
+    def mark_dirty(self, menu: TradeMenu):
+        """
+        Schedule an edit of the trade message, following a change of the proposals or state.
+        """
+        if menu not in self.menus or menu in self.dirty:
+            return
+        self.dirty.add(menu)
+        when = max(self._now() + REFRESH_DELAY, self.last_refresh[menu] + MIN_REFRESH_INTERVAL)
+        self._push(when, TimerAction.REFRESH, menu)
+
+    def _spawn(self, coro: Coroutine, menu: TradeMenu):
+        async def wrapper():
+            try:
+                await coro
+            except Exception:
+                log.exception(
+                    f"Failed to run a scheduled action on trade "
+                    f"trader1={menu.trader1.user.id} trader2={menu.trader2.user.id}"
+                )
+
+        # edits run in their own tasks to not delay the timers of other trades
+        task = asyncio.create_task(wrapper())
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            delay = self.timers[0][0] - self._now() if self.timers else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, action, menu = heapq.heappop(self.timers)
+            if menu not in self.menus:
+                continue
+            if action == TimerAction.REFRESH:
+                self.dirty.discard(menu)
+                self.last_refresh[menu] = self._now()
+                self._spawn(menu.refresh(), menu)
+            else:
+                self.remove(menu)
+                self._spawn(menu.timeout(), menu)
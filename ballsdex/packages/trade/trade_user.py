@@ -20,5 +20,5 @@ class TradingUser:
     @classmethod
     async def from_trade_model(cls, trade: "Trade", player: "Player", bot: "BallsDexBot"):
         proposal = await trade.tradeobjects.filter(player=player).prefetch_related("ballinstance")
-        user = await bot.fetch_user(player.discord_id)
+        user = await bot.user_resolver.fetch(player.discord_id)
         return cls(user, player, [x.ballinstance for x in proposal])
@@ -93,6 +93,8 @@ class Settings:
     prometheus_enabled: bool = False
     prometheus_host: str = "0.0.0.0"
     prometheus_port: int = 15260
+    prometheus_lag_interval: float = 0.25
+    prometheus_slow_callback: float = 0.1
 
 
 settings = Settings()
@@ -130,6 +132,8 @@ def read_settings(path: "Path"):
     settings.prometheus_enabled = content["prometheus"]["enabled"]
     settings.prometheus_host = content["prometheus"]["host"]
     settings.prometheus_port = content["prometheus"]["port"]
+    settings.prometheus_lag_interval = content["prometheus"].get("lag-sample-interval", 0.25)
+    settings.prometheus_slow_callback = content["prometheus"].get("slow-callback-duration", 0.1)
 
     settings.max_favorites = content.get("max-favorites", 50)
     settings.max_attack_bonus = content.get("max-attack-bonus", 20)
@@ -224,6 +228,12 @@ prometheus:
   enabled: false
   host: "0.0.0.0"
   port: 15260
+
+  # time in seconds between two measures of the event loop delay
+  lag-sample-interval: 0.25
+
+  # time in seconds after which a coroutine blocking the event loop is reported
+  slow-callback-duration: 0.1
   """  # noqa: W291
     )
 
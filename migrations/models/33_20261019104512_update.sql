@@ -0,0 +1,10 @@
+-- upgrade --
+ALTER TABLE "ball" ADD "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE "economy" ADD "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE "regime" ADD "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE "special" ADD "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP;
+-- downgrade --
+ALTER TABLE "ball" DROP COLUMN "updated_at";
+ALTER TABLE "economy" DROP COLUMN "updated_at";
+ALTER TABLE "regime" DROP COLUMN "updated_at";
+ALTER TABLE "special" DROP COLUMN "updated_at";
\ No newline at end of file
@@ -0,0 +1,28 @@
+-- upgrade --
+-- aerich splits statements on ";\n", the function body must not contain any
+CREATE OR REPLACE FUNCTION ballsdex_notify_change() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('ballsdex_cache', jsonb_strip_nulls(jsonb_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'id', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END,
+        'old', CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) -> TG_ARGV[0] END,
+        'new', CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) -> TG_ARGV[0] END
+    ))::text); RETURN NULL; END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER "ball_notify_change" AFTER INSERT OR UPDATE OR DELETE ON "ball" FOR EACH ROW EXECUTE PROCEDURE ballsdex_notify_change();
+CREATE TRIGGER "regime_notify_change" AFTER INSERT OR UPDATE OR DELETE ON "regime" FOR EACH ROW EXECUTE PROCEDURE ballsdex_notify_change();
+CREATE TRIGGER "economy_notify_change" AFTER INSERT OR UPDATE OR DELETE ON "economy" FOR EACH ROW EXECUTE PROCEDURE ballsdex_notify_change();
+CREATE TRIGGER "special_notify_change" AFTER INSERT OR UPDATE OR DELETE ON "special" FOR EACH ROW EXECUTE PROCEDURE ballsdex_notify_change();
+CREATE TRIGGER "guildconfig_notify_change" AFTER INSERT OR UPDATE OR DELETE ON "guildconfig" FOR EACH ROW EXECUTE PROCEDURE ballsdex_notify_change('guild_id');
+CREATE TRIGGER "blacklistedid_notify_change" AFTER INSERT OR UPDATE OR DELETE ON "blacklistedid" FOR EACH ROW EXECUTE PROCEDURE ballsdex_notify_change('discord_id');
+CREATE TRIGGER "blacklistedguild_notify_change" AFTER INSERT OR UPDATE OR DELETE ON "blacklistedguild" FOR EACH ROW EXECUTE PROCEDURE ballsdex_notify_change('discord_id');
+-- downgrade --
+DROP TRIGGER IF EXISTS "ball_notify_change" ON "ball";
+DROP TRIGGER IF EXISTS "regime_notify_change" ON "regime";
+DROP TRIGGER IF EXISTS "economy_notify_change" ON "economy";
+DROP TRIGGER IF EXISTS "special_notify_change" ON "special";
+DROP TRIGGER IF EXISTS "guildconfig_notify_change" ON "guildconfig";
+DROP TRIGGER IF EXISTS "blacklistedid_notify_change" ON "blacklistedid";
+DROP TRIGGER IF EXISTS "blacklistedguild_notify_change" ON "blacklistedguild";
+DROP FUNCTION IF EXISTS ballsdex_notify_change();
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- upgrade --
+CREATE INDEX IF NOT EXISTS "idx_ballinstance_player_ball" ON "ballinstance" ("player_id", "ball_id");
+CREATE INDEX IF NOT EXISTS "idx_ballinstance_player_catch_date" ON "ballinstance" ("player_id", "catch_date" DESC, "id");
+CREATE INDEX IF NOT EXISTS "idx_ballinstance_player_favorite" ON "ballinstance" ("player_id", "favorite" DESC, "shiny" DESC, "id");
+-- downgrade --
+DROP INDEX IF EXISTS "idx_ballinstance_player_ball";
+DROP INDEX IF EXISTS "idx_ballinstance_player_catch_date";
+DROP INDEX IF EXISTS "idx_ballinstance_player_favorite";
\ No newline at end of file
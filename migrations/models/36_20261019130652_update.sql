@@ -0,0 +1,54 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "collectionsummary" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "player_id" INT NOT NULL,
+    "ball_id" INT NOT NULL,
+    "shiny" BOOL NOT NULL,
+    "special_id" INT,
+    "count" INT NOT NULL  DEFAULT 0,
+    "favorite_count" INT NOT NULL  DEFAULT 0
+);
+COMMENT ON TABLE "collectionsummary" IS 'Number of instances owned per player, ball, shiny and special, maintained by triggers';
+CREATE UNIQUE INDEX IF NOT EXISTS "uid_collectionsummary_key" ON "collectionsummary" ("player_id", "ball_id", "shiny", (COALESCE("special_id", 0)));
+-- the trigger functions only contain one statement each, aerich splits statements on ";\n"
+-- they use statement-level transition tables, one bulk update applies all its rows at once
+CREATE OR REPLACE FUNCTION ballsdex_collection_insert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO "collectionsummary" AS "c" ("player_id", "ball_id", "shiny", "special_id", "count", "favorite_count")
+    SELECT "player_id", "ball_id", "shiny", "special_id", COUNT(*), COUNT(*) FILTER (WHERE "favorite")
+    FROM "new_rows" GROUP BY 1, 2, 3, 4
+    ON CONFLICT ("player_id", "ball_id", "shiny", (COALESCE("special_id", 0))) DO UPDATE
+    SET "count" = "c"."count" + EXCLUDED."count", "favorite_count" = "c"."favorite_count" + EXCLUDED."favorite_count"; RETURN NULL; END
+$$ LANGUAGE plpgsql;
+CREATE OR REPLACE FUNCTION ballsdex_collection_delete() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO "collectionsummary" AS "c" ("player_id", "ball_id", "shiny", "special_id", "count", "favorite_count")
+    SELECT "player_id", "ball_id", "shiny", "special_id", -COUNT(*), -COUNT(*) FILTER (WHERE "favorite")
+    FROM "old_rows" GROUP BY 1, 2, 3, 4
+    ON CONFLICT ("player_id", "ball_id", "shiny", (COALESCE("special_id", 0))) DO UPDATE
+    SET "count" = "c"."count" + EXCLUDED."count", "favorite_count" = "c"."favorite_count" + EXCLUDED."favorite_count"; RETURN NULL; END
+$$ LANGUAGE plpgsql;
+CREATE OR REPLACE FUNCTION ballsdex_collection_update() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO "collectionsummary" AS "c" ("player_id", "ball_id", "shiny", "special_id", "count", "favorite_count")
+    SELECT "player_id", "ball_id", "shiny", "special_id", SUM("delta"), SUM("favorite_delta")
+    FROM (
+        SELECT "player_id", "ball_id", "shiny", "special_id", -1 AS "delta", -"favorite"::INT AS "favorite_delta" FROM "old_rows"
+        UNION ALL
+        SELECT "player_id", "ball_id", "shiny", "special_id", 1, "favorite"::INT FROM "new_rows"
+    ) AS "changes" GROUP BY 1, 2, 3, 4 HAVING SUM("delta") <> 0 OR SUM("favorite_delta") <> 0
+    ON CONFLICT ("player_id", "ball_id", "shiny", (COALESCE("special_id", 0))) DO UPDATE
+    SET "count" = "c"."count" + EXCLUDED."count", "favorite_count" = "c"."favorite_count" + EXCLUDED."favorite_count"; RETURN NULL; END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER "ballinstance_collection_insert" AFTER INSERT ON "ballinstance" REFERENCING NEW TABLE AS "new_rows" FOR EACH STATEMENT EXECUTE PROCEDURE ballsdex_collection_insert();
+CREATE TRIGGER "ballinstance_collection_delete" AFTER DELETE ON "ballinstance" REFERENCING OLD TABLE AS "old_rows" FOR EACH STATEMENT EXECUTE PROCEDURE ballsdex_collection_delete();
+CREATE TRIGGER "ballinstance_collection_update" AFTER UPDATE ON "ballinstance" REFERENCING OLD TABLE AS "old_rows" NEW TABLE AS "new_rows" FOR EACH STATEMENT EXECUTE PROCEDURE ballsdex_collection_update();
+INSERT INTO "collectionsummary" ("player_id", "ball_id", "shiny", "special_id", "count", "favorite_count") SELECT "player_id", "ball_id", "shiny", "special_id", COUNT(*), COUNT(*) FILTER (WHERE "favorite") FROM "ballinstance" GROUP BY 1, 2, 3, 4;
+-- downgrade --
+DROP TRIGGER IF EXISTS "ballinstance_collection_insert" ON "ballinstance";
+DROP TRIGGER IF EXISTS "ballinstance_collection_delete" ON "ballinstance";
+DROP TRIGGER IF EXISTS "ballinstance_collection_update" ON "ballinstance";
+DROP FUNCTION IF EXISTS ballsdex_collection_insert();
+DROP FUNCTION IF EXISTS ballsdex_collection_delete();
+DROP FUNCTION IF EXISTS ballsdex_collection_update();
+DROP TABLE IF EXISTS "collectionsummary";
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- upgrade --
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- the indexed expressions must match the SQL generated for BallInstanceTransformer.search_database
+CREATE INDEX IF NOT EXISTS "idx_ball_search_trgm" ON "ball" USING GIN ((CAST(LOWER("country" || ' ' || COALESCE("catch_names", '')) AS VARCHAR)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS "idx_ballinstance_player_hex_id" ON "ballinstance" ("player_id", (CAST(to_hex("id") AS VARCHAR)) varchar_pattern_ops);
+-- downgrade --
+DROP INDEX IF EXISTS "idx_ball_search_trgm";
+DROP INDEX IF EXISTS "idx_ballinstance_player_hex_id";
\ No newline at end of file
@@ -0,0 +1,4 @@
+-- upgrade --
+CREATE INDEX IF NOT EXISTS "idx_ballinstance_server_catch_date" ON "ballinstance" ("server_id", "catch_date") INCLUDE ("player_id");
+-- downgrade --
+DROP INDEX IF EXISTS "idx_ballinstance_server_catch_date";
\ No newline at end of file
@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from discord import app_commands
+
+from ballsdex.core.utils.transformers import AutocompleteDispatcher
+
+
+def make_interaction():
+    return SimpleNamespace(
+        user=SimpleNamespace(id=1),
+        command=SimpleNamespace(qualified_name="trade add"),
+        data={"options": [{"name": "countryball", "focused": True}]},
+        namespace=[],
+        created_at=datetime.now(tz=timezone.utc),
+    )
+
+
+async def test_empty_result_does_not_hide_longer_texts():
+    dispatcher = AutocompleteDispatcher()
+    interaction = make_interaction()
+    searched: list[str] = []
+
+    def search(value: str):
+        async def callback():
+            searched.append(value)
+            # "#" alone matches nothing, "#1A" is an ID prefix
+            if value == "#":
+                return []
+            return [app_commands.Choice(name="#1A2B Example", value="6699")]
+
+        return callback
+
+    assert await dispatcher.dispatch(interaction, "#", search("#")) == []  # type: ignore
+    choices = await dispatcher.dispatch(interaction, "#1A", search("#1A"))  # type: ignore
+    assert [x.value for x in choices] == ["6699"]
+    assert searched == ["#", "#1A"]
+
+
+async def test_same_text_is_reused():
+    dispatcher = AutocompleteDispatcher()
+    interaction = make_interaction()
+    calls = 0
+
+    async def callback():
+        nonlocal calls
+        calls += 1
+        return [app_commands.Choice(name="Example", value="1")]
+
+    await dispatcher.dispatch(interaction, "exa", callback)  # type: ignore
+    await dispatcher.dispatch(interaction, "exa", callback)  # type: ignore
+    assert calls == 1
+
+
+def refine(choices: list[app_commands.Choice], value: str) -> list[app_commands.Choice]:
+    return [x for x in choices if value in x.name.lower()]
+
+
+async def test_longer_text_is_refined_from_prefix():
+    dispatcher = AutocompleteDispatcher()
+    interaction = make_interaction()
+    searched: list[str] = []
+
+    async def callback():
+        searched.append("exa")
+        return [
+            app_commands.Choice(name="Example", value="1"),
+            app_commands.Choice(name="Exalted", value="2"),
+        ]
+
+    await dispatcher.dispatch(interaction, "exa", callback, refine=refine)  # type: ignore
+    choices = await dispatcher.dispatch(
+        interaction, "exam", callback, refine=refine  # type: ignore
+    )
+    assert [x.value for x in choices] == ["1"]
+    assert searched == ["exa"]
+
+
+async def test_truncated_prefix_results_are_not_refined():
+    dispatcher = AutocompleteDispatcher()
+    interaction = make_interaction()
+    calls = 0
+
+    async def callback():
+        nonlocal calls
+        calls += 1
+        return [app_commands.Choice(name=f"Example {i}", value=str(i)) for i in range(25)]
+
+    await dispatcher.dispatch(interaction, "exa", callback, refine=refine)  # type: ignore
+    await dispatcher.dispatch(interaction, "exam", callback, refine=refine)  # type: ignore
+    assert calls == 2
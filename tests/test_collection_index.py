@@ -0,0 +1,38 @@
+import asyncio
+
+from ballsdex.core.utils.collection_index import CollectionIndex, CollectionIndexCache
+
+
+class CountingCache(CollectionIndexCache):
+    def __init__(self, player_id: int | None, **kwargs):
+        super().__init__(**kwargs)
+        self.player_id = player_id
+        self.builds = 0
+
+    async def build(self, discord_id: int) -> CollectionIndex:
+        self.builds += 1
+        return CollectionIndex(self.player_id)
+
+
+async def test_empty_collection_is_reused():
+    cache = CountingCache(player_id=1)
+    assert cache.get_nowait(100) is None
+    await cache.building[100]
+    await asyncio.sleep(0)  # let the done callback store the index
+    for _ in range(3):
+        index = cache.get_nowait(100)
+        assert index is not None and len(index) == 0
+    assert await cache.get(100) is index
+    assert cache.builds == 1
+
+
+async def test_unregistered_user_is_remembered_briefly():
+    cache = CountingCache(player_id=None, unregistered_ttl=30)
+    await cache.get(100)
+    assert cache.get_nowait(100) is not None
+    assert cache.builds == 1
+
+    cache.invalidate(100)
+    assert cache.get_nowait(100) is None
+    await cache.building[100]
+    assert cache.builds == 2
@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+from ballsdex.core.metrics import DispatchTiming, current_dispatch
+from ballsdex.core.utils.queries import (
+    create_background_task,
+    current_queries,
+    query_budgets,
+    track_interaction,
+)
+
+
+async def test_background_task_is_not_tracked():
+    async def background():
+        return current_queries.get(), current_dispatch.get()
+
+    async def handler():
+        current_dispatch.set(DispatchTiming("test", "command", 0))
+        track_interaction(SimpleNamespace(extras={}), "test")
+        return create_background_task(background())
+
+    task = await asyncio.create_task(handler())
+    assert await task == (None, None)
+
+
+async def test_observed_stats_stop_counting():
+    name = next(iter(query_budgets()))
+
+    async def handler():
+        return track_interaction(SimpleNamespace(extras={}), name)
+
+    stats = await asyncio.create_task(handler())
+    await asyncio.sleep(0)  # let the done callback observe the stats
+    assert stats.observed
+    stats.add("SELECT 1", 0.1)
+    assert stats.count == 0
@@ -0,0 +1,234 @@
+import asyncio
+from datetime import datetime, timezone
+from io import BytesIO
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from tortoise.timezone import now as tortoise_now
+
+from ballsdex.core.models import (
+    Ball,
+    BallInstance,
+    GuildConfig,
+    Player,
+    Regime,
+    Special,
+    balls,
+)
+from ballsdex.core.utils.collection_index import collection_indexes
+from ballsdex.core.utils.paginator import KeysetPageSource
+from ballsdex.core.utils.queries import assert_max_queries
+from ballsdex.core.utils.tortoise import rebuild_collection_summary
+from ballsdex.core.utils.transformers import BallInstanceTransformer, autocomplete_dispatcher
+from ballsdex.packages.balls.cog import Balls, SortingChoices, get_list_ordering
+from ballsdex.packages.countryballs.components import CountryballNamePrompt
+from ballsdex.packages.countryballs.countryball import CountryBall
+from ballsdex.packages.trade.menu import TradeMenu
+from ballsdex.packages.trade.trade_user import TradingUser
+from ballsdex.settings import settings
+
+pytestmark = pytest.mark.usefixtures("database")
+
+GROUP = settings.players_group_cog_name
+# the models only accept values looking like Discord IDs
+USER1 = 100000000000000001
+USER2 = 100000000000000002
+GUILD = 100000000000000010
+EMOJI = 100000000000000100
+
+
+def make_interaction(user_id: int = USER1, guild_id: int = GUILD) -> MagicMock:
+    interaction = MagicMock()
+    interaction.user.id = user_id
+    interaction.user.guild.id = guild_id
+    interaction.user.guild.member_count = 100
+    interaction.guild = None
+    interaction.guild_id = guild_id
+    interaction.command = None
+    interaction.namespace = []
+    interaction.data = {"options": [{"name": "countryball", "focused": True}]}
+    interaction.created_at = datetime.now(tz=timezone.utc)
+    interaction.client.get_emoji.return_value = None
+    interaction.client.catch_log = set()
+    interaction.response.is_done.return_value = True
+    interaction.response.defer = AsyncMock()
+    interaction.response.send_message = AsyncMock()
+    interaction.followup.send = AsyncMock()
+    interaction.followup.edit_message = AsyncMock()
+    return interaction
+
+
+@pytest.fixture
+async def ball():
+    regime = await Regime.create(name="Regime", background="/regime.png")
+    ball = await Ball.create(
+        country="Example",
+        regime=regime,
+        health=100,
+        attack=100,
+        rarity=1,
+        emoji_id=EMOJI,
+        wild_card="/wild.png",
+        collection_card="/card.png",
+        credits="Tests",
+        capacity_name="Capacity",
+        capacity_description="Does nothing",
+    )
+    balls[ball.pk] = ball
+    yield ball
+    balls.clear()
+    collection_indexes.indexes.clear()
+    collection_indexes.unregistered.clear()
+    autocomplete_dispatcher.results.clear()
+
+
+async def create_collection(ball: Ball, discord_id: int, count: int) -> Player:
+    player = await Player.create(discord_id=discord_id)
+    await BallInstance.bulk_create([BallInstance(ball=ball, player=player) for _ in range(count)])
+    return player
+
+
+async def test_list(ball: Ball):
+    await create_collection(ball, USER1, 30)
+    cog = Balls(MagicMock())
+    interaction = make_interaction()
+    async with assert_max_queries(f"{GROUP} list") as stats:
+        await cog.list.callback(cog, interaction)
+    assert stats.count > 0
+    interaction.followup.send.assert_awaited_once()
+
+
+async def test_list_sorted_by_duplicates(ball: Ball):
+    player = await create_collection(ball, USER1, 2)
+    other = await Ball.create(
+        country="Other",
+        regime_id=ball.regime_id,
+        health=100,
+        attack=100,
+        rarity=1,
+        emoji_id=EMOJI,
+        wild_card="/wild.png",
+        collection_card="/card.png",
+        credits="Tests",
+        capacity_name="Capacity",
+        capacity_description="Does nothing",
+    )
+    await BallInstance.bulk_create([BallInstance(ball=other, player=player) for _ in range(3)])
+    # the test schema has no triggers maintaining the summary
+    await rebuild_collection_summary(player.pk)
+    queryset, ordering = get_list_ordering(
+        BallInstance.filter(player=player), SortingChoices.duplicates
+    )
+    source = KeysetPageSource(queryset, ordering, ("ball_id",), per_page=3)
+    await source.prepare()
+    assert await source.get_page(0) == [(other.pk,)] * 3
+    # the next page is filtered by the sort keys of the last entry
+    assert await source.get_page(1) == [(ball.pk,)] * 2
+
+
+async def test_completion(ball: Ball):
+    await create_collection(ball, USER1, 30)
+    cog = Balls(MagicMock())
+    interaction = make_interaction()
+    async with assert_max_queries(f"{GROUP} completion") as stats:
+        await cog.completion.callback(cog, interaction)
+    assert stats.count > 0
+    interaction.followup.send.assert_awaited_once()
+
+
+async def test_info(ball: Ball, monkeypatch: pytest.MonkeyPatch):
+    player = await create_collection(ball, USER1, 0)
+    previous_owner = await Player.create(discord_id=USER2)
+    special = await Special.create(
+        name="Special", start_date=tortoise_now(), end_date=tortoise_now(), rarity=0.1
+    )
+    # the slowest case, the related objects of an instance obtained by trade are fetched
+    instance = await BallInstance.create(
+        ball=ball, player=player, trade_player=previous_owner, special=special
+    )
+    # drawing the card needs the artworks, and sends no query
+    monkeypatch.setattr(BallInstance, "draw_card", lambda self: BytesIO())
+    cog = Balls(MagicMock())
+    interaction = make_interaction()
+    interaction.client.loop = asyncio.get_running_loop()
+    interaction.client.user_resolver.fetch = AsyncMock()
+    async with assert_max_queries(f"{GROUP} info") as stats:
+        countryball = await BallInstanceTransformer().transform(interaction, str(instance.pk))
+        await cog.info.callback(cog, interaction, countryball)
+    assert stats.count > 0
+    interaction.followup.send.assert_awaited_once()
+
+
+async def test_autocomplete(ball: Ball):
+    await create_collection(ball, USER1, 30)
+    interaction = make_interaction()
+    # the collection index is built in the background, the first search uses the database
+    async with assert_max_queries("autocomplete") as stats:
+        choices = await BallInstanceTransformer().autocomplete(interaction, "exa")
+    assert stats.count > 0
+    assert len(choices) == 25
+
+    await collection_indexes.get(USER1)
+    async with assert_max_queries("autocomplete", 0):
+        choices = await BallInstanceTransformer().autocomplete(interaction, "exam")
+    assert len(choices) == 25
+
+
+async def test_autocomplete_refines_prefix_results(ball: Ball, monkeypatch: pytest.MonkeyPatch):
+    player = await create_collection(ball, USER1, 5)
+    other = await Ball.create(
+        country="Exalted",
+        regime_id=ball.regime_id,
+        health=100,
+        attack=100,
+        rarity=1,
+        emoji_id=EMOJI,
+        wild_card="/wild.png",
+        collection_card="/card.png",
+        credits="Tests",
+        capacity_name="Capacity",
+        capacity_description="Does nothing",
+    )
+    balls[other.pk] = other
+    await BallInstance.bulk_create([BallInstance(ball=other, player=player) for _ in range(5)])
+    # searching in the database, as if the collection index was still being built
+    monkeypatch.setattr(collection_indexes, "get_nowait", lambda discord_id: None)
+    interaction = make_interaction()
+    async with assert_max_queries("autocomplete"):
+        choices = await BallInstanceTransformer().autocomplete(interaction, "exa")
+    assert len(choices) == 10
+    async with assert_max_queries("autocomplete", 0):
+        choices = await BallInstanceTransformer().autocomplete(interaction, "exam")
+    assert len(choices) == 5
+    assert all("Example" in x.name for x in choices)
+
+
+async def test_catch(ball: Ball):
+    await GuildConfig.create(guild_id=GUILD)
+    countryball = CountryBall(ball)
+    countryball.message = MagicMock()
+    prompt = CountryballNamePrompt(countryball, MagicMock())
+    prompt.name._value = ball.country
+    interaction = make_interaction()
+    # the slowest case, the player is created on their first catch
+    async with assert_max_queries("catch") as stats:
+        await prompt.on_submit(interaction)
+    assert stats.count > 0
+    assert countryball.catched
+    assert await BallInstance.filter(player__discord_id=USER1).count() == 1
+
+
+async def test_trade_confirm(ball: Ball):
+    player1 = await create_collection(ball, USER1, 10)
+    player2 = await create_collection(ball, USER2, 10)
+    trader1 = TradingUser(MagicMock(id=USER1), player1, await BallInstance.filter(player=player1))
+    trader2 = TradingUser(MagicMock(id=USER2), player2, await BallInstance.filter(player=player2))
+    menu = TradeMenu(MagicMock(), make_interaction(), trader1, trader2)
+    menu.message = AsyncMock()
+    async with assert_max_queries("trade confirm", 0):
+        assert await menu.confirm(trader1)
+    # the second confirmation concludes the trade
+    async with assert_max_queries("trade confirm") as stats:
+        assert await menu.confirm(trader2)
+    assert stats.count > 0
+    assert await BallInstance.filter(player=player1, trade_player=player2).count() == 10
@@ -0,0 +1,28 @@
+import asyncio
+from types import SimpleNamespace
+
+from ballsdex.packages.countryballs.bomb import SpawnBomb, SpawnRateLimiter
+from ballsdex.packages.countryballs.countryball import CountryBall
+
+
+async def test_error_stops_all_workers(monkeypatch):
+    calls = 0
+
+    async def spawn(self, channel) -> bool:
+        nonlocal calls
+        calls += 1
+        number = calls
+        await asyncio.sleep(0.01)
+        if number == 3:
+            raise OSError("wild card missing")
+        return True
+
+    monkeypatch.setattr(CountryBall, "spawn", spawn)
+    bomb = SpawnBomb(SimpleNamespace(id=1), 50, SimpleNamespace(country="Example"))  # type: ignore
+    bomb.limiter = SpawnRateLimiter(5, 0.01)
+
+    await bomb.run()
+    assert bomb.failed
+    sent = calls
+    await asyncio.sleep(0.1)
+    assert calls == sent < 50